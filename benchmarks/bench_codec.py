@@ -0,0 +1,126 @@
+# Size and encode/decode time of the storage codecs on a synthetic employees blob.
+#
+# The blob is make_employees() from bench_hot_paths (500 employees with a year of
+# shift dates, about 1 MB as JSON) plus a task base. Every available codec.py
+# combination is compared with the old stdlib json.dumps / json.loads baseline.
+# With --redis-url the values are also written to Redis and MEMORY USAGE is reported.
+#
+#   python benchmarks/bench_codec.py
+#   python benchmarks/bench_codec.py --employees 2000 --output codec.json
+#   python benchmarks/bench_codec.py --redis-url redis://localhost:6379/15
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import redis
+
+import codec
+from bench_hot_paths import git_commit, make_employees, make_task_base
+
+ITERATIONS = 30
+VARIANTS = (
+    ("json", ""), ("json", "zlib"), ("json", "zstd"),
+    ("msgpack", ""), ("msgpack", "zlib"), ("msgpack", "zstd"),
+)
+
+@contextmanager
+def stdlib_json():
+    # JSON без orjson — чтобы увидеть, что даёт сам orjson
+    saved = codec.orjson
+    codec.orjson = None
+    try:
+        yield
+    finally:
+        codec.orjson = saved
+
+def _median_us(func: Callable[[], Any], iterations: int) -> float:
+    func()
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1e6)
+    durations.sort()
+    return durations[len(durations) // 2]
+
+def measure(label: str, encode: Callable[[Any], bytes], decode: Callable[[bytes], Any],
+            value: Any, iterations: int, client=None) -> Dict[str, Any]:
+    data = encode(value)
+    assert decode(data) == value, f"{label} does not round-trip"
+    result = {
+        "codec": label,
+        "bytes": len(data),
+        "encode_us": round(_median_us(lambda: encode(value), iterations), 1),
+        "decode_us": round(_median_us(lambda: decode(data), iterations), 1),
+    }
+    if client is not None:
+        client.set("bench:codec", data)
+        result["redis_memory_bytes"] = client.memory_usage("bench:codec")
+        client.delete("bench:codec")
+    return result
+
+def variants() -> List[tuple]:
+    # (название, encode, decode, контекст)
+    found = [("stdlib json (before)", lambda value: json.dumps(value).encode(), json.loads, None)]
+    for fmt, compression in VARIANTS:
+        try:
+            current = codec.Codec(fmt, compression, compress_min_bytes=0)
+        except ValueError as e:
+            print(f"skip {fmt}+{compression or 'raw'}: {e}")
+            continue
+        if fmt == "json":
+            found.append((f"{current.name} (stdlib)", current.encode, current.decode, stdlib_json))
+            if codec.orjson is not None:
+                found.append((f"{current.name} (orjson)", current.encode, current.decode, None))
+        else:
+            found.append((current.name, current.encode, current.decode, None))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare storage codecs on a synthetic employees blob")
+    parser.add_argument("--employees", type=int, default=500)
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--redis-url", help="also report MEMORY USAGE on this Redis")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    task_base = make_task_base(args.tasks, rng)
+    values = {"employees": make_employees(args.employees, task_base, rng), "task_base": task_base}
+    client = redis.Redis.from_url(args.redis_url) if args.redis_url else None
+
+    results = []
+    available = variants()
+    print(f"{'value':<10} {'codec':<26} {'bytes':>10} {'encode us':>11} {'decode us':>11}"
+          + (f" {'redis mem':>10}" if client else ""))
+    for value_name, value in values.items():
+        for label, encode, decode, context in available:
+            if context:
+                with context():
+                    result = measure(label, encode, decode, value, args.iterations, client)
+            else:
+                result = measure(label, encode, decode, value, args.iterations, client)
+            result["value"] = value_name
+            results.append(result)
+            print(f"{value_name:<10} {label:<26} {result['bytes']:>10} {result['encode_us']:>11.1f} "
+                  f"{result['decode_us']:>11.1f}" + (f" {result['redis_memory_bytes']:>10}" if client else ""))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"commit": git_commit(), "employees": args.employees, "tasks": args.tasks,
+                       "iterations": args.iterations, "results": results}, f, indent=2)
+        print(f"\nSaved {len(results)} results to {args.output}")
+
+if __name__ == "__main__":
+    main()
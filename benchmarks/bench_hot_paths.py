@@ -0,0 +1,312 @@
+# Latency and Redis round trips of the bot's hot paths on synthetic data.
+#
+# Generates task_base (10 to 10k tasks) and employees (10 to 5k, a year of shift
+# dates each), then times every operation in OPERATIONS and reports p50/p90/p99
+# latency, Redis round trips and peak Python allocation per call, plus the memory
+# the decoded data takes in the cache. Runs on fakeredis by default, or on a
+# local redis-server with --redis-url (all keys live under the "bench:" tenant
+# prefix and are deleted afterwards).
+#
+#   python benchmarks/bench_hot_paths.py --output bench.json
+#   python benchmarks/bench_hot_paths.py --compare bench.json     # after a change
+#   python benchmarks/bench_hot_paths.py --redis-url redis://localhost:6379/15
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import redis
+
+import redis_bot
+import reminder_bot
+from config import Config
+from redis_conn import r
+from tenants import Tenant, use_tenant
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+SCALES = ((10, 10), (1_000, 500), (10_000, 5_000))  # (tasks, employees)
+ITERATIONS = 200
+ALLOC_SAMPLES = 20  # вызовы под tracemalloc (отдельно от замеров времени)
+BENCH_TENANT = Tenant("bench", "CBENCH", key_prefix="bench:")
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday")
+
+# Synthetic data
+
+def make_task_base(count: int, rng: random.Random) -> Dict[str, Any]:
+    task_base = {}
+    names = set()
+    while len(names) < count:
+        word = "".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(3, 8)))
+        names.add(f"{word}-{rng.randint(1, 99)}" if rng.random() < 0.3 else word)
+
+    for task_id, name in enumerate(sorted(names), start=1):
+        task = {"name": name, "period": rng.choice(("morning", "evening", ""))}
+        if rng.random() < 0.8:
+            task["deadline"] = f"{rng.randint(9, 18):02d}:{rng.choice((0, 15, 30, 45)):02d}"
+        if rng.random() < 0.3:
+            task["days"] = rng.sample(DAYS, rng.randint(1, 4))
+        if rng.random() < 0.5:
+            task["asana_url"] = f"https://app.asana.com/0/{task_id}"
+        task_base[str(task_id)] = task
+    return task_base
+
+def make_employees(count: int, task_base: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    start = datetime.date.today() - datetime.timedelta(days=182)
+    year = [(start + datetime.timedelta(days=offset)).strftime("%d/%m") for offset in range(365)]
+
+    employees: Dict[str, Any] = {}
+    for emp_id in range(1, count + 1):
+        shifts = rng.sample(year, 220)
+        employees[f"emp{emp_id}"] = {
+            "name": f"Employee {emp_id}",
+            "slack_id": f"U{emp_id:08d}",
+            "username": f"user{emp_id}",
+            "morning_dates": sorted(shifts[:110]),
+            "evening_dates": sorted(shifts[110:]),
+        }
+
+    names = [task["name"] for task in task_base.values()]
+    employees["task_assignments"] = {
+        name.upper(): f"U{rng.randint(1, count):08d}" for name in rng.sample(names, min(len(names), 20))
+    }
+    return employees
+
+# Redis round trips: one per command sent outside a pipeline, one per pipeline execute
+
+class RoundTripCounter:
+
+    def __init__(self, client):
+        self.count = 0
+        execute_command = client.execute_command
+        make_pipeline = client.pipeline
+
+        def counted_command(*args, **kwargs):
+            self.count += 1
+            return execute_command(*args, **kwargs)
+
+        def counted_pipeline(*args, **kwargs):
+            pipe = make_pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            def counted_execute(*a, **k):
+                self.count += 1
+                return execute(*a, **k)
+
+            pipe.execute = counted_execute
+            return pipe
+
+        client.execute_command = counted_command
+        client.pipeline = counted_pipeline
+
+# Operations
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def measure(name: str, call: Callable[[int], Any], iterations: int, counter: RoundTripCounter,
+            reset: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    call(0)  # прогрев кэша
+    durations = []
+    round_trips = 0
+    for i in range(iterations):
+        if reset:
+            reset(i)
+        before = counter.count
+        start = time.perf_counter()
+        call(i)
+        durations.append((time.perf_counter() - start) * 1e6)
+        round_trips += counter.count - before
+
+    # Пик выделенной памяти за вызов — отдельным проходом, tracemalloc сильно замедляет вызовы
+    alloc_peaks = []
+    tracemalloc.start()
+    for i in range(min(iterations, ALLOC_SAMPLES)):
+        if reset:
+            reset(i)
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        call(i)
+        alloc_peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    durations.sort()
+    return {
+        "op": name,
+        "calls": iterations,
+        "p50_us": round(_percentile(durations, 50), 1),
+        "p90_us": round(_percentile(durations, 90), 1),
+        "p99_us": round(_percentile(durations, 99), 1),
+        "max_us": round(durations[-1], 1),
+        "mean_us": round(sum(durations) / len(durations), 1),
+        "round_trips_per_call": round(round_trips / iterations, 2),
+        "alloc_kb_per_call": round(sum(alloc_peaks) / len(alloc_peaks) / 1024, 1),
+    }
+
+def cache_footprint_kb() -> float:
+    #Сколько памяти занимают разобранные task_base / employees / назначения в кэше процесса
+    #(без плана дня — иначе снимок читает только его)
+    r.delete(redis_bot._plan_key(False))
+    redis_bot.cache.invalidate()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    snapshot = redis_bot.load_render_snapshot()
+    snapshot.shift_index  # индекс смен тоже живёт в кэше
+    retained = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return round(retained / 1024, 1)
+
+def run_scale(tasks: int, employees: int, iterations: int, counter: RoundTripCounter,
+              rng: random.Random) -> List[Dict[str, Any]]:
+    task_base = make_task_base(tasks, rng)
+    staff = make_employees(employees, task_base, rng)
+    redis_bot.save_task_base(task_base)
+    redis_bot.save_employees(staff)
+    redis_bot.set_thread_ts("1700000000.000100")
+    # План дня прошлого масштаба не должен попасть в замеры без плана
+    r.delete(redis_bot._plan_key(False))
+    redis_bot.cache.invalidate()
+
+    names = [task["name"].upper() for task in task_base.values()]
+    messages = [f"<@UBOT> {rng.choice(names).lower()} done, спасибо" for _ in range(iterations)]
+    dates = [(datetime.date.today() + datetime.timedelta(days=rng.randint(-100, 100))).strftime("%d/%m")
+             for _ in range(iterations)]
+    completed_key = redis_bot._completed_key(datetime.date.today().isoformat())
+
+    def cold_cache(i: int) -> None:
+        # Новый процесс (cron_bot, reminder_bot): в памяти ничего нет
+        redis_bot.cache.invalidate()
+
+    def reset_completed(i: int) -> None:
+        # Каждый вызов отмечает ещё не выполненную задачу
+        if i % len(names) == 0:
+            r.delete(completed_key)
+
+    operations: List[Tuple[str, Callable[[int], Any], Optional[Callable[[int], None]]]] = [
+        ("find_task_in_text", lambda i: redis_bot.find_task_in_text(messages[i]), None),
+        ("record_task", lambda i: redis_bot.record_task(names[i % len(names)], "U00000001"), reset_completed),
+        ("generate_message_from_redis", lambda i: redis_bot.generate_message_from_redis(), None),
+        ("get_employees_for_date_and_period",
+         lambda i: redis_bot.get_employees_for_date_and_period(dates[i], ("morning", "evening")[i % 2]), None),
+        ("reminder_bot.get_incomplete_tasks", lambda i: reminder_bot.get_incomplete_tasks(), None),
+        ("reminder_bot (cold cache)", lambda i: reminder_bot.get_incomplete_tasks(), cold_cache),
+        # Дальше — с планом дня, записанным утренним постом
+        ("materialize_daily_plan", lambda i: redis_bot.materialize_daily_plan(), None),
+        ("generate_message_from_redis (plan)", lambda i: redis_bot.generate_message_from_redis(), None),
+        ("reminder_bot (cold cache, plan)", lambda i: reminder_bot.get_incomplete_tasks(), cold_cache),
+    ]
+
+    results = []
+    for name, call, reset in operations:
+        result = measure(name, call, iterations, counter, reset)
+        result.update(tasks=tasks, employees=employees)
+        results.append(result)
+        print(f"{tasks:>6} {employees:>6} {name:<36} {result['p50_us']:>10.1f} {result['p90_us']:>10.1f} "
+              f"{result['p99_us']:>10.1f} {result['round_trips_per_call']:>6} {result['alloc_kb_per_call']:>9.1f}")
+
+    footprint = cache_footprint_kb()
+    results.append({"op": "cache_footprint", "tasks": tasks, "employees": employees, "retained_kb": footprint})
+    print(f"{tasks:>6} {employees:>6} {'cache_footprint':<36} {footprint:>10.1f} KB retained")
+    return results
+
+# Output
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {(item["op"], item["tasks"], item["employees"]): item for item in json.load(f)["results"]}
+
+    print(f"\nvs {baseline_path}: p50 change, round trips before -> after")
+    for item in results:
+        old = baseline.get((item["op"], item["tasks"], item["employees"]))
+        if not old or "p50_us" not in item:
+            if old and "retained_kb" in item:
+                print(f"{item['tasks']:>6} {item['employees']:>6} {item['op']:<36} "
+                      f"{old['retained_kb']} -> {item['retained_kb']} KB")
+            continue
+        change = (item["p50_us"] - old["p50_us"]) / old["p50_us"] * 100 if old["p50_us"] else 0.0
+        print(f"{item['tasks']:>6} {item['employees']:>6} {item['op']:<36} {change:>+8.1f}% "
+              f"{old['round_trips_per_call']:>6} -> {item['round_trips_per_call']}"
+              f"   alloc {old.get('alloc_kb_per_call', '?')} -> {item['alloc_kb_per_call']} KB")
+
+def parse_scales(value: str) -> List[Tuple[int, int]]:
+    #"10:10,1000:500" -> [(10, 10), (1000, 500)]
+    return [tuple(int(part) for part in item.split(":")) for item in value.split(",") if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's hot paths on synthetic data")
+    parser.add_argument("--scales", type=parse_scales, default=list(SCALES),
+                        help="tasks:employees pairs, e.g. 10:10,1000:500")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--redis-url", help="local redis-server instead of fakeredis")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON file from an earlier run to compare against")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    # INFO-логи на каждый вызов (дедлайны, режимы) не нужны в замерах
+    logging.disable(logging.INFO)
+
+    if args.redis_url:
+        client = redis.Redis.from_url(args.redis_url)
+    elif fakeredis is not None:
+        client = fakeredis.FakeRedis()
+    else:
+        sys.exit("fakeredis is not installed: pip install fakeredis, or pass --redis-url")
+    r.set_client(client)
+    counter = RoundTripCounter(client)
+    rng = random.Random(args.seed)
+
+    print(f"{'tasks':>6} {'emps':>6} {'operation':<36} {'p50 us':>10} {'p90 us':>10} {'p99 us':>10} {'RTT':>6} {'alloc KB':>9}")
+    results = []
+    with use_tenant(BENCH_TENANT):
+        try:
+            for tasks, employees in args.scales:
+                results.extend(run_scale(tasks, employees, args.iterations, counter, rng))
+        finally:
+            if args.redis_url:
+                keys = list(client.scan_iter(match=BENCH_TENANT.key("*")))
+                if keys:
+                    client.delete(*keys)
+                client.hdel(Config.DATA_VERSIONS, *[BENCH_TENANT.key(name) for name in (
+                    Config.TASK_BASE, Config.EMPLOYEES, Config.TASKS, Config.EMPLOYEE_RECORDS,
+                    Config.TASK_ASSIGNMENTS, Config.SLACK_ROUTINE_STATE)])
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "backend": "redis" if args.redis_url else "fakeredis",
+        "iterations": args.iterations,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {len(results)} results to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# Micro-benchmark: per-message latency of TaskMatcher vs the old regex alternation.
+#
+#   python benchmarks/bench_task_matcher.py
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from task_matcher import TaskMatcher
+
+SIZES = (10, 1_000, 10_000)
+MESSAGES = 200
+
+def make_names(count, rng):
+    names = set()
+    while len(names) < count:
+        word = "".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(3, 8)))
+        names.add(f"{word}-{rng.randint(1, 99)}" if rng.random() < 0.3 else word)
+    return sorted(names)
+
+def make_messages(names, rng):
+    return [f"<@U0123ABCD> {rng.choice(names).lower()} done, спасибо" for _ in range(MESSAGES)]
+
+def per_message_us(find, messages):
+    start = time.perf_counter()
+    for text in messages:
+        find(text)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+def old_regex_find(names):
+    # Поведение до TaskMatcher: паттерн собирался заново на каждое сообщение
+    def find(text):
+        pattern = r"(?i)(" + "|".join(re.escape(name) for name in names) + r").*done"
+        return re.search(pattern, text)
+    return find
+
+def main():
+    rng = random.Random(42)
+    print(f"{'names':>8} {'build ms':>10} {'matcher us/msg':>15} {'regex us/msg':>13}")
+    for size in SIZES:
+        names = make_names(size, rng)
+        messages = make_messages(names, rng)
+
+        start = time.perf_counter()
+        matcher = TaskMatcher(names)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        matcher_us = per_message_us(matcher.find, messages)
+        regex_us = per_message_us(old_regex_find(names), messages[:20])
+        print(f"{size:>8} {build_ms:>10.1f} {matcher_us:>15.1f} {regex_us:>13.1f}")
+
+if __name__ == "__main__":
+    main()
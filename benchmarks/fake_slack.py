@@ -0,0 +1,107 @@
+# Local stand-in for the Slack Web API, for exercising throttling offline.
+#
+# Accepts any POST /api/<method>, records it and answers {"ok": true}. Methods
+# listed in rate_limits get a per-second budget; calls above it are answered with
+# HTTP 429 and a Retry-After header, like Slack does.
+#
+#   python benchmarks/fake_slack.py --port 8765 --limit chat.postMessage=1
+#   SLACK_API_URL=http://127.0.0.1:8765/api/ python outbox.py
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+class FakeSlack:
+
+    def __init__(self, port: int = 0, rate_limits: Optional[Dict[str, float]] = None, retry_after: int = 1):
+        self.rate_limits = rate_limits or {}
+        self.retry_after = retry_after
+        self.calls: List[Tuple[float, str, dict]] = []
+        self.throttled: Dict[str, int] = {}
+        self._windows: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._ts = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/"
+
+    def _allow(self, method: str) -> bool:
+        limit = self.rate_limits.get(method)
+        if not limit:
+            return True
+        now = time.monotonic()
+        window = [t for t in self._windows.get(method, []) if now - t < 1.0]
+        self._windows[method] = window
+        if len(window) >= limit:
+            self.throttled[method] = self.throttled.get(method, 0) + 1
+            return False
+        window.append(now)
+        return True
+
+    def _respond(self, method: str, args: dict) -> Tuple[int, dict]:
+        with self._lock:
+            if not self._allow(method):
+                return 429, {"ok": False, "error": "ratelimited"}
+            self.calls.append((time.time(), method, args))
+            self._ts += 1
+            ts = f"{int(time.time())}.{self._ts:06d}"
+        if method == "auth.test":
+            return 200, {"ok": True, "user_id": "UFAKEBOT", "bot_id": "BFAKE", "team_id": "TFAKE", "user": "bot"}
+        return 200, {"ok": True, "ts": ts, "channel": args.get("channel", "")}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    args = json.loads(body or "{}")
+                else:
+                    args = {k: v[0] for k, v in parse_qs(body).items()}
+
+                status, payload = fake._respond(method, args)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if status == 429:
+                    self.send_header("Retry-After", str(fake.retry_after))
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeSlack":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Slack Web API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--limit", action="append", default=[], help="method=calls_per_second, e.g. chat.postMessage=1")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    limits = {method: float(rate) for method, rate in (item.split("=") for item in args.limit)}
+    fake = FakeSlack(args.port, limits, args.retry_after)
+    print(f"Fake Slack listening on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
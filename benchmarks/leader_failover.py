@@ -0,0 +1,225 @@
+# Failover test for leader.py: several scheduler nodes, one Redis, the leader killed repeatedly.
+#
+# Starts --nodes worker processes against one Redis (--redis-url, e.g. a local
+# redis-server; without it a fakeredis TCP server in this process). Every worker
+# runs a LeaderElector on the same lease and, while it is the leader, runs a job
+# fired every --fire-every seconds through leader.run_once - including the fires
+# of the last lease it may have missed, the way scheduler_bot catches up after a
+# failover. A run appends "<fire>|<node>" to a Redis list.
+#
+# Every --kill-every seconds the current lease holder is killed (SIGKILL, or
+# --mode stop: SIGSTOP, resumed after two leases - a paused leader that wakes up
+# late must not run anything) and replaced by a fresh worker. Reports how long the
+# standbys took to take over and checks that every fire ran exactly once.
+# Exits with status 1 if a fire ran twice or not at all, or a takeover took longer
+# than a lease plus a renew interval (plus --slack).
+#
+#   python benchmarks/leader_failover.py
+#   python benchmarks/leader_failover.py --nodes 5 --duration 60 --mode stop
+#   python benchmarks/leader_failover.py --redis-url redis://localhost:6379/15
+import argparse
+import datetime
+import functools
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import pytz
+import redis
+
+import leader
+from config import Config
+from redis_conn import r
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+LEASE_KEY = "failover:leader"
+RUNS_KEY = "failover:runs"
+JOB = "failover"
+
+def _fires(now_ms: int, every_ms: int, window_ms: int) -> List[int]:
+    #Запуски по расписанию (каждые every_ms) за последние window_ms, не позже now
+    last = now_ms // every_ms * every_ms
+    return list(range(last - window_ms // every_ms * every_ms, last + 1, every_ms))
+
+def worker(args) -> None:
+    r.set_client(redis.Redis.from_url(args.redis_url))
+    tz = pytz.timezone(Config.TIMEZONE)
+    elector = leader.LeaderElector(leader.LeaderLease(LEASE_KEY, args.lease_ms), args.renew)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    elector.start()
+    print(leader.NODE, flush=True)
+
+    every_ms = int(args.fire_every * 1000)
+    window_ms = args.lease_ms + 2 * every_ms
+    settled: Dict[int, bool] = {}
+    while not stop.wait(args.fire_every / 10):
+        if not elector.is_leader:
+            continue
+        for fire_ms in _fires(int(time.time() * 1000), every_ms, window_ms):
+            if fire_ms in settled:
+                continue
+            fire = datetime.datetime.fromtimestamp(fire_ms / 1000, tz)
+            leader.run_once(JOB, fire, functools.partial(r.rpush, RUNS_KEY, f"{fire_ms}|{leader.NODE}"))
+            settled[fire_ms] = True
+        for fire_ms in [fire_ms for fire_ms in settled if fire_ms < time.time() * 1000 - 2 * window_ms]:
+            del settled[fire_ms]
+    elector.stop()
+
+class Node:
+
+    def __init__(self, args, url: str):
+        command = [sys.executable, os.path.abspath(__file__), "--worker", "--redis-url", url,
+                   "--lease-ms", str(args.lease_ms), "--renew", str(args.renew),
+                   "--fire-every", str(args.fire_every)]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        self.node = self.process.stdout.readline().strip()
+
+def _holder(client) -> Optional[str]:
+    value = client.get(LEASE_KEY)
+    return value.decode() if value else None
+
+def _cleanup(client) -> None:
+    keys = [LEASE_KEY, RUNS_KEY] + list(client.scan_iter(f"{Config.JOB_RUNS}:{JOB}:*"))
+    client.delete(*keys)
+
+def main():
+    parser = argparse.ArgumentParser(description="Kill the scheduler leader repeatedly and check every run happens once")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--kill-every", type=float, default=6, help="seconds between leader kills")
+    parser.add_argument("--mode", choices=("kill", "stop"), default="kill",
+                        help="SIGKILL the leader, or SIGSTOP it and resume it later")
+    parser.add_argument("--lease-ms", type=int, default=2000)
+    parser.add_argument("--renew", type=float, default=0.5, help="lease renew interval, seconds")
+    parser.add_argument("--fire-every", type=float, default=0.5, help="seconds between scheduled runs")
+    parser.add_argument("--slack", type=float, default=1.0, help="allowed takeover time over lease + renew, seconds")
+    parser.add_argument("--redis-url", help="local redis-server instead of fakeredis (keys failover:* and job_run:failover:*)")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args)
+
+    url = args.redis_url
+    if not url:
+        if fakeredis is None:
+            sys.exit("fakeredis is not installed: pip install fakeredis, or pass --redis-url")
+        server = fakeredis.TcpFakeServer(("127.0.0.1", 0))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"redis://127.0.0.1:{server.server_address[1]}/0"
+    client = redis.Redis.from_url(url)
+    _cleanup(client)
+
+    nodes = [Node(args, url) for _ in range(args.nodes)]
+    paused: List[tuple] = []
+    retired: List[Node] = []  # приостановленные и продолженные бывшие лидеры, живут до конца
+    takeovers: List[float] = []
+    started = time.time()
+    # После последнего убийства — время на переход лидерства и догон пропущенных запусков
+    kills_until = started + args.duration - args.lease_ms / 1000 - 3 * args.renew - 2 * args.fire_every
+    next_kill = started + args.kill_every
+    while time.time() < started + args.duration:
+        time.sleep(0.02)
+        for node, resume_at in list(paused):
+            if time.time() >= resume_at:
+                node.process.send_signal(signal.SIGCONT)
+                paused.remove((node, resume_at))
+                retired.append(node)
+        if time.time() < next_kill or time.time() > kills_until:
+            continue
+        next_kill += args.kill_every
+        holder = _holder(client)
+        victim = next((node for node in nodes if node.node == holder), None)
+        if victim is None:
+            continue
+        killed = time.monotonic()
+        if args.mode == "kill":
+            victim.process.kill()
+            victim.process.wait()
+        else:
+            victim.process.send_signal(signal.SIGSTOP)
+            paused.append((victim, time.time() + 2 * args.lease_ms / 1000))
+        nodes.remove(victim)
+        nodes.append(Node(args, url))
+        while _holder(client) in (holder, None):
+            time.sleep(0.01)
+        takeovers.append(time.monotonic() - killed)
+        print(f"{'killed' if args.mode == 'kill' else 'paused'} {holder}, "
+              f"{_holder(client)} took over in {takeovers[-1]:.2f}s")
+
+    stopped = time.time()
+    for node, _ in paused:
+        node.process.send_signal(signal.SIGCONT)
+        retired.append(node)
+    nodes += retired
+    for node in nodes:
+        node.process.terminate()
+    for node in nodes:
+        node.process.wait()
+
+    runs: Dict[int, List[str]] = {}
+    for entry in client.lrange(RUNS_KEY, 0, -1):
+        fire_ms, _, node = entry.decode().partition("|")
+        runs.setdefault(int(fire_ms), []).append(node)
+    _cleanup(client)
+
+    every_ms = int(args.fire_every * 1000)
+    first = min(runs) if runs else 0
+    # Последние запуски могли не успеть до остановки узлов
+    last = int((stopped - 2 * args.fire_every) * 1000) // every_ms * every_ms
+    expected = range(first, last + 1, every_ms)
+    duplicates = {fire: nodes for fire, nodes in runs.items() if len(nodes) > 1}
+    missing = [fire for fire in expected if fire not in runs]
+    limit = args.lease_ms / 1000 + args.renew + args.slack
+
+    results = {
+        "backend": "redis" if args.redis_url else "fakeredis",
+        "mode": args.mode,
+        "nodes": args.nodes,
+        "lease_ms": args.lease_ms,
+        "renew_seconds": args.renew,
+        "failovers": len(takeovers),
+        "takeover_seconds": {
+            "min": round(min(takeovers), 3) if takeovers else None,
+            "median": round(statistics.median(takeovers), 3) if takeovers else None,
+            "max": round(max(takeovers), 3) if takeovers else None,
+        },
+        "fires": len(expected),
+        "runs": sum(len(nodes) for nodes in runs.values()),
+        "duplicates": len(duplicates),
+        "missing": len(missing),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = []
+    if duplicates:
+        failed.append(f"{len(duplicates)} fires ran more than once, e.g. {next(iter(duplicates.items()))}")
+    if missing:
+        failed.append(f"{len(missing)} fires never ran, e.g. {missing[:3]}")
+    if not takeovers:
+        failed.append("no failover happened")
+    elif max(takeovers) > limit:
+        failed.append(f"slowest takeover {max(takeovers):.2f}s > {limit:.2f}s")
+    print("OK" if not failed else "FAILED: " + "; ".join(failed))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
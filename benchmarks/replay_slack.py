@@ -0,0 +1,431 @@
+# Replay harness / load generator for the interactive bot (main_bot.py).
+#
+# Feeds app_mention events and /set-fin-duty commands straight into the Bolt
+# app's dispatch, the way SocketModeHandler does, at --rate requests per second
+# from --concurrency threads. Redis is fakeredis (or --redis-url, keys under the
+# "replay:" tenant prefix, deleted afterwards) and Slack is a stub WebClient that
+# answers {"ok": true} and records every outbound call, so nothing leaves the host.
+#
+# Payloads are synthetic (completions of random tasks, --batch of them naming several
+# tasks at once, --duplicates of them for a task somebody already marked, --redeliver of
+# them sent again with the same event_id the way Slack retries an unacknowledged event,
+# plus --commands /set-fin-duty calls) or recorded:
+# --input takes a JSONL file of Socket Mode payloads (event_callback bodies and
+# slash command bodies, one per line) and replays them against synthetic data.
+#
+# Reports throughput and latency percentiles (measured from the scheduled send
+# time, so queueing under load counts) and checks the outcome:
+#   - every recognised task is in today's completed hash and in completion_log once
+#   - at most one "late" message per task, duplicates answered "already marked"
+#     (a mention naming several tasks gets one reply listing the late / already marked ones)
+#   - every request answered, no error replies
+#   - every redelivered event dropped by event_dedupe, none handled twice
+#   - the live morning message ends up edited to the final state, in few chat_update calls
+# Exits with status 1 if a check fails.
+#
+#   python benchmarks/replay_slack.py --events 2000 --concurrency 16
+#   python benchmarks/replay_slack.py --rate 50 --slack-latency-ms 80 --output replay.json
+#   python benchmarks/replay_slack.py --input recorded.jsonl --concurrency 4
+import argparse
+import collections
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# main_bot проверяет переменные окружения при импорте; очередь исходящих выключена —
+# иначе ответы уходят в Redis Stream и харнесс их не увидит
+os.environ.update(SLACK_BOT_TOKEN="xoxb-replay", SLACK_APP_TOKEN="xapp-replay",
+                  SLACK_CHANNEL_ID="CREPLAY", SLACK_OUTBOX_ENABLED="", TENANTS_FILE="")
+os.environ.setdefault("LIVE_MESSAGE_DEBOUNCE_SECONDS", "0.2")
+
+import redis
+from slack_bolt.request import BoltRequest
+from slack_sdk import WebClient
+from slack_sdk.web import SlackResponse
+
+import bot_logic
+import event_dedupe
+import redis_bot
+from bench_hot_paths import _percentile, git_commit, make_employees, make_task_base
+from completion_log import iter_completion_events
+from config import Config
+from redis_conn import r
+from tenants import Tenant, set_tenants, use_tenant
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+REPLAY_TENANT = Tenant("replay", "CREPLAY", key_prefix="replay:")
+BOT_USER_ID = "UREPLAYBOT"
+THREAD_TS = "1700000000.000100"
+LATE_RE = re.compile(r"<@[^>]+> (.+) было сделано поздно!$", re.M)
+ALREADY_MANY_RE = re.compile(r"<@[^>]+> (.+): эти задачи уже были отмечены ранее\.$", re.M)
+
+# Stub Slack: every WebClient (Bolt creates one per request) goes through api_call
+
+class RecordingSlack:
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+        self._lock = threading.Lock()
+        self._ts = itertools.count(1)
+        self._original = None
+
+    def install(self) -> "RecordingSlack":
+        self._original = WebClient.api_call
+        stub = self
+
+        def api_call(client, api_method, *, http_verb="POST", files=None, data=None, params=None,
+                     json=None, headers=None, auth=None):
+            args = {**(params or {}), **(data or {}), **(json or {})}
+            return stub.respond(client, api_method, http_verb, args)
+
+        WebClient.api_call = api_call
+        return self
+
+    def uninstall(self) -> None:
+        if self._original is not None:
+            WebClient.api_call = self._original
+
+    def respond(self, client, method: str, http_verb: str, args: Dict[str, Any]) -> SlackResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        data: Dict[str, Any] = {"ok": True}
+        if method == "auth.test":
+            data.update(user_id=BOT_USER_ID, bot_id="BREPLAY", team_id="TREPLAY", team="replay")
+        else:
+            with self._lock:
+                self.calls.append((method, args))
+                data["ts"] = f"1800000000.{next(self._ts):06d}"
+            data["channel"] = args.get("channel")
+        return SlackResponse(client=client, http_verb=http_verb, api_url=f"https://slack.invalid/api/{method}",
+                             req_args={}, data=data, headers={}, status_code=200)
+
+    def messages(self) -> List[str]:
+        return [args.get("text", "") for method, args in self.calls if method == "chat.postMessage"]
+
+    def count(self, method: str) -> int:
+        return sum(1 for called, _ in self.calls if called == method)
+
+    def last(self, method: str) -> Optional[Dict[str, Any]]:
+        return next((args for called, args in reversed(self.calls) if called == method), None)
+
+# Payloads
+
+def mention_payload(seq: int, user: str, text: str, thread_ts: Optional[str] = THREAD_TS) -> Dict[str, Any]:
+    ts = f"1750000000.{seq:06d}"
+    event = {"type": "app_mention", "user": user, "text": text, "ts": ts, "event_ts": ts,
+             "channel": REPLAY_TENANT.channel_id}
+    if thread_ts:
+        event["thread_ts"] = thread_ts
+    return {"token": "replay", "team_id": "TREPLAY", "api_app_id": "AREPLAY", "type": "event_callback",
+            "event_id": f"EvREPLAY{seq:08d}", "event_time": 1750000000 + seq, "event": event}
+
+def command_payload(seq: int, user: str, user_name: str, text: str) -> Dict[str, Any]:
+    return {"token": "replay", "team_id": "TREPLAY", "api_app_id": "AREPLAY",
+            "channel_id": REPLAY_TENANT.channel_id, "user_id": user, "user_name": user_name,
+            "command": "/set-fin-duty", "text": text, "trigger_id": f"replay.{seq}",
+            "response_url": "https://hooks.slack.invalid/commands/replay"}
+
+def synthetic_payloads(task_base: Dict[str, Any], employees: Dict[str, Any], events: int,
+                       duplicates: float, commands: int, rng: random.Random,
+                       redeliver: float = 0.0, batch: float = 0.0) -> List[Dict[str, Any]]:
+    names = [task["name"] for task in task_base.values()]
+    staff = [emp for emp_id, emp in employees.items() if emp_id != "task_assignments"]
+    fresh = rng.sample(names, len(names))
+    payloads: List[Dict[str, Any]] = []
+    marked: List[str] = []
+
+    def pick() -> str:
+        # Повтор уже отмеченной задачи — двое отметили одно и то же (или один дважды)
+        if marked and (not fresh or rng.random() < duplicates):
+            return rng.choice(marked)
+        marked.append(fresh.pop())
+        return marked[-1]
+
+    for seq in range(events):
+        # Несколько задач одним упоминанием: "LPB, KYC-1 и Statements done"
+        picked = list(dict.fromkeys(pick() for _ in range(rng.randint(2, 4) if rng.random() < batch else 1)))
+        picked = [rng.choice((name, name.lower())) for name in picked]
+        named = picked[0] if len(picked) == 1 else f"{', '.join(picked[:-1])} и {picked[-1]}"
+        text = f"<@{BOT_USER_ID}> {named} {rng.choice(('done', 'done!', 'DONE', 'done, спасибо'))}"
+        payloads.append(mention_payload(seq, rng.choice(staff)["slack_id"], text))
+    # Повторная доставка того же события (тот же event_id) — её бот должен отбросить
+    mentions = list(payloads)
+    payloads.extend(json.loads(json.dumps(rng.choice(mentions))) for _ in range(int(len(mentions) * redeliver)))
+    for seq in range(commands):
+        caller = rng.choice(staff)
+        target = "" if rng.random() < 0.1 else f"@{rng.choice(staff)['username']}"
+        payloads.append(command_payload(seq, caller["slack_id"], caller["username"], target))
+    rng.shuffle(payloads)
+    return payloads
+
+def load_payloads(path: str) -> List[Dict[str, Any]]:
+    #JSONL с записанными payload'ами Socket Mode; конверт {"payload": ...} тоже принимается
+    payloads = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                payloads.append(item.get("payload", item) if "envelope_id" in item else item)
+    return payloads
+
+def is_command(payload: Dict[str, Any]) -> bool:
+    return payload.get("command") == "/set-fin-duty"
+
+def is_mention(payload: Dict[str, Any]) -> bool:
+    return payload.get("event", {}).get("type") == "app_mention"
+
+# Replay
+
+def replay(app, payloads: List[Dict[str, Any]], rate: float, concurrency: int) -> Tuple[List[Dict[str, Any]], float]:
+    #Отправить payload'ы в app.dispatch по расписанию (rate в секунду, 0 — сразу все)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(payloads)
+
+    def run(index: int, scheduled: float) -> None:
+        started = time.perf_counter()
+        try:
+            response = app.dispatch(BoltRequest(body=payloads[index], mode="socket_mode"))
+            status = response.status if response is not None else 0
+        except Exception as e:
+            logging.getLogger(__name__).error(f"dispatch failed: {e}")
+            status = -1
+        finished = time.perf_counter()
+        results[index] = {"latency": finished - scheduled, "service": finished - started, "status": status}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        for index in range(len(payloads)):
+            scheduled = start + index / rate if rate else start
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, index, scheduled)
+    elapsed = time.perf_counter() - start
+    return [result for result in results if result is not None], elapsed
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    values = sorted(value * 1000 for value in values)
+    if not values:
+        return {}
+    return {f"p{pct}_ms": round(_percentile(values, pct), 2) for pct in (50, 90, 99, 99.9)} | {
+        "max_ms": round(values[-1], 2), "mean_ms": round(sum(values) / len(values), 2)}
+
+def check(payloads: List[Dict[str, Any]], expected_tasks: List[List[str]], fin_task: str,
+          targets: Dict[str, str], results: List[Dict[str, Any]], slack: RecordingSlack) -> Dict[str, Any]:
+    #Сверить итог: потерянные и повторные отметки, лишние "поздно", ответы на все запросы
+    # Повторные доставки не считаются: их отбрасывает event_dedupe до обработчика
+    delivered = {}
+    for payload, task in zip(payloads, expected_tasks):
+        if is_mention(payload):
+            delivered.setdefault(payload.get("event_id") or id(payload), task)
+    mentions = list(delivered.values())
+    redelivered = sum(1 for payload in payloads if is_mention(payload)) - len(mentions)
+    dropped = sum(event_dedupe.DUPLICATES.value(source=source) for source in ("memory", "redis"))
+    recognised = [task for tasks in mentions for task in tasks]
+    unique = set(recognised)
+    batched = any(len(tasks) > 1 for tasks in mentions)
+
+    completed = set(redis_bot.get_completed_tasks())
+    today = datetime.date.today().isoformat()
+    logged = collections.Counter(event["task"] for event in iter_completion_events(bot_logic.now_local().date()))
+
+    messages = slack.messages()
+    late = collections.Counter(task for text in messages for match in LATE_RE.finditer(text)
+                               for task in match.group(1).split(", "))
+    already_marked = sum(1 for text in messages if text.endswith(redis_bot.ALREADY_MARKED_MESSAGE))
+    already_marked += sum(len(match.group(1).split(", ")) for text in messages
+                          for match in ALREADY_MANY_RE.finditer(text))
+    errors = sum(1 for text in messages if "Произошла ошибка" in text or "❌ Ошибка" in text)
+    reactions = slack.count("reactions.add")
+
+    commands = [payload for payload in payloads if is_command(payload)]
+    fin_replies = sum(1 for text in messages if fin_task and f"*{fin_task}*" in text and text.startswith("✅"))
+    assignment = redis_bot.get_task_assignment(fin_task) if fin_task else ""
+    live_update = slack.last("chat.update")
+
+    checks = {
+        "lost_completions": sorted(unique - completed),
+        "lost_log_entries": sorted(task for task in unique if not logged.get(task)),
+        "duplicate_log_entries": sorted(task for task, count in logged.items() if count > 1),
+        "duplicate_late_messages": sorted(task for task, count in late.items() if count > 1),
+        # На каждую первую отметку — либо реакция, либо "поздно"; на повтор — "уже отмечена".
+        # Упоминание нескольких задач получает одну реакцию на все, что сделаны в срок
+        "completion_replies_mismatch": (reactions > len(unique) - sum(late.values()) if batched
+                                        else len(unique) != reactions + sum(late.values())),
+        "already_marked_mismatch": already_marked != len(recognised) - len(unique),
+        "error_replies": errors,
+        "failed_dispatches": sum(1 for result in results if result["status"] != 200),
+        "unanswered_commands": len(commands) - fin_replies if fin_task else 0,
+        "redeliveries_not_dropped": redelivered - dropped,
+        "unexpected_assignment": bool(commands) and assignment not in set(targets.values()) | {""},
+        # Последняя правка утреннего сообщения должна совпадать с тем, что видно в Redis сейчас
+        "stale_live_message": Config.LIVE_MESSAGE_ENABLED and bool(unique) and (
+            live_update is None or live_update.get("text") != redis_bot.generate_message_from_redis(live=True)),
+    }
+    return {
+        "date": today,
+        "mentions": len(mentions),
+        "redelivered": redelivered,
+        "dropped_redeliveries": dropped,
+        "recognised": len(recognised),
+        "batched_mentions": sum(1 for tasks in mentions if len(tasks) > 1),
+        "unique_tasks": len(unique),
+        "completed": len(completed),
+        "late_messages": sum(late.values()),
+        "reactions": reactions,
+        "already_marked": already_marked,
+        "commands": len(commands),
+        "live_updates": slack.count("chat.update"),
+        "checks": checks,
+        "ok": not any(checks.values()),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay Slack events into the bot and check the outcome")
+    parser.add_argument("--input", help="JSONL file of recorded payloads instead of synthetic ones")
+    parser.add_argument("--events", type=int, default=1000, help="synthetic app_mention events")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="share of mentions of an already marked task")
+    parser.add_argument("--batch", type=float, default=0.1, help="share of mentions naming 2-4 tasks at once")
+    parser.add_argument("--redeliver", type=float, default=0.1,
+                        help="share of mentions delivered again with the same event_id")
+    parser.add_argument("--commands", type=int, default=50, help="synthetic /set-fin-duty commands")
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--employees", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=0, help="requests per second (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=8, help="dispatch threads")
+    parser.add_argument("--slack-latency-ms", type=float, default=0, help="delay of every stub Slack call")
+    parser.add_argument("--redis-url", help="local redis-server instead of fakeredis")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    if args.redis_url:
+        client = redis.Redis.from_url(args.redis_url)
+    elif fakeredis is not None:
+        client = fakeredis.FakeRedis()
+    else:
+        sys.exit("fakeredis is not installed: pip install fakeredis, or pass --redis-url")
+    r.set_client(client)
+    set_tenants([REPLAY_TENANT])
+    slack = RecordingSlack(args.slack_latency_ms / 1000).install()
+    rng = random.Random(args.seed)
+
+    import main_bot
+    app = main_bot.app
+    # Обработчик выполняется внутри dispatch (как на FaaS), чтобы мерить полное время ответа;
+    # параллельность даёт пул харнесса, а не пул Bolt
+    app._process_before_response = True
+    app._listener_runner.process_before_response = True
+
+    with use_tenant(REPLAY_TENANT):
+        try:
+            task_base = make_task_base(args.tasks, rng)
+            # Часть задач уже просрочена в любое время дня — так проверяется и ветка "поздно"
+            for task in rng.sample(list(task_base.values()), len(task_base) // 3):
+                task["deadline"] = "00:00"
+            task_base[str(len(task_base) + 1)] = {"name": "FIN-DUTY", "period": "morning", "deadline": "12:00"}
+            employees = make_employees(args.employees, task_base, rng)
+            redis_bot.save_task_base(task_base)
+            redis_bot.save_employees(employees)
+            redis_bot.set_thread_ts(THREAD_TS)
+            # План дня, как его записывает утренний пост
+            redis_bot.materialize_daily_plan()
+
+            if args.input:
+                payloads = load_payloads(args.input)
+            else:
+                payloads = synthetic_payloads(task_base, employees, args.events, args.duplicates,
+                                              args.commands, rng, args.redeliver, args.batch)
+            # Какие задачи бот должен найти в каждом упоминании — до прогона, на тех же данных
+            expected = [redis_bot.find_tasks_in_text(payload["event"].get("text", "")) if is_mention(payload)
+                        else [] for payload in payloads]
+            fin_task = redis_bot.find_task_by_pattern("fin")
+            targets = {payload["text"]: redis_bot.find_employee_by_username(payload["text"].lstrip("@"))
+                       for payload in payloads if is_command(payload) and payload["text"]}
+
+            print(f"Replaying {len(payloads)} payloads ({'recorded' if args.input else 'synthetic'}), "
+                  f"rate {args.rate or 'max'}/s, concurrency {args.concurrency}")
+            results, elapsed = replay(app, payloads, args.rate, args.concurrency)
+            # Дождаться отложенных правок живого сообщения
+            time.sleep(Config.LIVE_MESSAGE_DEBOUNCE_SECONDS + 0.5)
+            outcome = check(payloads, expected, fin_task, targets, results, slack)
+        finally:
+            slack.uninstall()
+            if args.redis_url:
+                keys = list(client.scan_iter(match=REPLAY_TENANT.key("*")))
+                if keys:
+                    client.delete(*keys)
+                # Ключи дедупликации общие для всех тенантов — удалить только свои
+                dedupe = list(client.scan_iter(match=f"{Config.EVENT_DEDUPE}:EvREPLAY*"))
+                if dedupe:
+                    client.delete(*dedupe)
+                client.hdel(Config.DATA_VERSIONS, *[REPLAY_TENANT.key(name) for name in (
+                    Config.TASK_BASE, Config.EMPLOYEES, Config.TASKS, Config.EMPLOYEE_RECORDS,
+                    Config.TASK_ASSIGNMENTS, Config.SLACK_ROUTINE_STATE)])
+
+    by_kind = collections.defaultdict(list)
+    for payload, result in zip(payloads, results):
+        by_kind["command" if is_command(payload) else "mention"].append(result)
+    throughput = len(results) / elapsed if elapsed else 0.0
+    latency = {kind: latency_summary([item["latency"] for item in items]) for kind, items in by_kind.items()}
+    service = {kind: latency_summary([item["service"] for item in items]) for kind, items in by_kind.items()}
+
+    print(f"{len(results)} requests in {elapsed:.2f} s: {throughput:.1f} req/s, "
+          f"{len(slack.calls)} Slack calls recorded")
+    print(f"{'kind':<8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'p99.9 ms':>9} {'max ms':>9}")
+    for kind, summary in latency.items():
+        print(f"{kind:<8} {summary['p50_ms']:>9} {summary['p90_ms']:>9} {summary['p99_ms']:>9} "
+              f"{summary['p99.9_ms']:>9} {summary['max_ms']:>9}")
+    print(f"{outcome['unique_tasks']} tasks completed by {outcome['recognised']} task mentions "
+          f"({outcome['batched_mentions']} messages naming several): "
+          f"{outcome['reactions']} reactions, {outcome['late_messages']} late, "
+          f"{outcome['already_marked']} already marked, {outcome['live_updates']} live message edits, "
+          f"{outcome['dropped_redeliveries']}/{outcome['redelivered']} redeliveries dropped")
+    for name, value in outcome["checks"].items():
+        if value:
+            print(f"FAIL {name}: {value}")
+    print("OK" if outcome["ok"] else "FAILED")
+
+    if args.output:
+        report = {
+            "commit": git_commit(),
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "backend": "redis" if args.redis_url else "fakeredis",
+            "input": args.input or "synthetic",
+            "rate": args.rate,
+            "concurrency": args.concurrency,
+            "slack_latency_ms": args.slack_latency_ms,
+            "requests": len(results),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(throughput, 1),
+            "latency": latency,
+            "service_time": service,
+            "outcome": outcome,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
+    sys.exit(0 if outcome["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import datetime
+import logging
+from typing import List, Optional, Tuple
+
+import pytz
+
+from config import Config
+
+# Business rules of the interactive bot, shared by main_bot (sync) and
+# main_bot_async. No Slack or Redis calls here: handlers do the I/O and ask
+# these functions what to do next.
+
+logger = logging.getLogger(__name__)
+
+REACTION_DONE = "white_check_mark"
+ALREADY_MARKED_MESSAGE = "Эта задача уже была отмечена ранее."
+FIN_DUTY_PATTERN = "fin"
+
+def debug_prefix(debug_mode: bool) -> str:
+    return "🔧 DEBUG: " if debug_mode else ""
+
+def parse_debug_command(text: str) -> Tuple[bool, Optional[str]]:
+    #Это debug-команда? Если да — вернуть и день, за который строить сообщение
+    debug_text = text.lower()
+    if "debug" not in debug_text:
+        return False, None
+    return True, "Monday" if "monday" in debug_text else None
+
+def resolve_thread(thread_ts: Optional[str], production_thread_ts: Optional[str],
+                   debug_thread_ts: Optional[str]) -> Tuple[bool, Optional[str]]:
+    #Определить режим по треду упоминания; вернуть (debug_mode, тред для ответа)
+    if thread_ts == debug_thread_ts:
+        logger.info("🔧 DEBUG MODE: используем debug_routine_state")
+        return True, thread_ts
+    if thread_ts == production_thread_ts:
+        logger.info("📋 PRODUCTION MODE: используем slack_routine_state")
+        return False, thread_ts
+
+    # Если не в известном треде, используем production по умолчанию
+    # и отвечаем в production-тред
+    logger.info("📋 DEFAULT MODE: используем slack_routine_state")
+    return False, production_thread_ts or thread_ts
+
+def now_local() -> datetime.datetime:
+    return datetime.datetime.now(pytz.timezone(Config.TIMEZONE))
+
+def is_late(deadline: Optional[datetime.time], now: datetime.datetime) -> bool:
+    #Задача отмечена после дедлайна? (задачи без дедлайна опоздать не могут)
+    if not deadline:
+        return False
+    deadline_dt = pytz.timezone(Config.TIMEZONE).localize(datetime.datetime.combine(now.date(), deadline))
+    logger.info(f"⏱️ Сейчас: {now.strftime('%H:%M:%S')} | Дедлайн: {deadline_dt.strftime('%H:%M:%S')}")
+    return now > deadline_dt
+
+def late_text(user: str, task: str, debug_mode: bool) -> str:
+    return f"{debug_prefix(debug_mode)}<@{user}> {task} было сделано поздно!"
+
+def already_marked_text(user: str, tasks: List[str]) -> str:
+    if len(tasks) == 1:
+        return f"<@{user}> {ALREADY_MARKED_MESSAGE}"
+    return f"<@{user}> {', '.join(tasks)}: эти задачи уже были отмечены ранее."
+
+def completion_reply(user: str, late: List[str], already: List[str], debug_mode: bool) -> Optional[str]:
+    #Один ответ на отметку нескольких задач: опоздавшие и уже отмеченные раньше (None — хватит реакции)
+    lines = []
+    if late:
+        lines.append(late_text(user, ", ".join(late), debug_mode))
+    if already:
+        lines.append(already_marked_text(user, already))
+    return "\n".join(lines) or None
+
+def unknown_task_text(user: str, debug_mode: bool) -> str:
+    return f"{debug_prefix(debug_mode)}<@{user}> я не понял, о какой задаче речь 🤔. Напиши, например: `@bot LPB done`"
+
+def fin_duty_target(text: str) -> str:
+    #Username из текста /set-fin-duty ("" — снять назначение)
+    return text.strip().lstrip('@').strip()
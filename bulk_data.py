@@ -0,0 +1,368 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Set, Tuple
+
+import redis
+
+import codec
+import redis_bot
+from config import Config
+from models import Assignment, Employee, ModelError, Task, parse_shift_date
+from redis_bot import ASSIGNMENT_RECORDS, EMPLOYEE_RECORDS, SHIFT_PERIODS, TASK_RECORDS
+from tenants import load_tenants, use_tenant
+
+# Bulk import / export of tasks, employees, shift dates and assignments as CSV or JSONL.
+#
+# Every row is validated (the same models the bot loads) before anything is written;
+# the new collection is written in pipelined batches to temporary keys and swapped in
+# with RENAME in one transaction, so the running bot sees the old data or the new,
+# never a half-written roster. --dry-run prints the diff against what is stored.
+#
+#   python bulk_data.py export tasks tasks.csv
+#   python bulk_data.py import shifts shifts-2025.csv --dry-run
+#   python bulk_data.py import employees staff.jsonl --tenant fin
+#   python bulk_data.py export shifts - --format csv | head
+#
+# CSV columns (lists such as days and dates are space-separated in one cell):
+#   tasks        id,name,deadline,period,days,asana_url,comments
+#   employees    id,name,slack_id,username,morning_dates,evening_dates
+#                (JSONL rows may add "rotations": [{"period", "start", "on", "off", "until"}])
+#   shifts       employee_id,date,period           (replaces every employee's dates)
+#   assignments  task,slack_id
+# JSONL rows are objects with the same fields (lists as JSON lists); task and employee
+# rows keep any other fields too. Empty days mean every day. Dates are "dd/mm" (every
+# year) or "YYYY-MM-DD". An employees file without date columns keeps the stored dates
+# (and without "rotations" the stored rotations), so the roster and the shifts load separately.
+
+logger = Config.setup_logging()
+
+DATASETS = ("tasks", "employees", "shifts", "assignments")
+FORMATS = ("csv", "jsonl")
+COLUMNS = {
+    "tasks": ("id", "name", "deadline", "period", "days", "asana_url", "comments"),
+    "employees": ("id", "name", "slack_id", "username", "morning_dates", "evening_dates"),
+    "shifts": ("employee_id", "date", "period"),
+    "assignments": ("task", "slack_id"),
+}
+LIST_COLUMNS = ("days", "morning_dates", "evening_dates")
+DATE_COLUMNS = ("morning_dates", "evening_dates")
+
+Errors = List[Tuple[int, str]]
+
+# Streams
+
+def detect_format(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension in FORMATS:
+        return extension
+    sys.exit(f"Cannot tell the format of {path!r}: pass --format csv or --format jsonl")
+
+@contextmanager
+def open_stream(path: str, mode: str) -> Iterator[IO[str]]:
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+        return
+    with open(path, mode, newline="", encoding="utf-8") as stream:
+        yield stream
+
+def read_rows(stream: IO[str], fmt: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    #(номер строки, строка); строка, которую не удалось разобрать, приходит как ModelError
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            if None in row:
+                yield reader.line_num, ModelError(f"{len(row[None])} value(s) beyond the header")
+                continue
+            # Пустые ячейки — как отсутствующие поля, кроме списков: пустой список — тоже значение
+            # (даты сотрудника очищаются, если столбец есть, и сохраняются, если столбца нет)
+            yield reader.line_num, {column: (value or "").split() if column in LIST_COLUMNS else value.strip()
+                                    for column, value in row.items()
+                                    if column in LIST_COLUMNS or (value and value.strip())}
+        return
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, ModelError(f"bad JSON: {e}")
+            continue
+        yield line_no, row if isinstance(row, dict) else ModelError(f"expected an object, got {row!r}")
+
+class RowWriter:
+
+    def __init__(self, stream: IO[str], fmt: str, columns: Tuple[str, ...]):
+        self.fmt = fmt
+        self.columns = columns
+        self.count = 0
+        if fmt == "csv":
+            self._csv = csv.writer(stream)
+            self._csv.writerow(columns)
+        self._stream = stream
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self.count += 1
+        if self.fmt == "jsonl":
+            self._stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+            return
+        cells = []
+        for column in self.columns:
+            value = row.get(column, "")
+            cells.append(" ".join(value) if isinstance(value, (list, tuple)) else value)
+        self._csv.writerow(cells)
+
+# Stored data
+
+def load_current() -> Dict[str, Dict[str, Any]]:
+    #Текущие коллекции тенанта; ошибки Redis поднимаются (пустой экспорт хуже ошибки)
+    return {
+        "tasks": TASK_RECORDS.load()[0] or {},
+        "employees": EMPLOYEE_RECORDS.load()[0] or {},
+        "assignments": ASSIGNMENT_RECORDS.load()[0] or {},
+    }
+
+def employee_row(employee: Employee) -> Dict[str, Any]:
+    #Сотрудник в виде для людей: списки явных дат и ротации вместо битовых карт
+    record = employee.to_record()
+    record.pop("shift_bitmaps", None)
+    for period in SHIFT_PERIODS:
+        record[f"{period}_dates"] = list(employee.dates(period))
+    return record
+
+def export_rows(dataset: str, current: Dict[str, Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    if dataset == "tasks":
+        for task_id in sorted(current["tasks"]):
+            yield {"id": task_id, **current["tasks"][task_id].to_record()}
+    elif dataset == "employees":
+        for emp_id in sorted(current["employees"]):
+            yield {"id": emp_id, **employee_row(current["employees"][emp_id])}
+    elif dataset == "shifts":
+        for emp_id in sorted(current["employees"]):
+            employee = current["employees"][emp_id]
+            for period in SHIFT_PERIODS:
+                for date_str in employee.dates(period):
+                    yield {"employee_id": emp_id, "date": date_str, "period": period}
+    else:
+        for task_key in sorted(current["assignments"]):
+            yield {"task": task_key, "slack_id": current["assignments"][task_key].slack_id}
+
+# Parsing
+
+def _collect(rows: Iterator[Tuple[int, Any]], build: Callable[[Dict[str, Any]], Tuple[str, Any]],
+             what: str) -> Tuple[Dict[str, Any], Errors]:
+    records: Dict[str, Any] = {}
+    errors: Errors = []
+    for line_no, row in rows:
+        try:
+            if isinstance(row, ModelError):
+                raise row
+            record_id, record = build(row)
+            if record_id in records:
+                raise ModelError(f"duplicate {what} {record_id!r}")
+            records[record_id] = record
+        except ModelError as e:
+            errors.append((line_no, str(e)))
+    return records, errors
+
+def _row_id(row: Dict[str, Any], column: str) -> str:
+    value = row.get(column)
+    if not isinstance(value, str) or not value.strip():
+        raise ModelError(f"'{column}' is required")
+    return value.strip()
+
+def parse_tasks(rows, current) -> Tuple[Dict[str, Task], Errors]:
+    def build(row):
+        task_id = _row_id(row, "id")
+        record = {field: value for field, value in row.items() if field != "id"}
+        if record.get("days") in ([], ["all"]):
+            record.pop("days")  # каждый день
+        return task_id, Task.from_record(task_id, record)
+    return _collect(rows, build, "task id")
+
+def parse_employees(rows, current) -> Tuple[Dict[str, Employee], Errors]:
+    stored = current["employees"]
+
+    def build(row):
+        emp_id = _row_id(row, "id")
+        record = {field: value for field, value in row.items() if field != "id"}
+        if emp_id in stored:
+            # Без столбца дат (или ротаций) — оставить то, что уже есть
+            kept = employee_row(stored[emp_id])
+            for field in DATE_COLUMNS + ("rotations",):
+                if field not in row and field in kept:
+                    record[field] = kept[field]
+        return emp_id, Employee.from_record(emp_id, record)
+    return _collect(rows, build, "employee id")
+
+def parse_shifts(rows, current) -> Tuple[Dict[str, Employee], Errors]:
+    #Полное расписание смен: у каждого сотрудника даты заменяются датами из файла
+    stored = current["employees"]
+    shifts: Dict[str, Dict[str, Set[str]]] = {emp_id: {period: set() for period in SHIFT_PERIODS} for emp_id in stored}
+    errors: Errors = []
+    for line_no, row in rows:
+        try:
+            if isinstance(row, ModelError):
+                raise row
+            emp_id = _row_id(row, "employee_id")
+            if emp_id not in stored:
+                raise ModelError(f"unknown employee {emp_id!r}")
+            period = row.get("period")
+            if period not in SHIFT_PERIODS:
+                raise ModelError(f"period must be one of {SHIFT_PERIODS}, got {period!r}")
+            shifts[emp_id][period].add(parse_shift_date(row.get("date")))
+        except ModelError as e:
+            errors.append((line_no, str(e)))
+
+    employees = {}
+    for emp_id, employee in stored.items():
+        # Ротации остаются: файл смен задаёт только отдельные даты
+        dates = shifts[emp_id]
+        employees[emp_id] = Employee(emp_id, employee.name, employee.slack_id, employee.username,
+                                     morning_dates=dates["morning"], evening_dates=dates["evening"],
+                                     extra=employee.extra, rotations=employee.calendar.rotations)
+    return employees, errors
+
+def parse_assignments(rows, current) -> Tuple[Dict[str, Assignment], Errors]:
+    task_keys = {task.key for task in current["tasks"].values()}
+
+    def build(row):
+        task_key = _row_id(row, "task").upper()
+        if task_key not in task_keys:
+            raise ModelError(f"unknown task {task_key!r}")
+        return task_key, Assignment.from_record(task_key, row.get("slack_id"))
+    return _collect(rows, build, "task")
+
+PARSERS = {"tasks": parse_tasks, "employees": parse_employees, "shifts": parse_shifts,
+           "assignments": parse_assignments}
+
+# Diff
+
+def _shift_set(employees: Dict[str, Employee]) -> Set[Tuple[str, str, str]]:
+    return {(emp_id, date_str, period) for emp_id, employee in employees.items()
+            for period in SHIFT_PERIODS for date_str in employee.dates(period)}
+
+def _record(value: Any) -> Dict[str, Any]:
+    if isinstance(value, Employee):
+        return employee_row(value)
+    record = value.to_record()
+    return record if isinstance(record, dict) else {"slack_id": record}
+
+def diff(dataset: str, old: Dict[str, Any], new: Dict[str, Any]) -> Tuple[Dict[str, int], List[str]]:
+    #({added/removed/changed: число}, строки диффа)
+    if dataset == "shifts":
+        old_shifts, new_shifts = _shift_set(old), _shift_set(new)
+        added, removed = sorted(new_shifts - old_shifts), sorted(old_shifts - new_shifts)
+        lines = [f"+ {emp_id} {date_str} {period}" for emp_id, date_str, period in added]
+        lines += [f"- {emp_id} {date_str} {period}" for emp_id, date_str, period in removed]
+        return {"added": len(added), "removed": len(removed), "changed": 0}, lines
+
+    added = sorted(new.keys() - old.keys())
+    removed = sorted(old.keys() - new.keys())
+    lines = [f"+ {record_id} {json.dumps(_record(new[record_id]), ensure_ascii=False)}" for record_id in added]
+    lines += [f"- {record_id}" for record_id in removed]
+    changed = 0
+    for record_id in sorted(old.keys() & new.keys()):
+        before, after = _record(old[record_id]), _record(new[record_id])
+        if before == after:
+            continue
+        changed += 1
+        for field in sorted(before.keys() | after.keys()):
+            if before.get(field) != after.get(field):
+                lines.append(f"~ {record_id} {field}: {_short(before.get(field))} -> {_short(after.get(field))}")
+    return {"added": len(added), "removed": len(removed), "changed": changed}, lines
+
+def _short(value: Any) -> str:
+    if isinstance(value, list) and len(value) > 6:
+        return f"[{len(value)} items]"
+    return json.dumps(value, ensure_ascii=False)
+
+# Commands
+
+def run_export(dataset: str, path: str, fmt: str) -> None:
+    current = load_current()
+    with open_stream(path, "w") as stream:
+        writer = RowWriter(stream, fmt, COLUMNS[dataset])
+        for row in export_rows(dataset, current):
+            writer.write(row)
+    print(f"Exported {writer.count} {dataset} row(s)", file=sys.stderr)
+
+def run_import(dataset: str, path: str, fmt: str, dry_run: bool, skip_invalid: bool,
+               batch_size: int, limit: int) -> int:
+    started = time.perf_counter()
+    current = load_current()
+    with open_stream(path, "r") as stream:
+        records, errors = PARSERS[dataset](read_rows(stream, fmt), current)
+
+    for line_no, message in errors[:limit]:
+        print(f"{path}:{line_no}: {message}")
+    if len(errors) > limit:
+        print(f"... {len(errors) - limit} more invalid row(s)")
+    if errors and not skip_invalid:
+        print(f"{len(errors)} invalid row(s), nothing imported (--skip-invalid imports the rest)")
+        return 1
+
+    stored = current["employees" if dataset == "shifts" else dataset]
+    counts, lines = diff(dataset, stored, records)
+    for line in lines[:limit]:
+        print(line)
+    if len(lines) > limit:
+        print(f"... {len(lines) - limit} more change(s)")
+    print(f"{dataset}: {len(records)} record(s) read, {counts['added']} added, "
+          f"{counts['removed']} removed, {counts['changed']} changed")
+
+    if dry_run:
+        print("Dry run, nothing written")
+        return 0
+    if not any(counts.values()):
+        print("No changes, nothing written")
+        return 0
+    if dataset == "tasks":
+        redis_bot.bulk_replace_tasks(records, batch_size)
+    elif dataset == "assignments":
+        redis_bot.bulk_replace_assignments(records, batch_size)
+    else:
+        redis_bot.bulk_replace_employees(records, batch_size)
+    print(f"Imported {len(records)} {'employees' if dataset == 'shifts' else dataset} "
+          f"in {time.perf_counter() - started:.2f} s")
+    return 0
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Import or export tasks, employees, shifts and assignments")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("dataset", choices=DATASETS)
+    parser.add_argument("path", help="CSV or JSONL file, '-' for stdin/stdout")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--tenant", help="tenant id (required with several tenants)")
+    parser.add_argument("--dry-run", action="store_true", help="validate and print the diff, write nothing")
+    parser.add_argument("--skip-invalid", action="store_true", help="import the valid rows, report the rest")
+    parser.add_argument("--batch-size", type=int, default=Config.BULK_BATCH_SIZE, help="records per pipelined write")
+    parser.add_argument("--limit", type=int, default=50, help="diff / error lines to print")
+    args = parser.parse_args(argv)
+    fmt = detect_format(args.path, args.format)
+
+    tenants = [tenant for tenant in load_tenants() if not args.tenant or tenant.id == args.tenant]
+    if not tenants:
+        sys.exit(f"No tenant {args.tenant!r}")
+    if len(tenants) > 1:
+        sys.exit(f"Several tenants configured, pick one with --tenant: {', '.join(t.id for t in tenants)}")
+
+    with use_tenant(tenants[0]):
+        try:
+            if args.command == "export":
+                run_export(args.dataset, args.path, fmt)
+                return 0
+            return run_import(args.dataset, args.path, fmt, args.dry_run, args.skip_invalid,
+                              args.batch_size, args.limit)
+        except (redis.RedisError, codec.CodecError) as e:
+            logger.error(f"{args.command} {args.dataset} failed: {e}")
+            return 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
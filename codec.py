@@ -0,0 +1,137 @@
+import json
+import logging
+import zlib
+from typing import Any, Callable, Dict, Tuple, Union
+
+from config import Config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Serialization of everything redis_bot stores: state, task / employee records,
+# completions. Encoded values carry a 3-byte tag (MAGIC, format, compression), so
+# a value written with any format decodes regardless of the current settings;
+# untagged values are plain JSON (older data, or STORAGE_FORMAT=json without compression).
+# orjson, msgpack and zstandard are optional: without them JSON falls back to the
+# stdlib and msgpack / zstd are unavailable.
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"\x00"  # JSON text never starts with a NUL byte
+
+class CodecError(ValueError):
+    #Значение не удалось разобрать (неизвестный тег, битые данные, нет нужной библиотеки)
+    pass
+
+def _json_dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+def _json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _msgpack_dumps(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+def _msgpack_loads(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False)
+
+def _zstd_compress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+def _zstd_decompress(data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+# tag byte -> (name, encode, decode, available)
+FORMATS: Dict[bytes, Tuple[str, Callable[[Any], bytes], Callable[[bytes], Any], bool]] = {
+    b"j": ("json", _json_dumps, _json_loads, True),
+    b"m": ("msgpack", _msgpack_dumps, _msgpack_loads, msgpack is not None),
+}
+COMPRESSIONS: Dict[bytes, Tuple[str, Callable[[bytes], bytes], Callable[[bytes], bytes], bool]] = {
+    b"n": ("", lambda data: data, lambda data: data, True),
+    b"z": ("zlib", lambda data: zlib.compress(data, 6), zlib.decompress, True),
+    b"s": ("zstd", _zstd_compress, _zstd_decompress, zstandard is not None),
+}
+
+def _tag_of(table: Dict[bytes, tuple], name: str, what: str) -> bytes:
+    for tag, (entry_name, _, _, available) in table.items():
+        if entry_name == name:
+            if not available:
+                raise ValueError(f"{what} {name!r} needs a package that is not installed")
+            return tag
+    raise ValueError(f"Unknown {what} {name!r}")
+
+class Codec:
+
+    def __init__(self, fmt: str = "json", compression: str = "", compress_min_bytes: int = 4096):
+        self.format_tag = _tag_of(FORMATS, fmt, "storage format")
+        self.compression_tag = _tag_of(COMPRESSIONS, compression, "compression")
+        self.compress_min_bytes = compress_min_bytes
+        self.name = fmt + (f"+{compression}" if compression else "")
+
+    def encode(self, value: Any) -> bytes:
+        payload = FORMATS[self.format_tag][1](value)
+        compression = self.compression_tag
+        if compression != b"n" and len(payload) >= self.compress_min_bytes:
+            payload = COMPRESSIONS[compression][1](payload)
+        else:
+            compression = b"n"
+        if self.format_tag == b"j" and compression == b"n":
+            # Обычный JSON пишем без тега — его читают и старые версии бота
+            return payload
+        return MAGIC + self.format_tag + compression + payload
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        if isinstance(data, str):
+            data = data.encode()
+        try:
+            if not data.startswith(MAGIC):
+                return _json_loads(data)
+            fmt = FORMATS.get(data[1:2])
+            compression = COMPRESSIONS.get(data[2:3])
+            if fmt is None or compression is None:
+                raise CodecError(f"Unknown value tag {data[:3]!r}")
+            if not fmt[3] or not compression[3]:
+                raise CodecError(f"Value written as {fmt[0]}+{compression[0] or 'raw'}, "
+                                 "but the package for it is not installed")
+            return fmt[2](compression[2](data[3:]))
+        except CodecError:
+            raise
+        except Exception as e:
+            # json / orjson / msgpack / zlib / zstd — у каждого свои исключения
+            raise CodecError(f"Cannot decode stored value: {e}") from e
+
+def from_config() -> Codec:
+    try:
+        return Codec(Config.STORAGE_FORMAT, Config.STORAGE_COMPRESSION, Config.STORAGE_COMPRESS_MIN_BYTES)
+    except ValueError as e:
+        logger.error(f"{e}; storing values as plain JSON")
+        return Codec()
+
+_codec = from_config()
+
+def set_codec(codec: Codec) -> None:
+    #Сменить кодек записи (бенчмарки, тесты); чтение понимает все форматы независимо от него
+    global _codec
+    _codec = codec
+
+def encode(value: Any) -> bytes:
+    return _codec.encode(value)
+
+def decode(data: Union[bytes, str]) -> Any:
+    return _codec.decode(data)
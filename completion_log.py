@@ -0,0 +1,106 @@
+import datetime
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pytz
+import redis
+
+from config import Config
+from redis_conn import ar, r
+from tenants import tenant_key
+
+# Append-only history of task completions in a Redis Stream.
+# record_tasks appends one entry per completion (XADD with approximate trimming,
+# so writes stay O(1)); iter_completion_events pages through a date range with
+# XRANGE without loading the whole range into memory.
+
+logger = logging.getLogger(__name__)
+
+def trim_args() -> Dict[str, Any]:
+    #Обрезка потока: по времени (если задан срок хранения) или по длине
+    if Config.COMPLETION_LOG_RETENTION_DAYS:
+        cutoff = datetime.datetime.now(pytz.utc) - datetime.timedelta(days=Config.COMPLETION_LOG_RETENTION_DAYS)
+        return {"minid": int(cutoff.timestamp() * 1000), "approximate": True}
+    return {"maxlen": Config.COMPLETION_LOG_MAXLEN, "approximate": True}
+
+def completion_entry(task: str, user: str, late: bool, debug_mode: bool = False,
+                     when: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+    when = when or datetime.datetime.now(pytz.timezone(Config.TIMEZONE))
+    return {
+        "task": task,
+        "user": user or "",
+        "ts": when.isoformat(),
+        "late": int(late),
+        "debug": int(debug_mode),
+    }
+
+def _queue_completions(pipe, tasks: List[str], user: str, late: Dict[str, bool], debug_mode: bool,
+                       when: Optional[datetime.datetime]) -> None:
+    for task in tasks:
+        pipe.xadd(tenant_key(Config.COMPLETION_LOG), completion_entry(task, user, late.get(task, False), debug_mode, when),
+                  **trim_args())
+
+def _entry_ids(entry_ids: List[Any]) -> List[Optional[str]]:
+    return [entry_id.decode() if isinstance(entry_id, bytes) else entry_id for entry_id in entry_ids]
+
+def append_completions(tasks: Iterable[str], user: str, late: Dict[str, bool], debug_mode: bool = False,
+                       when: Optional[datetime.datetime] = None) -> List[Optional[str]]:
+    #Несколько событий одной пачкой (одна отметка — несколько задач), один запрос к Redis;
+    #ошибки логируются и не мешают отметке задач
+    tasks = list(tasks)
+    if not tasks:
+        return []
+    try:
+        pipe = r.pipeline(transaction=False)
+        _queue_completions(pipe, tasks, user, late, debug_mode, when)
+        entry_ids = pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error appending completions of {tasks}: {e}")
+        return [None] * len(tasks)
+    return _entry_ids(entry_ids)
+
+async def append_completions_async(tasks: Iterable[str], user: str, late: Dict[str, bool], debug_mode: bool = False,
+                                   when: Optional[datetime.datetime] = None) -> List[Optional[str]]:
+    #То же, что append_completions, через redis.asyncio
+    tasks = list(tasks)
+    if not tasks:
+        return []
+    try:
+        pipe = ar.pipeline(transaction=False)
+        _queue_completions(pipe, tasks, user, late, debug_mode, when)
+        entry_ids = await pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error appending completions of {tasks}: {e}")
+        return [None] * len(tasks)
+    return _entry_ids(entry_ids)
+
+def _day_bounds_ms(start_date: datetime.date, end_date: datetime.date):
+    tz = pytz.timezone(Config.TIMEZONE)
+    start = tz.localize(datetime.datetime.combine(start_date, datetime.time.min))
+    end = tz.localize(datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min))
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000) - 1
+
+def _decode_event(entry_id, fields: Dict[bytes, bytes]) -> Dict[str, Any]:
+    event = {key.decode(): value.decode() for key, value in fields.items()}
+    event["id"] = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+    event["late"] = event.get("late") == "1"
+    event["debug"] = event.get("debug") == "1"
+    return event
+
+def iter_completion_events(start_date: datetime.date, end_date: Optional[datetime.date] = None,
+                           page_size: int = 500, include_debug: bool = False) -> Iterator[Dict[str, Any]]:
+    #Выдавать события за даты [start_date, end_date] (по Config.TIMEZONE) страницами по page_size
+    start_ms, end_ms = _day_bounds_ms(start_date, end_date or start_date)
+    start = f"{start_ms}-0"
+    end = f"{end_ms}-18446744073709551615"
+
+    while True:
+        page = r.xrange(tenant_key(Config.COMPLETION_LOG), min=start, max=end, count=page_size)
+        for entry_id, fields in page:
+            event = _decode_event(entry_id, fields)
+            if include_debug or not event["debug"]:
+                yield event
+        if len(page) < page_size:
+            return
+        last_id = page[-1][0]
+        start = "(" + (last_id.decode() if isinstance(last_id, bytes) else last_id)
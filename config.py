@@ -8,22 +8,130 @@ class Config:
     SLACK_BOT_TOKEN: str = os.environ.get("SLACK_BOT_TOKEN", "")
     SLACK_APP_TOKEN: str = os.environ.get("SLACK_APP_TOKEN", "")
     SLACK_CHANNEL_ID: str = os.environ.get("SLACK_CHANNEL_ID", "")
+    SLACK_API_URL: str = os.environ.get("SLACK_API_URL", "https://slack.com/api/")  # point at a fake for tests
+
+    # Slack outbox (outbox.py): queue Slack writes in a Redis Stream instead of calling inline
+    SLACK_OUTBOX_ENABLED: bool = os.environ.get("SLACK_OUTBOX_ENABLED", "") == "1"
+    SLACK_OUTBOX: str = "slack_outbox"
+    SLACK_OUTBOX_GROUP: str = "outbox_workers"
+    SLACK_OUTBOX_MAXLEN: int = 10000
+    SLACK_OUTBOX_MAX_ATTEMPTS: int = 5
+    SLACK_OUTBOX_DEDUPE_TTL: int = 24 * 3600
+    SLACK_OUTBOX_CLAIM_IDLE_MS: int = 60000
+    # Calls per second per method (Slack tiers: chat.postMessage ~1/s per channel, Tier 3 = 50/min)
+    SLACK_RATE_LIMITS: dict = {
+        "chat_postMessage": 1.0,
+        "chat_update": 50 / 60,
+        "reactions_add": 50 / 60,
+        "default": 20 / 60,  # Tier 2
+    }
+
+    # Slack event dedupe (event_dedupe.py): redelivered events (same event_id) are dropped
+    EVENT_DEDUPE: str = "event_dedupe"  # event_dedupe:<event id>, one key per delivered event
+    EVENT_DEDUPE_TTL_SECONDS: int = int(os.environ.get("EVENT_DEDUPE_TTL_SECONDS", "3600"))
+    EVENT_DEDUPE_LRU_SIZE: int = int(os.environ.get("EVENT_DEDUPE_LRU_SIZE", "10000"))
 
     # Redis Configuration
     REDIS_URL: str = os.environ.get("REDIS_URL", "redis://localhost:6379")
+    REDIS_POOL_SIZE: int = int(os.environ.get("REDIS_POOL_SIZE", "10"))
+    REDIS_SOCKET_TIMEOUT: float = float(os.environ.get("REDIS_SOCKET_TIMEOUT", "5"))
+    REDIS_CONNECT_TIMEOUT: float = float(os.environ.get("REDIS_CONNECT_TIMEOUT", "5"))
+    REDIS_HEALTH_CHECK_INTERVAL: int = int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+    REDIS_RETRY_ATTEMPTS: int = int(os.environ.get("REDIS_RETRY_ATTEMPTS", "3"))
+    REDIS_RETRY_BACKOFF_BASE: float = 0.05
+    REDIS_RETRY_BACKOFF_CAP: float = 1.0
+    REDIS_CIRCUIT_FAILURE_THRESHOLD: int = int(os.environ.get("REDIS_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    REDIS_CIRCUIT_RESET_SECONDS: float = float(os.environ.get("REDIS_CIRCUIT_RESET_SECONDS", "30"))
 
     # Redis Keys
     SLACK_ROUTINE_STATE: str = "slack_routine_state"
     DEBUG_ROUTINE_STATE: str = "debug_routine_state"
     TASK_BASE: str = "task_base"
     EMPLOYEES: str = "employees"
+    DATA_VERSIONS: str = "data_versions"
+    # Record layout: one hash field per task / employee / assignment (JSON values)
+    TASKS: str = "tasks"                        # task id -> task
+    EMPLOYEE_RECORDS: str = "employee_records"  # employee id -> employee
+    TASK_ASSIGNMENTS: str = "task_assignments"  # TASK NAME -> slack id
+    # Keep the old TASK_BASE / EMPLOYEES blobs in sync as well (rollback safety while migrating)
+    WRITE_LEGACY_BLOBS: bool = os.environ.get("WRITE_LEGACY_BLOBS", "1") == "1"
+    # Shifts are stored as per-year bitmaps (shift_calendar.py); while this is on, employee records also
+    # carry this year's "dd/mm" date lists so processes on older versions still see the shifts
+    WRITE_SHIFT_DATE_LISTS: bool = os.environ.get("WRITE_SHIFT_DATE_LISTS", "1") == "1"
+    # Redis set index of this year's shifts, rebuilt from the bitmaps with every employee write
+    SHIFT_INDEX: str = "shift_index"            # shift_index:<dd/mm>:<period> -> set of employee ids
+    SHIFT_INDEX_KEYS: str = "shift_index:keys"  # all shift_index:* keys currently written
+    SHIFT_INDEX_YEAR: str = "shift_index:year"  # year the sets were built for (rebuilt by the morning post)
+    # Bulk import (bulk_data.py): records per pipelined HSET; unfinished imports expire after the TTL
+    BULK_BATCH_SIZE: int = int(os.environ.get("BULK_BATCH_SIZE", "1000"))
+    BULK_IMPORT_TTL_SECONDS: int = 3600
+
+    # Stored values (codec.py): "json" (orjson when installed) or "msgpack"; values of at least
+    # STORAGE_COMPRESS_MIN_BYTES are compressed with STORAGE_COMPRESSION ("", "zlib" or "zstd").
+    # Plain JSON without compression is written untagged, i.e. readable by older versions of the bot
+    STORAGE_FORMAT: str = os.environ.get("STORAGE_FORMAT", "json")
+    STORAGE_COMPRESSION: str = os.environ.get("STORAGE_COMPRESSION", "")
+    STORAGE_COMPRESS_MIN_BYTES: int = int(os.environ.get("STORAGE_COMPRESS_MIN_BYTES", "4096"))
+
+    # Live morning message (live_message.py): completed tasks are checked off in the posted message
+    # with chat_update, at most one edit per LIVE_MESSAGE_DEBOUNCE_SECONDS however many completions come in
+    LIVE_MESSAGE_ENABLED: bool = os.environ.get("LIVE_MESSAGE_ENABLED", "1") == "1"
+    LIVE_MESSAGE_DEBOUNCE_SECONDS: float = float(os.environ.get("LIVE_MESSAGE_DEBOUNCE_SECONDS", "5"))
+
+    # Completion history stream (completion_log.py): trimmed by age if RETENTION_DAYS is set, else by length
+    COMPLETION_LOG: str = "completion_log"
+    COMPLETION_LOG_MAXLEN: int = int(os.environ.get("COMPLETION_LOG_MAXLEN", "100000"))
+    COMPLETION_LOG_RETENTION_DAYS: int = int(os.environ.get("COMPLETION_LOG_RETENTION_DAYS", "0"))
+
+    # Per-day completion hashes ("<state key>:completed:<date>") expire after this
+    COMPLETED_TTL_SECONDS: int = 3 * 24 * 3600
+
+    # In-process cache: max age of a cached value even if its version is unchanged
+    # (covers writes made by tools that don't bump DATA_VERSIONS)
+    CACHE_TTL_SECONDS: float = float(os.environ.get("CACHE_TTL_SECONDS", "60"))
 
     # Timezone
     TIMEZONE: str = "Europe/Riga"
 
-    # Team Mention (hardcoded for now)
+    # Schedule (scheduler_bot.py): comma-separated "HH:MM" in TIMEZONE, on WORK_DAYS only
+    WORK_DAYS: tuple = (0, 1, 2, 3, 4)  # Monday–Friday
+    MORNING_POST_TIMES: str = os.environ.get("MORNING_POST_TIMES", "09:00")
+    REMINDER_TIMES: str = os.environ.get("REMINDER_TIMES", "13:00,17:00")
+    # Runs missed by at most this much (daemon down, host asleep) are executed on startup
+    SCHEDULER_CATCHUP_SECONDS: int = int(os.environ.get("SCHEDULER_CATCHUP_SECONDS", "3600"))
+    SCHEDULER_LAST_RUN: str = "scheduler_last_run"  # hash: job name -> epoch of last run
+    # Reminders list upcoming tasks due within this many minutes (0 = all); overdue ones are always listed.
+    # Per reminder time: "13:00=180" applies to runs from 13:00 to 13:59 only, other runs list everything;
+    # a plain number ("180") applies to every run
+    REMINDER_LOOKAHEAD_MINUTES: str = os.environ.get("REMINDER_LOOKAHEAD_MINUTES", "13:00=180")
+
+    # Team Mention (default for tenants that don't set their own)
     TEAM_MENTION: str = "<!subteam^S07BD1P55GT|@sup>"
 
+    # Tenants (tenants.py): JSON file with one entry per channel/team; unset = single tenant from env
+    TENANTS_FILE: str = os.environ.get("TENANTS_FILE", "")
+    # Scheduled work is split across processes: this process handles tenants with crc32(id) % COUNT == INDEX
+    SCHEDULER_SHARD_INDEX: int = int(os.environ.get("SCHEDULER_SHARD_INDEX", "0"))
+    SCHEDULER_SHARD_COUNT: int = int(os.environ.get("SCHEDULER_SHARD_COUNT", "1"))
+    # Several hosts (leader.py): the scheduler of each shard runs on the node holding the lease
+    # "<SCHEDULER_LEADER>:<shard>" (SET NX PX, renewed every LEADER_RENEW_SECONDS); a standby takes
+    # over at most LEADER_LEASE_MS after the leader stops renewing. 0 = every process runs its jobs
+    LEADER_ELECTION: bool = os.environ.get("LEADER_ELECTION", "1") == "1"
+    SCHEDULER_LEADER: str = "scheduler_leader"
+    LEADER_LEASE_MS: int = int(os.environ.get("LEADER_LEASE_MS", "10000"))
+    LEADER_RENEW_SECONDS: float = float(os.environ.get("LEADER_RENEW_SECONDS", "3"))
+    # Every scheduled run is claimed once: "<JOB_RUNS>:<job>:<fire time>" SET NX by the node running it,
+    # held JOB_RUN_TIMEOUT_SECONDS while running (then a crashed run can be caught up), kept JOB_RUN_TTL_SECONDS after
+    JOB_RUNS: str = "job_run"
+    JOB_RUN_TIMEOUT_SECONDS: int = int(os.environ.get("JOB_RUN_TIMEOUT_SECONDS", "600"))
+    JOB_RUN_TTL_SECONDS: int = 2 * 24 * 3600
+    # cron on several hosts fires seconds apart: a one-shot run this close to a scheduled time counts as that run
+    CRON_CLOCK_SKEW_SECONDS: int = int(os.environ.get("CRON_CLOCK_SKEW_SECONDS", "300"))
+
+    # Metrics (metrics.py): Prometheus endpoint on this port; 0 = metrics off
+    METRICS_PORT: int = int(os.environ.get("METRICS_PORT", "0"))
+    METRICS_HOST: str = os.environ.get("METRICS_HOST", "0.0.0.0")
+
     # Logging
     LOG_LEVEL: str = os.environ.get("LOG_LEVEL", "INFO")
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -34,8 +142,10 @@ class Config:
         required_vars = [
             ("SLACK_BOT_TOKEN", cls.SLACK_BOT_TOKEN),
             ("SLACK_APP_TOKEN", cls.SLACK_APP_TOKEN),
-            ("SLACK_CHANNEL_ID", cls.SLACK_CHANNEL_ID),
         ]
+        # С файлом тенантов каналы берутся из него
+        if not cls.TENANTS_FILE:
+            required_vars.append(("SLACK_CHANNEL_ID", cls.SLACK_CHANNEL_ID))
 
         missing_vars = [var_name for var_name, var_value in required_vars if not var_value]
 
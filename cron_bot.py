@@ -1,14 +1,20 @@
 import os
 import datetime
-from slack_sdk import WebClient
+import functools
+import sys
+from config import Config
+import leader
+from live_message import remember_post
+from outbox import create_slack_client
 from redis_bot import generate_message_from_redis, set_thread_ts
+from tenants import current_tenant, parse_times, tenants_for_shard, use_tenant
 
-client = WebClient(token=os.environ.get("SLACK_BOT_TOKEN"))
-CHANNEL_ID = os.environ.get("SLACK_CHANNEL_ID")
+client = create_slack_client(os.environ.get("SLACK_BOT_TOKEN"))
 
 def generate_message():
     #Генерировать сообщение для Slack на основе данных из Redis
-    message = generate_message_from_redis()
+    # План дня собирается здесь и записывается — до завтра его читают бот и напоминания
+    message = generate_message_from_redis(materialize=True)
 
     if "_Нет задач на сегодня_" in message:
         print("⚠️ Задачи не найдены в Redis, используем старую логику")
@@ -24,15 +30,35 @@ def generate_message():
 
     return message
 
-if __name__ == "__main__":
-    today = datetime.datetime.today()
-    if today.weekday() < 5:  # 0–4: Monday–Friday
+def post_morning_message(tenant=None):
+    #Опубликовать утреннее сообщение в канал тенанта и запомнить его thread_ts
+    tenant = tenant or current_tenant()
+    with use_tenant(tenant):
         try:
             message = generate_message()
-            response = client.chat_postMessage(channel=CHANNEL_ID, text=message)
+            response = client.chat_postMessage(channel=tenant.channel_id, text=message)
             set_thread_ts(response["ts"])
-            print("✅ Сообщение отправлено в Slack")
+            # С этим текстом сравниваются перерисовки при отметках задач
+            remember_post(response["ts"], message)
+            print(f"✅ Сообщение отправлено в Slack ({tenant.id})")
+            return True
         except Exception as e:
-            print(f"❌ Ошибка при отправке сообщения: {e}")
+            print(f"❌ Ошибка при отправке сообщения ({tenant.id}): {e}")
+            return False
+
+if __name__ == "__main__":
+    # Разовый запуск (cron); постоянно работающий вариант — scheduler_bot.py.
+    # Cron может стоять на нескольких хостах: запуск по расписанию выполняет один из них.
+    # Вне расписания — только с --force (ручной запуск на одном хосте)
+    force = "--force" in sys.argv[1:]
+    today = datetime.datetime.today()
+    if today.weekday() in Config.WORK_DAYS:
+        for tenant in tenants_for_shard():
+            fire = leader.cron_fire(parse_times(tenant.morning_post_times), force=force)
+            if fire is None:
+                print(f"⏭️ Сейчас не время утреннего сообщения ({tenant.id}), запуск вручную — с --force")
+            elif not leader.run_once(tenant.job_name("morning_post"), fire,
+                                     functools.partial(post_morning_message, tenant)):
+                print(f"⏭️ Сообщение за {fire.strftime('%H:%M')} уже отправляет другой хост ({tenant.id})")
     else:
         print("Сегодня выходной, задачи не отправляются")
@@ -0,0 +1,74 @@
+import bisect
+import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import bot_logic
+from config import Config
+from models import Task
+
+# Tasks ordered by deadline, built once per task_base version (and per weekday
+# for reminders). Reminders take overdue / upcoming tasks as slices found by
+# bisect on the current time; lateness checks use the deadlines parsed at load.
+
+def _seconds(moment: datetime.time) -> float:
+    return moment.hour * 3600 + moment.minute * 60 + moment.second + moment.microsecond / 1e6
+
+def lookahead_minutes(now: datetime.time, spec: str = Config.REMINDER_LOOKAHEAD_MINUTES) -> int:
+    #Окно напоминания в момент now по REMINDER_LOOKAHEAD_MINUTES: "180" — для всех запусков,
+    #"13:00=180,17:00=60" — для запусков в течение часа после указанного времени, иначе 0 (без окна)
+    spec = spec.strip()
+    if spec and "=" not in spec:
+        return int(spec)
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        at, _, minutes = part.partition("=")
+        hour, minute = map(int, at.strip().split(":"))
+        since = _seconds(now) - (hour * 3600 + minute * 60)
+        if 0 <= since < 3600:
+            return int(minutes)
+    return 0
+
+class DeadlineTimeline:
+
+    def __init__(self, tasks: Iterable[Task]):
+        dated: List[Tuple[float, int, Task]] = []
+        self.undated: List[Task] = []
+        # НАЗВАНИЕ -> дедлайн (None — без дедлайна)
+        self.deadlines: Dict[str, Optional[datetime.time]] = {}
+
+        for position, task in enumerate(tasks):
+            self.deadlines[task.key] = task.deadline
+            if task.deadline is None:
+                self.undated.append(task)
+            else:
+                dated.append((_seconds(task.deadline), position, task))
+
+        dated.sort(key=lambda item: (item[0], item[1]))
+        self._keys = [item[0] for item in dated]
+        self._tasks = [item[2] for item in dated]
+
+    def __len__(self) -> int:
+        return len(self._tasks) + len(self.undated)
+
+    def is_late(self, task_name: str, now: datetime.datetime) -> bool:
+        return bot_logic.is_late(self.deadlines.get(task_name.upper()), now)
+
+    def split(self, now: datetime.time, completed: Set[str],
+              lookahead_minutes: Optional[int] = None) -> Tuple[List[Task], List[Task]]:
+        #(невыполненные, просроченные) на момент now. Просрочены задачи с дедлайном раньше now;
+        #из остальных с дедлайном показываются только те, что наступят в пределах lookahead_minutes
+        #(0 — без ограничения; по умолчанию — из REMINDER_LOOKAHEAD_MINUTES для этого времени).
+        #Задачи без дедлайна показываются всегда
+        window = lookahead_minutes(now) if lookahead_minutes is None else lookahead_minutes
+        now_key = _seconds(now)
+        # Ровно в момент дедлайна задача ещё не просрочена (now > deadline)
+        cut = bisect.bisect_left(self._keys, now_key)
+        horizon = bisect.bisect_left(self._keys, now_key + window * 60) if window else len(self._keys)
+
+        def pending(tasks):
+            return [task for task in tasks if task.key not in completed]
+
+        overdue = pending(self._tasks[:cut])
+        upcoming = pending(self.undated) + pending(self._tasks[cut:max(cut, horizon)])
+        return upcoming, overdue
@@ -0,0 +1,92 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import redis
+
+import metrics
+from config import Config
+from redis_conn import ar, r
+
+# Idempotency for Slack event deliveries.
+# Slack redelivers an event it considers unacknowledged (same event_id, up to
+# three retries); without this the handler runs again and posts a second reply.
+# Every event is claimed once: a small in-process LRU answers repeats seen by this
+# process without a round trip, and SET NX with a TTL on
+# "<EVENT_DEDUPE>:<event id>" catches repeats delivered to another process.
+# Deliveries are checked in the bot's first middleware, before any state is read.
+# If Redis is unavailable the event is handled (a rare double reply beats a lost one).
+
+logger = logging.getLogger(__name__)
+
+DUPLICATES = metrics.counter("slack_event_duplicates_total",
+                             "Redelivered Slack events dropped, by where the repeat was caught (memory, redis)")
+
+def event_key(body: Dict[str, Any]) -> Optional[str]:
+    #Идентификатор доставки: event_id, для событий без него — client_msg_id сообщения
+    event_id = body.get("event_id") or body.get("event", {}).get("client_msg_id")
+    return f"{Config.EVENT_DEDUPE}:{event_id}" if event_id else None
+
+class EventDeduplicator:
+
+    def __init__(self, ttl: int = Config.EVENT_DEDUPE_TTL_SECONDS, lru_size: int = Config.EVENT_DEDUPE_LRU_SIZE):
+        self.ttl = ttl
+        self.lru_size = lru_size
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _seen_locally(self, key: str) -> bool:
+        with self._lock:
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                DUPLICATES.inc(source="memory")
+                return True
+            return False
+
+    def _remember(self, key: str) -> None:
+        with self._lock:
+            self._seen[key] = None
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.lru_size:
+                self._seen.popitem(last=False)
+
+    def _claimed(self, key: str, fresh: Any) -> bool:
+        # Ключ уже был у другого процесса (или у этого, но вытеснен из LRU)
+        self._remember(key)
+        if not fresh:
+            DUPLICATES.inc(source="redis")
+            logger.info(f"Dropping redelivered event {key}")
+            return True
+        return False
+
+    def is_duplicate(self, body: Dict[str, Any]) -> bool:
+        #Событие уже обрабатывалось? Первая доставка занимает ключ и получает False
+        key = event_key(body)
+        if key is None:
+            return False
+        if self._seen_locally(key):
+            logger.info(f"Dropping redelivered event {key}")
+            return True
+        try:
+            fresh = r.set(key, 1, nx=True, ex=self.ttl)
+        except redis.RedisError as e:
+            logger.error(f"Event dedupe unavailable, handling {key}: {e}")
+            return False
+        return self._claimed(key, fresh)
+
+    async def is_duplicate_async(self, body: Dict[str, Any]) -> bool:
+        key = event_key(body)
+        if key is None:
+            return False
+        if self._seen_locally(key):
+            logger.info(f"Dropping redelivered event {key}")
+            return True
+        try:
+            fresh = await ar.set(key, 1, nx=True, ex=self.ttl)
+        except redis.RedisError as e:
+            logger.error(f"Event dedupe unavailable, handling {key}: {e}")
+            return False
+        return self._claimed(key, fresh)
+
+deduplicator = EventDeduplicator()
@@ -0,0 +1,216 @@
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, List, Optional
+
+import pytz
+import redis
+
+import metrics
+from config import Config
+from redis_conn import r
+
+# Leader election and per-run fencing for scheduled jobs on several hosts.
+#
+# The scheduler of a shard runs on every host, but only the holder of the lease
+# "<SCHEDULER_LEADER>:<shard>" runs jobs. The lease is taken with SET NX PX
+# LEADER_LEASE_MS and renewed every LEADER_RENEW_SECONDS; renewal and release check
+# the holder under WATCH/MULTI, so a node can only extend or drop its own lease.
+# If the leader dies the key expires and a standby takes over within one lease.
+# A leader that cannot renew (paused, cut off from Redis) stops acting as leader
+# when its own copy of the lease runs out, which is never later than the key expires.
+#
+# Leadership alone does not rule out a double run (a paused leader waking up right
+# after a standby took over), so every run is also fenced by a run key per job and
+# scheduled time: SET "<JOB_RUNS>:<job>:<fire time>" NX. The node that gets the key
+# runs the job; a run in progress holds it for JOB_RUN_TIMEOUT_SECONDS (if the node
+# dies mid-run the next leader can catch the run up), a finished run keeps it for
+# JOB_RUN_TTL_SECONDS. The one-shot cron_bot / reminder_bot runs claim the same keys,
+# so the same cron entries can stay on every host.
+
+logger = logging.getLogger(__name__)
+
+LEADERSHIP = metrics.counter("scheduler_leadership_changes_total",
+                             "Scheduler lease gained or lost by this process, by event (acquired, lost)")
+RUN_CLAIMS = metrics.counter("scheduled_run_claims_total",
+                             "Scheduled runs by claim result (claimed, taken, error)")
+
+def node_id() -> str:
+    #Имя узла в аренде и ключах запусков: хост, pid и случайный суффикс (pid повторяется в контейнерах)
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+NODE = node_id()
+
+def _text(value: Any) -> Optional[str]:
+    return value.decode() if isinstance(value, bytes) else value
+
+class LeaderLease:
+    #Аренда в Redis: кто держит ключ, тот лидер до истечения срока
+
+    def __init__(self, key: str, lease_ms: int = Config.LEADER_LEASE_MS, node: str = NODE):
+        self.key = key
+        self.lease_ms = lease_ms
+        self.node = node
+        self._valid_until = 0.0  # time.monotonic(), до которого аренда точно наша
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    def holder(self) -> Optional[str]:
+        try:
+            return _text(r.get(self.key))
+        except redis.RedisError as e:
+            logger.error(f"Error loading lease holder {self.key}: {e}")
+            return None
+
+    def _if_holder(self, action: Callable[[Any], Any]) -> bool:
+        #Выполнить action(pipe) в транзакции, только если ключ всё ещё наш (в fakeredis нет EVAL)
+        with r.pipeline() as pipe:
+            try:
+                pipe.watch(self.key)
+                if _text(pipe.get(self.key)) != self.node:
+                    return False
+                pipe.multi()
+                action(pipe)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def acquire_or_renew(self) -> bool:
+        #Захватить свободную аренду или продлить свою; False — аренда у другого узла
+        # Срок отсчитывается от момента до запроса: у нас аренда кончается не позже, чем в Redis
+        started = time.monotonic()
+        try:
+            held = bool(r.set(self.key, self.node, nx=True, px=self.lease_ms)) or \
+                self._if_holder(lambda pipe: pipe.pexpire(self.key, self.lease_ms))
+        except redis.RedisError as e:
+            # Без Redis чужой узел аренду тоже не получит; своя доживает до конца срока
+            logger.error(f"Error renewing lease {self.key}: {e}")
+            return self.is_leader
+        self._valid_until = started + self.lease_ms / 1000 if held else 0.0
+        return held
+
+    def release(self) -> None:
+        #Отдать аренду при остановке — резервный узел не ждёт истечения срока
+        self._valid_until = 0.0
+        try:
+            self._if_holder(lambda pipe: pipe.delete(self.key))
+        except redis.RedisError as e:
+            logger.error(f"Error releasing lease {self.key}: {e}")
+
+class LeaderElector:
+    #Фоновый поток: каждые interval секунд захватывает или продлевает аренду
+
+    def __init__(self, lease: LeaderLease, interval: float = Config.LEADER_RENEW_SECONDS):
+        self.lease = lease
+        self.interval = interval
+        # Поднимается при получении лидерства: планировщик догоняет пропущенные запуски
+        self.elected = threading.Event()
+        self._was_leader = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.lease.is_leader
+
+    def step(self) -> bool:
+        leader = self.lease.acquire_or_renew()
+        if leader != self._was_leader:
+            if leader:
+                logger.warning(f"Became leader ({self.lease.key}, node {self.lease.node})")
+                self.elected.set()
+            else:
+                logger.warning(f"Lost leadership ({self.lease.key}), holder: {self.lease.holder()}")
+            LEADERSHIP.inc(event="acquired" if leader else "lost")
+            self._was_leader = leader
+        return leader
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.step()
+
+    def start(self) -> None:
+        # Первая попытка синхронно: к первому запуску задач уже известно, лидер ли этот узел
+        self.step()
+        self._thread = threading.Thread(target=self._loop, name="leader-lease", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+        if self._was_leader:
+            self.lease.release()
+
+def scheduler_elector(shard_index: int = Config.SCHEDULER_SHARD_INDEX) -> Optional[LeaderElector]:
+    #Выборы среди планировщиков одного шарда; None — LEADER_ELECTION выключен
+    if not Config.LEADER_ELECTION:
+        return None
+    return LeaderElector(LeaderLease(f"{Config.SCHEDULER_LEADER}:{shard_index}"))
+
+def run_key(job_name: str, fire: datetime.datetime) -> str:
+    return f"{Config.JOB_RUNS}:{job_name}:{fire.isoformat()}"
+
+def claim_run(job_name: str, fire: datetime.datetime, node: str = NODE) -> bool:
+    #Занять запуск job_name по расписанию fire; False — его выполняет или выполнил другой узел.
+    #Без Redis запуск не выполняется: задачи всё равно читают данные оттуда
+    try:
+        claimed = r.set(run_key(job_name, fire), f"running:{node}", nx=True, ex=Config.JOB_RUN_TIMEOUT_SECONDS)
+    except redis.RedisError as e:
+        logger.error(f"Error claiming {job_name} at {fire.isoformat()}: {e}")
+        RUN_CLAIMS.inc(result="error")
+        return False
+    RUN_CLAIMS.inc(result="claimed" if claimed else "taken")
+    return bool(claimed)
+
+def run_in_progress(job_name: str, fire: datetime.datetime) -> bool:
+    #Запуск занят, но ещё не закончен (узел мог упасть — ключ освободится через JOB_RUN_TIMEOUT_SECONDS)
+    try:
+        return (_text(r.get(run_key(job_name, fire))) or "").startswith("running:")
+    except redis.RedisError as e:
+        logger.error(f"Error loading run {job_name} at {fire.isoformat()}: {e}")
+        return False
+
+def finish_run(job_name: str, fire: datetime.datetime, node: str = NODE) -> None:
+    try:
+        r.set(run_key(job_name, fire), f"done:{node}", ex=Config.JOB_RUN_TTL_SECONDS)
+    except redis.RedisError as e:
+        logger.error(f"Error finishing {job_name} at {fire.isoformat()}: {e}")
+
+def run_once(job_name: str, fire: datetime.datetime, func: Callable[[], Any], node: str = NODE) -> bool:
+    #Выполнить func, если запуск fire ещё никто не занял; True — выполнен этим узлом.
+    #Упавший запуск тоже считается выполненным (как и раньше, повторно он не запускается)
+    if not claim_run(job_name, fire, node):
+        logger.info(f"{job_name} at {fire.isoformat()} is run by another node, skipping")
+        return False
+    try:
+        func()
+    finally:
+        finish_run(job_name, fire, node)
+    return True
+
+def cron_fire(times: List[datetime.time], now: Optional[datetime.datetime] = None,
+              force: bool = False) -> Optional[datetime.datetime]:
+    #Запуск по расписанию, к которому относится разовый запуск из cron: время из times в пределах
+    #CRON_CLOCK_SKEW_SECONDS от now (cron на разных хостах срабатывает с разницей в секунды).
+    #Вне расписания — None: у хостов, сработавших по разные стороны границы минуты (или любого
+    #другого интервала), ключи запуска разошлись бы и запуск выполнили бы оба. Ручной запуск
+    #(force=True) выполняется всегда, с ключом на текущую секунду
+    tz = pytz.timezone(Config.TIMEZONE)
+    now = (now or datetime.datetime.now(tz)).astimezone(tz)
+    for fire_time in times:
+        fire = tz.localize(datetime.datetime.combine(now.date(), fire_time))
+        if abs((now - fire).total_seconds()) <= Config.CRON_CLOCK_SKEW_SECONDS:
+            return fire
+    if force:
+        return now.replace(microsecond=0)
+    logger.warning(f"{now.strftime('%H:%M')} is not within {Config.CRON_CLOCK_SKEW_SECONDS}s of a scheduled time "
+                   f"{[fire_time.strftime('%H:%M') for fire_time in times]}, skipping (--force to run anyway)")
+    return None
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional, Set
+
+import redis
+from slack_sdk.errors import SlackApiError
+
+import bot_logic
+import codec
+import models
+import redis_bot
+import redis_bot_async
+from config import Config
+from outbox import send
+from redis_bot import RenderSnapshot, _state_key, render_message
+from redis_conn import ar, r
+from tenants import Tenant, current_tenant, use_tenant
+
+# Live morning message: the posted task list is edited in place (chat_update)
+# with completed tasks checked off, who and when.
+#
+# Edits are debounced across processes: the first completion in a window takes
+# "<state key>:live:pending" (SET NX) and schedules one refresh
+# LIVE_MESSAGE_DEBOUNCE_SECONDS later; completions inside the window only find
+# the key taken. The refresh drops the key before reading, so a completion that
+# lands after the read schedules the next edit instead of being lost.
+# "<state key>:live" keeps the ts, text and day of the message as last sent;
+# lines are compared with it and the edit is skipped if none changed.
+
+logger = logging.getLogger(__name__)
+
+# Ключ ожидания живёт дольше окна — на случай, если процесс с таймером упал
+PENDING_GRACE_SECONDS = 30
+_async_refreshes: Set[asyncio.Task] = set()
+
+def _live_key(debug_mode: bool) -> str:
+    return f"{_state_key(debug_mode)}:live"
+
+def _pending_key(debug_mode: bool) -> str:
+    return f"{_state_key(debug_mode)}:live:pending"
+
+def _pending_ms() -> int:
+    return int((Config.LIVE_MESSAGE_DEBOUNCE_SECONDS + PENDING_GRACE_SECONDS) * 1000)
+
+def _posted_record(thread_ts: str, text: str, day_override: Optional[str]) -> Dict[str, str]:
+    return {"ts": thread_ts, "text": text, "day": day_override or ""}
+
+def _decode_posted(raw: Dict[bytes, bytes]) -> Dict[str, str]:
+    return {key.decode(): value.decode() for key, value in raw.items()}
+
+def changed_lines(old: Optional[str], new: str) -> List[int]:
+    #Номера строк, которые отличаются от отправленного текста (его нет — все строки)
+    old_lines = old.split("\n") if old is not None else []
+    new_lines = new.split("\n")
+    changed = [i for i, line in enumerate(new_lines) if i >= len(old_lines) or old_lines[i] != line]
+    if len(old_lines) > len(new_lines):
+        changed.append(len(new_lines))  # строки удалены в конце
+    return changed
+
+def _render(snapshot: RenderSnapshot, posted: Dict[str, str], debug_mode: bool) -> Optional[str]:
+    #Новый текст сообщения или None, если обновлять нечего (нет треда, другой день, строки те же)
+    thread_ts = snapshot.thread_ts
+    if not thread_ts or snapshot.state.date != bot_logic.now_local().date().isoformat():
+        return None
+    if posted.get("ts") != thread_ts:
+        # Сообщение опубликовано без remember_post (старой версией) — сравнивать не с чем
+        posted.clear()
+    text = render_message(snapshot, posted.get("day") or None, debug_mode, live=True)
+    changed = changed_lines(posted.get("text"), text)
+    if not changed:
+        logger.debug(f"Live message {thread_ts}: nothing changed")
+        return None
+    logger.info(f"Live message {thread_ts}: {len(changed)} line(s) changed")
+    return text
+
+# Sync (main_bot, cron_bot)
+
+def remember_post(thread_ts: str, text: str, debug_mode: bool = False, day_override: Optional[str] = None) -> None:
+    #Запомнить опубликованное утреннее сообщение — с ним сравниваются перерисовки
+    key = _live_key(debug_mode)
+    try:
+        pipe = r.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=_posted_record(thread_ts, text, day_override))
+        pipe.expire(key, Config.COMPLETED_TTL_SECONDS)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error saving live message {thread_ts}: {e}")
+
+def request_refresh(client, debug_mode: bool = False) -> bool:
+    #Запланировать перерисовку (если она ещё не запланирована в этом окне); True — запланировали мы
+    if not Config.LIVE_MESSAGE_ENABLED:
+        return False
+    try:
+        if not r.set(_pending_key(debug_mode), 1, nx=True, px=_pending_ms()):
+            return False
+    except redis.RedisError as e:
+        logger.error(f"Error scheduling live message refresh: {e}")
+        return False
+    timer = threading.Timer(Config.LIVE_MESSAGE_DEBOUNCE_SECONDS, _refresh_in_thread,
+                            args=(client, current_tenant(), debug_mode))
+    timer.daemon = True
+    timer.start()
+    return True
+
+def _refresh_in_thread(client, tenant: Tenant, debug_mode: bool) -> None:
+    # Таймер работает в своём потоке — тенант передаётся явно
+    with use_tenant(tenant):
+        try:
+            refresh_message(client, debug_mode)
+        except Exception as e:
+            logger.error(f"Error refreshing live message: {e}")
+
+def refresh_message(client, debug_mode: bool = False) -> bool:
+    #Перерисовать опубликованное сообщение и отправить chat_update, если изменилась хоть одна строка
+    live_key = _live_key(debug_mode)
+    try:
+        pipe = r.pipeline()
+        pipe.delete(_pending_key(debug_mode))
+        pipe.hgetall(live_key)
+        _, raw = pipe.execute()
+        posted = _decode_posted(raw)
+        snapshot = redis_bot.load_render_snapshot(debug_mode, posted.get("day") or None)
+    except (redis.RedisError, codec.CodecError, models.ModelError) as e:
+        logger.error(f"Error loading live message: {e}")
+        return False
+
+    text = _render(snapshot, posted, debug_mode)
+    if text is None:
+        return False
+    try:
+        send(client, "chat_update", channel=current_tenant().channel_id, ts=snapshot.thread_ts, text=text)
+    except SlackApiError as e:
+        logger.error(f"Error updating live message {snapshot.thread_ts}: {e.response.get('error')}")
+        return False
+    remember_post(snapshot.thread_ts, text, debug_mode, posted.get("day") or None)
+    return True
+
+# Async (main_bot_async)
+
+async def remember_post_async(thread_ts: str, text: str, debug_mode: bool = False,
+                              day_override: Optional[str] = None) -> None:
+    key = _live_key(debug_mode)
+    try:
+        pipe = ar.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=_posted_record(thread_ts, text, day_override))
+        pipe.expire(key, Config.COMPLETED_TTL_SECONDS)
+        await pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error saving live message {thread_ts}: {e}")
+
+async def request_refresh_async(client, debug_mode: bool = False) -> bool:
+    if not Config.LIVE_MESSAGE_ENABLED:
+        return False
+    try:
+        if not await ar.set(_pending_key(debug_mode), 1, nx=True, px=_pending_ms()):
+            return False
+    except redis.RedisError as e:
+        logger.error(f"Error scheduling live message refresh: {e}")
+        return False
+    # Задача копирует контекст, тенант в ней тот же; ссылка держится до завершения
+    task = asyncio.create_task(_refresh_later(client, debug_mode))
+    _async_refreshes.add(task)
+    task.add_done_callback(_async_refreshes.discard)
+    return True
+
+async def _refresh_later(client, debug_mode: bool) -> None:
+    await asyncio.sleep(Config.LIVE_MESSAGE_DEBOUNCE_SECONDS)
+    try:
+        await refresh_message_async(client, debug_mode)
+    except Exception as e:
+        logger.error(f"Error refreshing live message: {e}")
+
+async def refresh_message_async(client, debug_mode: bool = False) -> bool:
+    live_key = _live_key(debug_mode)
+    try:
+        pipe = ar.pipeline()
+        pipe.delete(_pending_key(debug_mode))
+        pipe.hgetall(live_key)
+        _, raw = await pipe.execute()
+        posted = _decode_posted(raw)
+        snapshot = await redis_bot_async.load_render_snapshot(debug_mode, posted.get("day") or None)
+    except (redis.RedisError, codec.CodecError, models.ModelError) as e:
+        logger.error(f"Error loading live message: {e}")
+        return False
+
+    text = _render(snapshot, posted, debug_mode)
+    if text is None:
+        return False
+    try:
+        await client.chat_update(channel=current_tenant().channel_id, ts=snapshot.thread_ts, text=text)
+    except SlackApiError as e:
+        logger.error(f"Error updating live message {snapshot.thread_ts}: {e.response.get('error')}")
+        return False
+    await remember_post_async(snapshot.thread_ts, text, debug_mode, posted.get("day") or None)
+    return True
@@ -1,16 +1,19 @@
-import pytz
-import datetime
-import re
-import json
 from typing import Dict, Any, Optional
-from slack_bolt import App
+from slack_bolt import App, BoltResponse
 from slack_bolt.adapter.socket_mode import SocketModeHandler
+import bot_logic
+import metrics
 from config import Config
+from event_dedupe import deduplicator
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
+from live_message import remember_post, request_refresh
+from outbox import send, start_worker_thread
 from redis_bot import (
-    set_thread_ts, record_task, get_thread_ts,
-    generate_message_from_redis, get_task_deadlines, find_task_in_text,
+    set_thread_ts, record_tasks, get_thread_ts,
+    generate_message_from_redis, find_tasks_in_text,
     set_task_assignment, find_task_by_pattern, find_employee_by_username # Новые функции
 )
+from tenants import load_tenants, tenant_for_channel, use_tenant
 
 # Setup logging and validate config
 logger = Config.setup_logging()
@@ -18,11 +21,31 @@ Config.validate_required_env_vars()
 
 # ВАЖНО: Используем Bot Token для App, App Token для Socket Mode
 app = App(token=Config.SLACK_BOT_TOKEN)
+# Прямые вызовы Slack ждут Retry-After и повторяют запрос при 429
+app.client.retry_handlers.append(RateLimitErrorRetryHandler(max_retry_count=2))
+
+@app.middleware
+def drop_redelivered_events(body, next):
+    #Повторная доставка события (Slack не дождался ack) — подтверждаем и больше ничего не делаем
+    if deduplicator.is_duplicate(body):
+        return BoltResponse(status=200, body="")
+    next()
+
+@app.middleware
+def route_tenant(body, context, next):
+    #Определить тенанта по каналу события или команды; обработчики работают в его пространстве ключей
+    channel = body.get("event", {}).get("channel") or body.get("channel_id")
+    context["tenant"] = tenant_for_channel(channel)
+    if context["tenant"] is None:
+        logger.info(f"Channel {channel} is not configured for any tenant")
+    # Bolt создаёт WebClient на каждый запрос — считаем и его вызовы
+    metrics.instrument_slack_client(context.client)
+    next()
 
 def generate_message(day_override: Optional[str] = None) -> str:
     """Generate message for debug mode."""
     try:
-        message = generate_message_from_redis(day_override=day_override, debug_mode=True)
+        message = generate_message_from_redis(day_override=day_override, debug_mode=True, materialize=True)
         if "_Нет задач на сегодня_" in message:
             logger.warning("Tasks not found in Redis, using fallback logic")
         return message
@@ -31,30 +54,37 @@ def generate_message(day_override: Optional[str] = None) -> str:
         return "❌ Error generating debug message"
 
 @app.event("app_mention")
-def handle_task_update(event: Dict[str, Any], say, client) -> None:
+@metrics.timed("slack_handler", handler="handle_task_update")
+def handle_task_update(event: Dict[str, Any], say, client, context) -> None:
     #Handle app mentions for task completion and debug commands.
+    tenant = context.get("tenant")
+    if tenant is None:
+        return
+    with use_tenant(tenant):
+        _handle_task_update(event, say, client, tenant)
+
+def _handle_task_update(event: Dict[str, Any], say, client, tenant) -> None:
+    user = event.get("user")
+    thread_ts = event.get("thread_ts") or event.get("ts")
     try:
-        logger.info(f"Bot mentioned: {event.get('user')} - {event.get('text', '')}")
+        logger.info(f"Bot mentioned: {user} - {event.get('text', '')}")
 
         text = event.get("text", "")
-        user = event.get("user")
-        thread_ts = event.get("thread_ts") or event.get("ts")
-        riga = pytz.timezone(Config.TIMEZONE)
-        ts = datetime.datetime.now(riga)
+        ts = bot_logic.now_local()
 
         # Debug command to simulate cron task
-        if "debug" in text.lower():
+        is_debug, day_override = bot_logic.parse_debug_command(text)
+        if is_debug:
             try:
-                debug_text = text.lower()
-                day_override = "Monday" if "monday" in debug_text else None
                 message = generate_message(day_override=day_override)
 
                 # Создаем новое сообщение с задачами
                 response = client.chat_postMessage(
-                    channel=Config.SLACK_CHANNEL_ID,
+                    channel=tenant.channel_id,
                     text=message
                 )
                 set_thread_ts(response["ts"], debug_mode=True)
+                remember_post(response["ts"], message, debug_mode=True, day_override=day_override)
 
                 say(
                     text=f"<@{user}> sent task message (debug mode)",
@@ -73,72 +103,53 @@ def handle_task_update(event: Dict[str, Any], say, client) -> None:
                 return
 
         # Определяем debug режим по thread_ts
-        debug_mode = False
-        production_thread_ts = get_thread_ts(debug_mode=False)
-        debug_thread_ts = get_thread_ts(debug_mode=True)
-
-        if thread_ts == debug_thread_ts:
-            debug_mode = True
-            logger.info("🔧 DEBUG MODE: используем debug_routine_state")
-        elif thread_ts == production_thread_ts:
-            debug_mode = False
-            logger.info("📋 PRODUCTION MODE: используем slack_routine_state")
-        else:
-            # Если не в известном треде, используем production по умолчанию
-            debug_mode = False
-            # Используем production thread_ts для ответа
-            if production_thread_ts:
-                thread_ts = production_thread_ts
-            logger.info("📋 DEFAULT MODE: используем slack_routine_state")
-
-        task = find_task_in_text(text)
-        if task:
-            ok, msg = record_task(task, user, debug_mode=debug_mode)
-            if not ok:
-                say(
+        debug_mode, thread_ts = bot_logic.resolve_thread(
+            thread_ts, get_thread_ts(debug_mode=False), get_thread_ts(debug_mode=True)
+        )
+
+        # "LPB, KYC-1 и Statements done" — все задачи одной записью и одним ответом
+        tasks = find_tasks_in_text(text)
+        if tasks:
+            late, already, msg = record_tasks(tasks, user, debug_mode=debug_mode, now=ts)
+            if msg:
+                send(client, "chat_postMessage",
+                    channel=event["channel"],
                     text=f"<@{user}> {msg}",
                     thread_ts=thread_ts
                 )
                 return
 
-            # Проверяем дедлайны
-            task_deadlines = get_task_deadlines()
-            deadline = task_deadlines.get(task)
-
-            if deadline:
-                deadline_dt = riga.localize(datetime.datetime.combine(ts.date(), deadline))
-                logger.info(f"⏱️ Сейчас: {ts.strftime('%H:%M:%S')} | Дедлайн для {task}: {deadline_dt.strftime('%H:%M:%S')}")
-
-                if ts > deadline_dt:
-                    prefix = "🔧 DEBUG: " if debug_mode else ""
-                    say(
-                        text=f"{prefix}<@{user}> {task} было сделано поздно!",
-                        thread_ts=thread_ts
-                    )
-                else:
-                    client.reactions_add(
-                        channel=event["channel"],
-                        timestamp=event["ts"],
-                        name="white_check_mark"
-                    )
-            else:
-                # Задачи без дедлайна - просто галочка
-                client.reactions_add(
+            if late:
+                # Отметки появятся и в самом утреннем сообщении (одна правка на серию отметок)
+                request_refresh(client, debug_mode)
+
+            if not all(late.values()):
+                # Хоть что-то в срок или без дедлайна — галочка
+                send(client, "reactions_add",
                     channel=event["channel"],
                     timestamp=event["ts"],
-                    name="white_check_mark"
+                    name=bot_logic.REACTION_DONE
+                )
+            # Опоздавшие и уже отмеченные раньше — одним сообщением
+            reply = bot_logic.completion_reply(user, [task for task in tasks if late.get(task)], already, debug_mode)
+            if reply:
+                send(client, "chat_postMessage",
+                    channel=event["channel"],
+                    text=reply,
+                    thread_ts=thread_ts
                 )
         else:
-            prefix = "🔧 DEBUG: " if debug_mode else ""
-            say(
-                text=f"{prefix}<@{user}> я не понял, о какой задаче речь 🤔. Напиши, например: `@bot LPB done`",
+            send(client, "chat_postMessage",
+                channel=event["channel"],
+                text=bot_logic.unknown_task_text(user, debug_mode),
                 thread_ts=thread_ts
             )
 
     except Exception as e:
         logger.error(f"Error in handle_task_update: {e}")
         try:
-            say(
+            send(client, "chat_postMessage",
+                channel=event["channel"],
                 text=f"<@{user}> ❌ Произошла ошибка при обработке команды",
                 thread_ts=thread_ts
             )
@@ -146,10 +157,19 @@ def handle_task_update(event: Dict[str, Any], say, client) -> None:
             logger.error("Failed to send error message to user")
 
 @app.command("/set-fin-duty")
-def handle_set_fin_duty(ack, command, say):
+@metrics.timed("slack_handler", handler="handle_set_fin_duty")
+def handle_set_fin_duty(ack, command, say, client, context):
     #Обработчик команды /set-fin-duty
     ack()
 
+    tenant = context.get("tenant")
+    if tenant is None:
+        say("❌ Этот канал не подключён к боту")
+        return
+    with use_tenant(tenant):
+        _set_fin_duty(command, say, client)
+
+def _set_fin_duty(command, say, client):
     try:
         user_name = command.get("user_name", "")  # username того, кто вызвал
         text = command.get("text", "").strip()
@@ -157,29 +177,29 @@ def handle_set_fin_duty(ack, command, say):
         logger.info(f"set-fin-duty: user={user_name}, text='{text}'")
 
         # Ищем задачу
-        task_name = find_task_by_pattern("fin")
+        task_name = find_task_by_pattern(bot_logic.FIN_DUTY_PATTERN)
 
         if not task_name:
             say("❌ Задача с 'fin' в названии не найдена в системе")
             return
 
         # Парсим команду
-        if not text:
+        target_username = bot_logic.fin_duty_target(text)
+        if not target_username:
             # Пустая команда - снимаем назначение
             if set_task_assignment(task_name):
+                request_refresh(client)
                 say(f"✅ Назначение с задачи *{task_name}* снято")
             else:
                 say("❌ Ошибка при снятии назначения")
             return
 
-        # Извлекаем username из текста
-        target_username = text.lstrip('@').strip()
-
         # Ищем пользователя в нашей базе
         slack_user_id = find_employee_by_username(target_username)
 
         if slack_user_id:
             if set_task_assignment(task_name, slack_user_id):
+                request_refresh(client)
                 say(f"✅ Пользователь <@{slack_user_id}> назначен на задачу *{task_name}*")
             else:
                 say("❌ Ошибка при назначении пользователя")
@@ -191,4 +211,8 @@ def handle_set_fin_duty(ack, command, say):
         say("❌ Произошла ошибка при обработке команды")
 
 if __name__ == "__main__":
+    logger.info(f"Serving {len(load_tenants())} tenant(s)")
+    metrics.start_http_server()
+    # Доставка очереди исходящих сообщений (если SLACK_OUTBOX_ENABLED)
+    start_worker_thread(Config.SLACK_BOT_TOKEN)
     SocketModeHandler(app, Config.SLACK_APP_TOKEN).start()
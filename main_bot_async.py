@@ -0,0 +1,192 @@
+import asyncio
+from typing import Dict, Any, Optional
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.response import BoltResponse
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+import bot_logic
+import metrics
+from config import Config
+from event_dedupe import deduplicator
+from live_message import remember_post_async, request_refresh_async
+from redis_bot_async import (
+    set_thread_ts, record_tasks, get_thread_ts,
+    generate_message_from_redis, find_tasks_in_text,
+    set_task_assignment, find_task_by_pattern, find_employee_by_username
+)
+from tenants import tenant_for_channel, use_tenant
+
+# Async mode of main_bot: same handlers on AsyncApp + redis.asyncio, so mentions
+# at shift change overlap their Redis and Slack I/O instead of queueing on threads.
+# Business rules come from bot_logic, data access from redis_bot_async.
+
+# Setup logging and validate config
+logger = Config.setup_logging()
+Config.validate_required_env_vars()
+
+app = AsyncApp(token=Config.SLACK_BOT_TOKEN)
+
+@app.middleware
+async def drop_redelivered_events(body, next):
+    #Повторная доставка события — подтверждаем и больше ничего не делаем (см. main_bot)
+    if await deduplicator.is_duplicate_async(body):
+        return BoltResponse(status=200, body="")
+    await next()
+
+@app.middleware
+async def route_tenant(body, context, next):
+    #Тенант по каналу события или команды (см. main_bot.route_tenant)
+    channel = body.get("event", {}).get("channel") or body.get("channel_id")
+    context["tenant"] = tenant_for_channel(channel)
+    if context["tenant"] is None:
+        logger.info(f"Channel {channel} is not configured for any tenant")
+    metrics.instrument_slack_client(context.client)
+    await next()
+
+async def generate_message(day_override: Optional[str] = None) -> str:
+    #Generate message for debug mode.
+    try:
+        message = await generate_message_from_redis(day_override=day_override, debug_mode=True, materialize=True)
+        if "_Нет задач на сегодня_" in message:
+            logger.warning("Tasks not found in Redis, using fallback logic")
+        return message
+    except Exception as e:
+        logger.error(f"Error generating debug message: {e}")
+        return "❌ Error generating debug message"
+
+@app.event("app_mention")
+@metrics.timed("slack_handler", handler="handle_task_update")
+async def handle_task_update(event: Dict[str, Any], say, client, context) -> None:
+    #Handle app mentions for task completion and debug commands.
+    tenant = context.get("tenant")
+    if tenant is None:
+        return
+    # Задачи из asyncio.gather копируют контекст, так что тенант виден и в них
+    with use_tenant(tenant):
+        await _handle_task_update(event, say, client, tenant)
+
+async def _handle_task_update(event: Dict[str, Any], say, client, tenant) -> None:
+    user = event.get("user")
+    thread_ts = event.get("thread_ts") or event.get("ts")
+    try:
+        logger.info(f"Bot mentioned: {user} - {event.get('text', '')}")
+
+        text = event.get("text", "")
+        ts = bot_logic.now_local()
+
+        is_debug, day_override = bot_logic.parse_debug_command(text)
+        if is_debug:
+            try:
+                message = await generate_message(day_override=day_override)
+                response = await client.chat_postMessage(
+                    channel=tenant.channel_id,
+                    text=message
+                )
+                await set_thread_ts(response["ts"], debug_mode=True)
+                await remember_post_async(response["ts"], message, debug_mode=True, day_override=day_override)
+                await say(
+                    text=f"<@{user}> sent task message (debug mode)",
+                    thread_ts=response["ts"]
+                )
+                logger.info(f"Debug message sent by user {user}")
+                return
+
+            except Exception as e:
+                logger.error(f"Error handling debug command: {e}")
+                await say(
+                    text=f"<@{user}> ❌ Error sending debug message",
+                    thread_ts=thread_ts
+                )
+                return
+
+        # Оба thread_ts и поиск задачи не зависят друг от друга — читаем параллельно
+        production_thread_ts, debug_thread_ts, tasks = await asyncio.gather(
+            get_thread_ts(debug_mode=False), get_thread_ts(debug_mode=True), find_tasks_in_text(text)
+        )
+        debug_mode, thread_ts = bot_logic.resolve_thread(thread_ts, production_thread_ts, debug_thread_ts)
+
+        if tasks:
+            late, already, msg = await record_tasks(tasks, user, debug_mode=debug_mode, now=ts)
+            if msg:
+                await say(text=f"<@{user}> {msg}", thread_ts=thread_ts)
+                return
+
+            if late:
+                await request_refresh_async(client, debug_mode)
+            if not all(late.values()):
+                await client.reactions_add(
+                    channel=event["channel"],
+                    timestamp=event["ts"],
+                    name=bot_logic.REACTION_DONE
+                )
+            reply = bot_logic.completion_reply(user, [task for task in tasks if late.get(task)], already, debug_mode)
+            if reply:
+                await say(text=reply, thread_ts=thread_ts)
+        else:
+            await say(text=bot_logic.unknown_task_text(user, debug_mode), thread_ts=thread_ts)
+
+    except Exception as e:
+        logger.error(f"Error in handle_task_update: {e}")
+        try:
+            await say(
+                text=f"<@{user}> ❌ Произошла ошибка при обработке команды",
+                thread_ts=thread_ts
+            )
+        except Exception:
+            logger.error("Failed to send error message to user")
+
+@app.command("/set-fin-duty")
+@metrics.timed("slack_handler", handler="handle_set_fin_duty")
+async def handle_set_fin_duty(ack, command, say, client, context):
+    #Обработчик команды /set-fin-duty
+    await ack()
+
+    tenant = context.get("tenant")
+    if tenant is None:
+        await say("❌ Этот канал не подключён к боту")
+        return
+    with use_tenant(tenant):
+        await _set_fin_duty(command, say, client)
+
+async def _set_fin_duty(command, say, client):
+    try:
+        user_name = command.get("user_name", "")
+        text = command.get("text", "").strip()
+
+        logger.info(f"set-fin-duty: user={user_name}, text='{text}'")
+
+        task_name = await find_task_by_pattern(bot_logic.FIN_DUTY_PATTERN)
+
+        if not task_name:
+            await say("❌ Задача с 'fin' в названии не найдена в системе")
+            return
+
+        target_username = bot_logic.fin_duty_target(text)
+        if not target_username:
+            if await set_task_assignment(task_name):
+                await request_refresh_async(client)
+                await say(f"✅ Назначение с задачи *{task_name}* снято")
+            else:
+                await say("❌ Ошибка при снятии назначения")
+            return
+
+        slack_user_id = await find_employee_by_username(target_username)
+
+        if slack_user_id:
+            if await set_task_assignment(task_name, slack_user_id):
+                await request_refresh_async(client)
+                await say(f"✅ Пользователь <@{slack_user_id}> назначен на задачу *{task_name}*")
+            else:
+                await say("❌ Ошибка при назначении пользователя")
+        else:
+            await say(f"❌ Сотрудник с username '{target_username}' не найден в базе")
+
+    except Exception as e:
+        logger.error(f"Error in handle_set_fin_duty: {e}")
+        await say("❌ Произошла ошибка при обработке команды")
+
+async def main():
+    metrics.start_http_server()
+    await AsyncSocketModeHandler(app, Config.SLACK_APP_TOKEN).start_async()
+
+if __name__ == "__main__":
+    asyncio.run(main())
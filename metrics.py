@@ -0,0 +1,255 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from slack_sdk.errors import SlackApiError
+
+from config import Config
+
+# Counters and latency histograms in Prometheus text format, served on
+# METRICS_PORT (/metrics). With METRICS_PORT unset everything here is a no-op:
+# timed() returns the function itself and the Slack client is left as is, so
+# disabled metrics cost one boolean check on the Redis path and nothing elsewhere.
+
+logger = logging.getLogger(__name__)
+
+ENABLED: bool = Config.METRICS_PORT > 0
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Counter:
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Histogram:
+
+    def __init__(self, name: str, description: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по корзинам (+Inf последней), сумма, количество]
+        self._values: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(_label_key(labels))
+        return entry[2] if entry else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', le))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+_registry: Dict[str, Any] = {}
+_registry_lock = threading.Lock()
+
+def counter(name: str, description: str) -> Counter:
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Counter(name, description)
+        return _registry[name]
+
+def histogram(name: str, description: str, buckets=LATENCY_BUCKETS) -> Histogram:
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Histogram(name, description, buckets)
+        return _registry[name]
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+# Redis calls: total per command, and per timed() scope (how many calls one mention or job made)
+
+REDIS_CALLS = counter("redis_calls_total", "Redis round trips (commands outside pipelines and pipeline executes)")
+REDIS_ERRORS = counter("redis_errors_total", "Redis round trips that raised")
+_scopes: contextvars.ContextVar[Tuple[list, ...]] = contextvars.ContextVar("metric_scopes", default=())
+
+def count_redis_call(command: str, failed: bool = False) -> None:
+    REDIS_CALLS.inc(command=command)
+    if failed:
+        REDIS_ERRORS.inc(command=command)
+    for cell in _scopes.get():
+        cell[0] += 1
+
+def timed(metric: str, **labels) -> Callable[[Callable], Callable]:
+    #Декоратор: <metric>_duration_seconds, <metric>_errors_total и <metric>_redis_calls (запросы к Redis за вызов).
+    #Без METRICS_PORT возвращает функцию без обёртки
+    if not ENABLED:
+        return lambda func: func
+
+    durations = histogram(f"{metric}_duration_seconds", f"Duration of {metric} calls")
+    errors = counter(f"{metric}_errors_total", f"{metric} calls that raised")
+    redis_calls = histogram(f"{metric}_redis_calls", f"Redis round trips per {metric} call", COUNT_BUCKETS)
+
+    def enter():
+        cell = [0]
+        return cell, _scopes.set(_scopes.get() + (cell,)), time.perf_counter()
+
+    def leave(cell, token, started, failed):
+        durations.observe(time.perf_counter() - started, **labels)
+        redis_calls.observe(cell[0], **labels)
+        if failed:
+            errors.inc(**labels)
+        _scopes.reset(token)
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                cell, token, started = enter()
+                failed = True
+                try:
+                    result = await func(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    leave(cell, token, started, failed)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cell, token, started = enter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                leave(cell, token, started, failed)
+        return wrapper
+
+    return decorator
+
+# Slack Web API calls
+
+SLACK_CALLS = counter("slack_api_calls_total", "Slack Web API calls by method and result")
+SLACK_DURATION = histogram("slack_api_duration_seconds", "Slack Web API call duration (including client retries)")
+
+def _slack_status(error: Exception) -> str:
+    if isinstance(error, SlackApiError):
+        if error.response.status_code == 429:
+            return "ratelimited"
+        return error.response.get("error", "error")
+    return "exception"
+
+def instrument_slack_client(client):
+    #Считать вызовы WebClient / AsyncWebClient (все методы идут через api_call)
+    if not ENABLED or getattr(client, "_metrics_instrumented", False):
+        return client
+    api_call = client.api_call
+
+    def record(method, started, status):
+        SLACK_DURATION.observe(time.perf_counter() - started, method=method)
+        SLACK_CALLS.inc(method=method, status=status)
+
+    if asyncio.iscoroutinefunction(api_call):
+        async def timed_api_call(api_method, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                response = await api_call(api_method, *args, **kwargs)
+            except Exception as e:
+                record(api_method, started, _slack_status(e))
+                raise
+            record(api_method, started, "ok")
+            return response
+    else:
+        def timed_api_call(api_method, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                response = api_call(api_method, *args, **kwargs)
+            except Exception as e:
+                record(api_method, started, _slack_status(e))
+                raise
+            record(api_method, started, "ok")
+            return response
+
+    client.api_call = timed_api_call
+    client._metrics_instrumented = True
+    return client
+
+# HTTP endpoint
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        data = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def start_http_server(port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    #Поднять /metrics фоновым потоком (если метрики включены)
+    if not ENABLED:
+        return None
+    port = port or Config.METRICS_PORT
+    server = ThreadingHTTPServer((Config.METRICS_HOST, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics endpoint on http://{Config.METRICS_HOST}:{port}/metrics")
+    return server
@@ -0,0 +1,40 @@
+import argparse
+import sys
+
+from config import Config
+import redis_bot
+from tenants import load_tenants, use_tenant
+
+# One-shot migration of task_base / employees from single JSON blobs to hashes of
+# records (tasks, employee_records, task_assignments), for every tenant.
+#
+#   1. deploy the new code with WRITE_LEGACY_BLOBS=1 (default): it reads the blobs
+#      until a collection is migrated and keeps writing them for old processes;
+#   2. python migrate_layout.py
+#   3. once no old processes are left: WRITE_LEGACY_BLOBS=0, then
+#      python migrate_layout.py --drop-legacy
+
+logger = Config.setup_logging()
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Move task base, employees and assignments to per-record hashes")
+    parser.add_argument("--tenant", action="append", help="only these tenant ids (repeatable)")
+    parser.add_argument("--drop-legacy", action="store_true",
+                        help="delete the old task_base / employees blobs afterwards (needs WRITE_LEGACY_BLOBS=0)")
+    args = parser.parse_args(argv)
+    if args.drop_legacy and Config.WRITE_LEGACY_BLOBS:
+        sys.exit("Set WRITE_LEGACY_BLOBS=0 before --drop-legacy, or the next write recreates the blobs")
+
+    tenants = [tenant for tenant in load_tenants() if not args.tenant or tenant.id in args.tenant]
+    if not tenants:
+        sys.exit(f"No tenants match {args.tenant}")
+
+    for tenant in tenants:
+        with use_tenant(tenant):
+            moved = redis_bot.migrate_to_records(drop_legacy=args.drop_legacy)
+        for collection, count in moved.items():
+            status = "already migrated" if count is None else f"{count} records"
+            print(f"{tenant.id:<16} {collection:<20} {status}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,386 @@
+import datetime
+import logging
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple, Type, TypeVar, Union
+
+from config import Config
+from shift_calendar import Rotation, ShiftCalendar, format_day, parse_day
+
+# Domain objects built once per stored version (see redis_bot.RecordCollection):
+# deadlines are parsed to datetime.time and weekdays to a frozenset when a record
+# is loaded, and a record that does not validate is rejected (logged and skipped)
+# right there instead of failing later in rendering or reminders.
+# to_record() gives back the stored form, unknown fields included.
+# Employee shifts are bitmaps per period and year (shift_calendar.py).
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+PERIODS = ("morning", "evening")
+
+class ModelError(ValueError):
+    #Запись не прошла проверку
+    pass
+
+def parse_deadline(value: Any) -> Optional[datetime.time]:
+    #"HH:MM" -> time; пустой дедлайн -> None; всё остальное — ошибка
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise ModelError(f"deadline must be 'HH:MM', got {value!r}")
+    try:
+        hour, minute = map(int, value.split(":"))
+        return datetime.time(hour=hour, minute=minute)
+    except ValueError:
+        raise ModelError(f"deadline must be 'HH:MM', got {value!r}")
+
+def parse_days(value: Any) -> Optional[FrozenSet[int]]:
+    #"all" или отсутствие -> None (каждый день); список названий дней -> frozenset номеров (0 — понедельник)
+    if value is None or value == "all":
+        return None
+    if isinstance(value, str) or not isinstance(value, (list, tuple)):
+        raise ModelError(f"days must be 'all' or a list of weekday names, got {value!r}")
+    try:
+        return frozenset(WEEKDAYS.index(day.capitalize()) for day in value)
+    except (AttributeError, ValueError):
+        raise ModelError(f"unknown weekday in {value!r}")
+
+def _text(data: Mapping[str, Any], field: str, required: bool = False) -> str:
+    value = data.get(field, "")
+    if value is None:
+        value = ""
+    if not isinstance(value, str):
+        raise ModelError(f"{field} must be a string, got {value!r}")
+    if required and not value.strip():
+        raise ModelError(f"{field} is required")
+    return value
+
+def parse_shift_date(value: Any) -> str:
+    #"dd/mm" (каждый год) или "YYYY-MM-DD" -> та же дата в каноническом виде ("5/1" -> "05/01")
+    try:
+        return format_day(*parse_day(value))
+    except (TypeError, ValueError):
+        raise ModelError(f"bad date {value!r}, expected 'dd/mm' or 'YYYY-MM-DD'")
+
+def _dates(data: Mapping[str, Any], field: str) -> Tuple[str, ...]:
+    value = data.get(field) or ()
+    if isinstance(value, str) or not isinstance(value, (list, tuple)):
+        raise ModelError(f"{field} must be a list of 'dd/mm' dates, got {value!r}")
+    try:
+        return tuple(parse_shift_date(date_str) for date_str in value)
+    except ModelError as e:
+        raise ModelError(f"{field}: {e}")
+
+def _calendar(data: Mapping[str, Any]) -> ShiftCalendar:
+    #Смены из записи: битовые карты (shift_bitmaps) и ротации; в старых записях (и при импорте) —
+    #списки дат. Рядом с картами списки — лишь копия для старых версий бота, они не читаются
+    rotations = data.get("rotations") or []
+    if not isinstance(rotations, list):
+        raise ModelError(f"rotations must be a list, got {rotations!r}")
+    try:
+        rotations = [Rotation.from_record(rotation) for rotation in rotations]
+        for rotation in rotations:
+            if rotation.period not in PERIODS:
+                raise ModelError(f"rotation period must be one of {PERIODS}, got {rotation.period!r}")
+        packed = data.get("shift_bitmaps") or {}
+        if not isinstance(packed, Mapping) or not set(packed) <= set(PERIODS):
+            raise ModelError(f"shift_bitmaps must map {PERIODS} to years, got {packed!r}")
+        calendar = ShiftCalendar.from_packed(packed, rotations)
+    except ValueError as e:
+        raise ModelError(str(e))
+    if "shift_bitmaps" in data:
+        return calendar
+    return ShiftCalendar.from_dates({period: _dates(data, f"{period}_dates") for period in PERIODS}, rotations)
+
+class Task:
+    __slots__ = ("id", "name", "key", "deadline", "deadline_text", "period", "days",
+                 "asana_url", "comments", "extra")
+
+    FIELDS = ("name", "deadline", "period", "days", "asana_url", "comments")
+
+    def __init__(self, task_id: str, name: str, deadline: Optional[datetime.time] = None,
+                 period: str = "", days: Optional[FrozenSet[int]] = None, asana_url: str = "",
+                 comments: str = "", extra: Optional[Dict[str, Any]] = None):
+        self.id = task_id
+        self.name = name
+        self.key = name.upper()  # названия сравниваются без учёта регистра
+        self.deadline = deadline
+        self.deadline_text = deadline.strftime("%H:%M") if deadline else ""
+        self.period = period
+        self.days = days
+        self.asana_url = asana_url
+        self.comments = comments
+        self.extra = extra
+
+    @classmethod
+    def from_record(cls, task_id: str, data: Mapping[str, Any]) -> "Task":
+        if not isinstance(data, Mapping):
+            raise ModelError(f"task {task_id}: record must be an object, got {data!r}")
+        period = _text(data, "period")
+        if period and period not in PERIODS:
+            raise ModelError(f"task {task_id}: unknown period {period!r}")
+        try:
+            return cls(
+                task_id,
+                _text(data, "name", required=True),
+                deadline=parse_deadline(data.get("deadline")),
+                period=period,
+                days=parse_days(data.get("days")),
+                asana_url=_text(data, "asana_url"),
+                comments=_text(data, "comments"),
+                extra={k: v for k, v in data.items() if k not in cls.FIELDS and k != "id"} or None,
+            )
+        except ModelError as e:
+            raise ModelError(f"task {task_id}: {e}")
+
+    def to_record(self) -> Dict[str, Any]:
+        record: Dict[str, Any] = dict(self.extra or {})
+        record["name"] = self.name
+        for field, value in (("deadline", self.deadline_text), ("period", self.period),
+                             ("asana_url", self.asana_url), ("comments", self.comments)):
+            if value:
+                record[field] = value
+        if self.days is not None:
+            record["days"] = [WEEKDAYS[day] for day in sorted(self.days)]
+        return record
+
+    def runs_on(self, weekday: int) -> bool:
+        return self.days is None or weekday in self.days
+
+    def __repr__(self) -> str:
+        return f"Task({self.id!r}, {self.name!r}, deadline={self.deadline_text or None})"
+
+class Employee:
+    __slots__ = ("id", "name", "slack_id", "username", "calendar", "extra")
+
+    FIELDS = ("name", "slack_id", "username", "morning_dates", "evening_dates", "shift_bitmaps", "rotations")
+
+    def __init__(self, emp_id: str, name: str = "", slack_id: str = "", username: str = "",
+                 morning_dates: Iterable[str] = (), evening_dates: Iterable[str] = (),
+                 extra: Optional[Dict[str, Any]] = None, rotations: Iterable[Rotation] = (),
+                 calendar: Optional[ShiftCalendar] = None):
+        self.id = emp_id
+        self.name = name
+        self.slack_id = slack_id
+        self.username = username
+        if calendar is None:
+            calendar = ShiftCalendar.from_dates({"morning": morning_dates, "evening": evening_dates}, rotations)
+        self.calendar = calendar
+        self.extra = extra
+
+    @classmethod
+    def from_record(cls, emp_id: str, data: Mapping[str, Any]) -> "Employee":
+        if not isinstance(data, Mapping):
+            raise ModelError(f"employee {emp_id}: record must be an object, got {data!r}")
+        try:
+            return cls(
+                emp_id,
+                name=_text(data, "name"),
+                slack_id=_text(data, "slack_id"),
+                username=_text(data, "username"),
+                extra={k: v for k, v in data.items() if k not in cls.FIELDS} or None,
+                calendar=_calendar(data),
+            )
+        except ModelError as e:
+            raise ModelError(f"employee {emp_id}: {e}")
+
+    def to_record(self) -> Dict[str, Any]:
+        record: Dict[str, Any] = dict(self.extra or {})
+        record.update(name=self.name, slack_id=self.slack_id, username=self.username)
+        packed = self.calendar.packed()
+        if packed or self.calendar.rotations:
+            record["shift_bitmaps"] = packed
+        if self.calendar.rotations:
+            record["rotations"] = [rotation.to_record() for rotation in self.calendar.rotations]
+        if Config.WRITE_SHIFT_DATE_LISTS:
+            # Старые версии знают только "dd/mm": им даты этого года с развёрнутыми ротациями
+            year = datetime.date.today().year
+            for period in PERIODS:
+                dates = self.calendar.legacy_dates(period, year)
+                if dates:
+                    record[f"{period}_dates"] = list(dates)
+        return record
+
+    def dates(self, period: str) -> Tuple[str, ...]:
+        #Явно заданные даты смен периода (без ротаций)
+        return self.calendar.dates(period)
+
+    @property
+    def morning_dates(self) -> Tuple[str, ...]:
+        return self.calendar.dates("morning")
+
+    @property
+    def evening_dates(self) -> Tuple[str, ...]:
+        return self.calendar.dates("evening")
+
+    def on_shift(self, date: datetime.date, period: str) -> bool:
+        return self.calendar.is_on(date, period)
+
+    def mention(self) -> str:
+        # Без slack_id упоминаем по имени
+        return f"<@{self.slack_id}>" if self.slack_id else (self.name or "Unknown")
+
+    def __repr__(self) -> str:
+        return f"Employee({self.id!r}, {self.name!r})"
+
+class Assignment:
+    #Назначение задачи (НАЗВАНИЕ) пользователю; хранится как slack id
+    __slots__ = ("task_key", "slack_id")
+
+    def __init__(self, task_key: str, slack_id: str):
+        self.task_key = task_key
+        self.slack_id = slack_id
+
+    @classmethod
+    def from_record(cls, task_key: str, data: Any) -> "Assignment":
+        if not isinstance(data, str) or not data:
+            raise ModelError(f"assignment {task_key}: slack id must be a non-empty string, got {data!r}")
+        return cls(task_key.upper(), data)
+
+    def to_record(self) -> str:
+        return self.slack_id
+
+    def __repr__(self) -> str:
+        return f"Assignment({self.task_key!r}, {self.slack_id!r})"
+
+class DayState:
+    #Состояние дня: дата (ISO), тред утреннего сообщения; completed — старый формат до миграции в хэш
+    __slots__ = ("date", "thread_ts", "completed", "extra")
+
+    def __init__(self, date: Optional[str] = None, thread_ts: Optional[str] = None,
+                 completed: Optional[Dict[str, Any]] = None, extra: Optional[Dict[str, Any]] = None):
+        self.date = date
+        self.thread_ts = thread_ts
+        self.completed = completed
+        self.extra = extra
+
+    @classmethod
+    def from_record(cls, data: Optional[Mapping[str, Any]]) -> "DayState":
+        if not data:
+            return cls()
+        if not isinstance(data, Mapping):
+            raise ModelError(f"state must be an object, got {data!r}")
+        date = data.get("date")
+        if date is not None:
+            try:
+                datetime.date.fromisoformat(date)
+            except (TypeError, ValueError):
+                raise ModelError(f"state date must be YYYY-MM-DD, got {date!r}")
+        thread_ts = data.get("thread_ts")
+        if thread_ts is not None and not isinstance(thread_ts, str):
+            raise ModelError(f"thread_ts must be a string, got {thread_ts!r}")
+        completed = data.get("completed")
+        if completed is not None and not isinstance(completed, Mapping):
+            raise ModelError(f"completed must be an object, got {completed!r}")
+        extra = {k: v for k, v in data.items() if k not in ("date", "thread_ts", "completed")}
+        return cls(date, thread_ts, dict(completed) if completed is not None else None, extra or None)
+
+    def to_record(self) -> Dict[str, Any]:
+        record: Dict[str, Any] = dict(self.extra or {})
+        if self.date is not None:
+            record["date"] = self.date
+        if self.thread_ts is not None:
+            record["thread_ts"] = self.thread_ts
+        if self.completed is not None:
+            record["completed"] = self.completed
+        return record
+
+    def __repr__(self) -> str:
+        return f"DayState(date={self.date!r}, thread_ts={self.thread_ts!r})"
+
+class DailyPlan:
+    #План дня, записанный утренним постом: задачи дня в порядке вывода (без группы, утро, вечер,
+    #внутри — по дедлайну), назначения (НАЗВАНИЕ -> slack id) и кто на смене (без дат смен)
+    __slots__ = ("date", "day_name", "tasks", "assignees", "shifts")
+
+    FORMAT = 1
+
+    def __init__(self, date: str, day_name: str, tasks: List[Task], assignees: Optional[Dict[str, str]] = None,
+                 shifts: Optional[Dict[str, List[Employee]]] = None):
+        self.date = date
+        self.day_name = day_name
+        self.tasks = tasks
+        self.assignees = assignees or {}
+        self.shifts = shifts or {}
+
+    @classmethod
+    def from_record(cls, data: Any) -> "DailyPlan":
+        if not isinstance(data, Mapping):
+            raise ModelError(f"plan must be an object, got {data!r}")
+        if data.get("v") != cls.FORMAT:
+            raise ModelError(f"unknown plan format {data.get('v')!r}")
+        date, day_name = data.get("date"), data.get("day")
+        try:
+            datetime.date.fromisoformat(date)
+        except (TypeError, ValueError):
+            raise ModelError(f"plan date must be YYYY-MM-DD, got {date!r}")
+        if day_name not in WEEKDAYS:
+            raise ModelError(f"plan day must be a weekday name, got {day_name!r}")
+        shift_records, assignees = data.get("shifts") or {}, data.get("assignees") or {}
+        if not isinstance(shift_records, Mapping) or not isinstance(assignees, Mapping):
+            raise ModelError("plan shifts and assignees must be objects")
+        tasks = [Task.from_record(str(record.get("id", "")), record) for record in _plan_items(data, "tasks")]
+        shifts = {period: [Employee.from_record(str(record.get("id", "")),
+                                                {k: v for k, v in record.items() if k != "id"})
+                           for record in _plan_items(shift_records, period)] for period in PERIODS}
+        return cls(date, day_name, tasks, dict(assignees), shifts)
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "v": self.FORMAT,
+            "date": self.date,
+            "day": self.day_name,
+            "tasks": [{"id": task.id, **task.to_record()} for task in self.tasks],
+            "assignees": self.assignees,
+            "shifts": {period: [{"id": employee.id, **employee.to_record()} for employee in employees]
+                       for period, employees in self.shifts.items()},
+        }
+
+    def matches(self, date: str, day_name: str) -> bool:
+        return self.date == date and self.day_name == day_name
+
+    def group(self, period: str) -> List[Task]:
+        #Задачи одной группы ("" — без группы), порядок плана сохраняется
+        return [task for task in self.tasks if (task.period if task.period in PERIODS else "") == period]
+
+    def with_assignee(self, task_key: str, slack_id: Optional[str]) -> "DailyPlan":
+        #Копия плана с изменённым назначением (сам план может лежать в кэше — его не меняем)
+        assignees = dict(self.assignees)
+        if slack_id:
+            assignees[task_key] = slack_id
+        else:
+            assignees.pop(task_key, None)
+        return DailyPlan(self.date, self.day_name, self.tasks, assignees, self.shifts)
+
+    def __repr__(self) -> str:
+        return f"DailyPlan({self.date!r}, {self.day_name!r}, tasks={len(self.tasks)})"
+
+def _plan_items(data: Mapping[str, Any], field: str) -> List[Mapping[str, Any]]:
+    items = data.get(field) or []
+    if not isinstance(items, list) or not all(isinstance(item, Mapping) for item in items):
+        raise ModelError(f"plan {field} must be a list of objects, got {items!r}")
+    return items
+
+Model = TypeVar("Model", Task, Employee, Assignment)
+
+def parse_records(model: Type[Model], records: Mapping[str, Any]) -> Dict[str, Model]:
+    #Разобрать коллекцию при загрузке; неправильные записи отбрасываются с ошибкой в логе
+    parsed: Dict[str, Model] = {}
+    for record_id, data in records.items():
+        try:
+            parsed[record_id] = model.from_record(record_id, data)
+        except ModelError as e:
+            logger.error(f"Rejected {model.__name__.lower()} record: {e}")
+    return parsed
+
+def records_parser(model: Type[Model]) -> Callable[[Mapping[str, Any]], Dict[str, Model]]:
+    return lambda records: parse_records(model, records)
+
+def coerce(model: Type[Model], records: Mapping[str, Union[Model, Any]]) -> Dict[str, Model]:
+    #Привести вход save_* к моделям: готовые модели как есть, сырые записи — с проверкой (ModelError)
+    return {record_id: value if isinstance(value, model) else model.from_record(record_id, value)
+            for record_id, value in records.items()}
+
+def coerce_one(model: Type[Model], record_id: str, value: Union[Model, Any, None]) -> Optional[Model]:
+    if value is None or isinstance(value, model):
+        return value
+    return model.from_record(record_id, value)
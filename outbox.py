@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import redis
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
+
+from config import Config
+import metrics
+from redis_conn import r
+
+# Durable outbound queue for Slack writes.
+# Handlers call send(); with SLACK_OUTBOX_ENABLED the call is appended to a Redis
+# Stream and returns immediately, and OutboxWorker delivers it within Slack's
+# per-method rate limits, honouring Retry-After on 429.
+
+logger = logging.getLogger(__name__)
+
+# Ответы Slack, после которых повторять бессмысленно — считаем доставленным
+ALREADY_DONE_ERRORS = {"already_reacted", "no_reaction"}
+PERMANENT_ERRORS = {"channel_not_found", "not_in_channel", "is_archived", "message_not_found",
+                    "invalid_auth", "not_authed", "account_inactive", "msg_too_long", "invalid_name"}
+
+def create_slack_client(token: Optional[str] = None, retry_rate_limited: bool = True) -> WebClient:
+    #WebClient для прямых вызовов: сам ждёт Retry-After и повторяет запрос при 429.
+    #Воркеру очереди нужен клиент без этого (retry_rate_limited=False) — он сам ставит метод на паузу
+    client = WebClient(token=token or Config.SLACK_BOT_TOKEN, base_url=Config.SLACK_API_URL)
+    if retry_rate_limited:
+        client.retry_handlers.append(RateLimitErrorRetryHandler(max_retry_count=2))
+    return metrics.instrument_slack_client(client)
+
+def _dedupe_key(method: str, kwargs: Dict[str, Any]) -> Optional[str]:
+    #Одинаковые реакции на одно сообщение схлопываются в одну отправку
+    if method == "reactions_add":
+        return f"{Config.SLACK_OUTBOX}:dedupe:{kwargs.get('channel')}:{kwargs.get('timestamp')}:{kwargs.get('name')}"
+    return None
+
+def enqueue(method: str, **kwargs) -> Optional[str]:
+    #Поставить вызов Slack API в очередь; вернуть id записи (None — дубликат)
+    dedupe_key = _dedupe_key(method, kwargs)
+    if dedupe_key and not r.set(dedupe_key, 1, nx=True, ex=Config.SLACK_OUTBOX_DEDUPE_TTL):
+        logger.debug(f"Skipping duplicate {method}: {dedupe_key}")
+        return None
+
+    entry_id = r.xadd(
+        Config.SLACK_OUTBOX,
+        {"method": method, "args": json.dumps(kwargs), "attempt": 0},
+        maxlen=Config.SLACK_OUTBOX_MAXLEN,
+        approximate=True
+    )
+    return entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+
+def send(client, method: str, **kwargs) -> Optional[Any]:
+    #Отправить вызов через очередь (если включена) или сразу через client.
+    #Если Redis недоступен, отправляем напрямую — сообщение важнее очереди
+    if Config.SLACK_OUTBOX_ENABLED:
+        try:
+            enqueue(method, **kwargs)
+            return None
+        except redis.RedisError as e:
+            logger.error(f"Outbox unavailable, calling {method} directly: {e}")
+    return getattr(client, method)(**kwargs)
+
+class RateBucket:
+    #Token bucket: rate вызовов в секунду, запас до burst; pause() — для Retry-After
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def wait_time(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+class OutboxWorker:
+    #Читает очередь через consumer group; после сбоя процесса незавершённые записи
+    #забирает XAUTOCLAIM. Перед вызовом Slack запись занимается ключом sending:<id> (SET NX):
+    #если воркер упал между вызовом и XACK, забравший запись видит ключ и не повторяет вызов.
+    #То есть доставка не более одного раза: вызов, прерванный падением, может потеряться.
+
+    def __init__(self, client: WebClient, consumer: Optional[str] = None):
+        self.client = client
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.buckets: Dict[str, RateBucket] = {}
+        self.delivered = 0
+        self.retried = 0
+        self.dropped = 0
+        self.rate_limited = 0
+        self._stop = threading.Event()
+        self._group_ready = False
+
+    def _bucket(self, method: str) -> RateBucket:
+        if method not in self.buckets:
+            rate = Config.SLACK_RATE_LIMITS.get(method, Config.SLACK_RATE_LIMITS["default"])
+            self.buckets[method] = RateBucket(rate)
+        return self.buckets[method]
+
+    def _ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            r.xgroup_create(Config.SLACK_OUTBOX, Config.SLACK_OUTBOX_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def _sending_key(self, entry_id: str) -> str:
+        return f"{Config.SLACK_OUTBOX}:sending:{entry_id}"
+
+    def _claim(self, entry_id: str) -> bool:
+        #Занять запись перед вызовом Slack; False — её уже отправлял другой (упавший) воркер
+        return bool(r.set(self._sending_key(entry_id), self.consumer, nx=True, ex=Config.SLACK_OUTBOX_DEDUPE_TTL))
+
+    def _finish(self, entry_id: str) -> None:
+        pipe = r.pipeline()
+        pipe.delete(self._sending_key(entry_id))
+        pipe.xack(Config.SLACK_OUTBOX, Config.SLACK_OUTBOX_GROUP, entry_id)
+        pipe.xdel(Config.SLACK_OUTBOX, entry_id)
+        pipe.execute()
+
+    def _retry_later(self, entry_id: str, method: str, kwargs: Dict[str, Any], attempt: int, reason: str) -> None:
+        if attempt + 1 >= Config.SLACK_OUTBOX_MAX_ATTEMPTS:
+            self.dropped += 1
+            logger.error(f"Dropping {method} after {attempt + 1} attempts: {reason}")
+            self._finish(entry_id)
+            return
+
+        self.retried += 1
+        logger.warning(f"Retrying {method} later (attempt {attempt + 1}): {reason}")
+        pipe = r.pipeline()
+        pipe.xadd(Config.SLACK_OUTBOX, {"method": method, "args": json.dumps(kwargs), "attempt": attempt + 1})
+        pipe.delete(self._sending_key(entry_id))
+        pipe.xack(Config.SLACK_OUTBOX, Config.SLACK_OUTBOX_GROUP, entry_id)
+        pipe.xdel(Config.SLACK_OUTBOX, entry_id)
+        pipe.execute()
+
+    def deliver(self, entry_id: str, fields: Dict[bytes, bytes]) -> None:
+        method = fields[b"method"].decode()
+        kwargs = json.loads(fields[b"args"])
+        attempt = int(fields.get(b"attempt", 0))
+
+        bucket = self._bucket(method)
+        claimed = False
+        while True:
+            wait = bucket.wait_time()
+            if wait > 0:
+                if self._stop.wait(wait):
+                    if claimed:
+                        # Последний вызов получил 429 — Slack его не выполнил, запись можно отдать другому
+                        r.delete(self._sending_key(entry_id))
+                    return
+                continue
+            # Занимаем запись только перед самим вызовом: остановка во время ожидания её не теряет
+            if not claimed and not self._claim(entry_id):
+                # Воркер упал после (или во время) вызова Slack — повтор мог бы задвоить сообщение
+                self.dropped += 1
+                logger.warning(f"Not repeating {method} {entry_id}: a previous worker may have sent it")
+                self._finish(entry_id)
+                return
+            claimed = True
+            bucket.take()
+
+            try:
+                getattr(self.client, method)(**kwargs)
+            except SlackApiError as e:
+                if e.response.status_code == 429:
+                    # Ждём Retry-After и повторяем эту же запись (порядок сохраняется);
+                    # каждый 429 — попытка, после SLACK_OUTBOX_MAX_ATTEMPTS запись отбрасывается
+                    headers = {k.lower(): v for k, v in (e.response.headers or {}).items()}
+                    retry_after = float(headers.get("retry-after", 1))
+                    self.rate_limited += 1
+                    attempt += 1
+                    if attempt >= Config.SLACK_OUTBOX_MAX_ATTEMPTS:
+                        self.dropped += 1
+                        logger.error(f"Dropping {method} after {attempt} rate-limited attempts")
+                        self._finish(entry_id)
+                        return
+                    logger.warning(f"{method} rate limited, retrying in {retry_after}s (attempt {attempt})")
+                    bucket.pause(retry_after)
+                    continue
+
+                error = e.response.get("error", "")
+                if error in ALREADY_DONE_ERRORS:
+                    break
+                if error in PERMANENT_ERRORS:
+                    self.dropped += 1
+                    logger.error(f"Dropping {method}: {error}")
+                    self._finish(entry_id)
+                    return
+                self._retry_later(entry_id, method, kwargs, attempt, error)
+                return
+            except Exception as e:
+                self._retry_later(entry_id, method, kwargs, attempt, str(e))
+                return
+            break
+
+        self.delivered += 1
+        self._finish(entry_id)
+
+    def drain_once(self, block_ms: int = 1000) -> int:
+        #Обработать одну пачку записей (сначала зависшие у упавших воркеров); вернуть их число
+        self._ensure_group()
+        _, claimed, *_ = r.xautoclaim(
+            Config.SLACK_OUTBOX, Config.SLACK_OUTBOX_GROUP, self.consumer,
+            min_idle_time=Config.SLACK_OUTBOX_CLAIM_IDLE_MS, count=10
+        )
+        entries = [(entry_id, fields) for entry_id, fields in claimed if fields]
+        if not entries:
+            response = r.xreadgroup(
+                Config.SLACK_OUTBOX_GROUP, self.consumer, {Config.SLACK_OUTBOX: ">"},
+                count=10, block=block_ms
+            )
+            entries = response[0][1] if response else []
+
+        for entry_id, fields in entries:
+            if self._stop.is_set():
+                break
+            entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+            self.deliver(entry_id, fields)
+        return len(entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {"delivered": self.delivered, "retried": self.retried,
+                "dropped": self.dropped, "rate_limited": self.rate_limited}
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run_forever(self) -> None:
+        logger.info(f"Outbox worker {self.consumer} started")
+        while not self._stop.is_set():
+            try:
+                self.drain_once()
+            except redis.RedisError as e:
+                logger.error(f"Outbox worker Redis error: {e}")
+                self._stop.wait(1)
+
+def start_worker_thread(token: Optional[str] = None) -> Optional[OutboxWorker]:
+    #Запустить воркер фоновым потоком, если очередь включена
+    if not Config.SLACK_OUTBOX_ENABLED:
+        return None
+    worker = OutboxWorker(create_slack_client(token, retry_rate_limited=False))
+    threading.Thread(target=worker.run_forever, name="slack-outbox", daemon=True).start()
+    return worker
+
+if __name__ == "__main__":
+    Config.setup_logging()
+    OutboxWorker(create_slack_client(retry_rate_limited=False)).run_forever()
@@ -1,144 +1,904 @@
-import json
 import datetime
+import time
+import uuid
 import redis
-import re
 import logging
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Callable, Dict, List, Optional, Set, Tuple, Any
+import bot_logic
+import codec
+import metrics
+from bot_logic import ALREADY_MARKED_MESSAGE
+from completion_log import append_completions
 from config import Config
+from deadline_timeline import DeadlineTimeline
+import models
+from models import Assignment, DailyPlan, DayState, Employee, Task
+from redis_conn import r
+from task_matcher import TaskMatcher
+from tenants import tenant_key
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Redis connection with error handling
-try:
-    r = redis.Redis.from_url(Config.REDIS_URL)
-    # Test connection
-    r.ping()
-    logger.info("Successfully connected to Redis")
-except redis.ConnectionError as e:
-    logger.error(f"Failed to connect to Redis: {e}")
-    raise
-except Exception as e:
-    logger.error(f"Unexpected error connecting to Redis: {e}")
-    raise
-
-def load_state(debug_mode: bool = False) -> Dict[str, Any]:
+class VersionedCache:
+    #In-process cache of decoded Redis values.
+    #Every save_* bumps the key's counter in the DATA_VERSIONS hash, so a cached
+    #value is reused while its version is unchanged and it is younger than ttl
+    #(the ttl catches writes made around the bot that don't bump the version).
+    #Cached objects are shared between callers: whoever mutates one must save it.
+    #parse turns the decoded value into what is cached (models), once per version.
+
+    def __init__(self, ttl: float, decode: Callable[[bytes], Any] = codec.decode):
+        self.ttl = ttl
+        self.decode = decode
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        # key -> (version, fetched_at, value, derived values built from value)
+        self._entries: Dict[str, Tuple[int, float, Any, Dict[str, Any]]] = {}
+
+    def _fresh(self, key: str, version: int) -> Optional[Tuple[int, float, Any, Dict[str, Any]]]:
+        #Запись кэша, если её версия совпадает и она не старше ttl
+        entry = self._entries.get(key)
+        if entry and entry[0] == version and time.monotonic() - entry[1] < self.ttl:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def _store(self, key: str, data: Any, version, hashed: bool = False,
+               parse: Optional[Callable[[Any], Any]] = None) -> Any:
+        value = self._decode(data, version, hashed)
+        if parse and value is not None:
+            value = parse(value)
+        self.put(key, value, int(version or 0))
+        return value
+
+    def _decode(self, data: Any, version, hashed: bool) -> Any:
+        if not hashed:
+            return self.decode(data) if data else None
+        if data:
+            return {field.decode(): self.decode(value) for field, value in data.items()}
+        # Пустой хэш с версией — коллекция записана и пуста; без версии — её ещё не записывали
+        return {} if int(version or 0) else None
+
+    def _stale(self, key: str, error: Exception) -> Any:
+        #Redis недоступен: отдать последнее известное значение или пробросить ошибку
+        entry = self._entries.get(key)
+        if entry is None:
+            raise error
+        self.stale_served += 1
+        logger.warning(f"Redis unavailable, serving last known {key}: {error}")
+        return entry[2]
+
+    def _absorb(self, keys: List[str], versions: List[Any], raw: List[Any], hashed=frozenset(),
+                parsers: Optional[Dict[str, Callable[[Any], Any]]] = None) -> Dict[str, Any]:
+        #Разобрать ответ get_many: значения с неизменившейся версией берём из памяти
+        parsers = parsers or {}
+        values = {}
+        for key, version, data in zip(keys, versions, raw):
+            entry = self._fresh(key, int(version or 0))
+            values[key] = entry[2] if entry else self._store(key, data, version, key in hashed, parsers.get(key))
+        return values
+
+    @staticmethod
+    def _queue_reads(pipe, keys: List[str], hashed) -> None:
+        #Чтение значений: один MGET для строк и HGETALL для каждого хэша
+        blob_keys = [key for key in keys if key not in hashed]
+        if blob_keys:
+            pipe.mget(blob_keys)
+        for key in keys:
+            if key in hashed:
+                pipe.hgetall(key)
+
+    @staticmethod
+    def _split_reads(keys: List[str], hashed, results: List[Any]) -> Tuple[List[Any], List[Any]]:
+        #Разложить ответы _queue_reads по ключам; вернуть (значения по ключам, остальные ответы)
+        blob_count = sum(1 for key in keys if key not in hashed)
+        offset = 1 if blob_count else 0
+        blobs = iter(results[0] if blob_count else [])
+        hashes = iter(results[offset:])
+        raw = [next(hashes) if key in hashed else next(blobs) for key in keys]
+        return raw, results[offset + len(keys) - blob_count:]
+
+    def get(self, key: str, hashed: bool = False, parse: Optional[Callable[[Any], Any]] = None) -> Any:
+        #Вернуть значение ключа: из памяти, если версия не изменилась, иначе из Redis.
+        #hashed — ключ является хэшем записей (значение — dict поле -> запись).
+        #Если Redis недоступен, отдаём последнее известное значение (если оно есть)
+        try:
+            entry = self._fresh(key, int(r.hget(Config.DATA_VERSIONS, key) or 0))
+            if entry:
+                return entry[2]
+
+            # Значение и версию читаем в одной транзакции, чтобы они соответствовали друг другу
+            pipe = r.pipeline()
+            if hashed:
+                pipe.hgetall(key)
+            else:
+                pipe.get(key)
+            pipe.hget(Config.DATA_VERSIONS, key)
+            data, version = pipe.execute()
+        except redis.RedisError as e:
+            return self._stale(key, e)
+
+        return self._store(key, data, version, hashed, parse)
+
+    def get_many(self, keys: List[str], extra: Optional[Callable[[Any], None]] = None,
+                 hashed=frozenset(), parsers: Optional[Dict[str, Callable[[Any], Any]]] = None
+                 ) -> Tuple[Dict[str, Any], List[Any]]:
+        #Прочитать несколько ключей за один запрос к Redis (версии и значения в одной транзакции).
+        #Значения с неизменившейся версией не декодируются заново; extra добавляет свои команды,
+        #их результаты возвращаются вторым элементом.
+        pipe = r.pipeline()
+        pipe.hmget(Config.DATA_VERSIONS, keys)
+        self._queue_reads(pipe, keys, hashed)
+        if extra:
+            extra(pipe)
+        versions, *results = pipe.execute()
+        raw, extra_results = self._split_reads(keys, hashed, results)
+        return self._absorb(keys, versions, raw, hashed, parsers), extra_results
+
+    def derive(self, key: str, name: str, build: Callable[[Any], Any], hashed: bool = False,
+               parse: Optional[Callable[[Any], Any]] = None) -> Any:
+        #Вернуть объект, построенный из значения ключа; перестраивается при смене версии
+        self.get(key, hashed, parse)
+        return self.derive_current(key, name, build)
+
+    def derive_current(self, key: str, name: str, build: Callable[[Any], Any]) -> Any:
+        #То же, что derive, но без проверки версии (ключ только что прочитан через get/get_many)
+        entry = self._entries.get(key)
+        if entry is None:
+            return build(None)
+        derived = entry[3]
+        if name not in derived:
+            derived[name] = build(entry[2])
+        return derived[name]
+
+    def put(self, key: str, value: Any, version: int) -> None:
+        self._entries[key] = (version, time.monotonic(), value, {})
+
+    def patch(self, key: str, version: int, field: str, value: Any) -> None:
+        #Одна запись хэша изменена (value=None — удалена) и версия стала version.
+        #Если в памяти предыдущая версия — обновляем копию без повторного чтения, иначе забываем
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version - 1 or entry[2] is None:
+            self.invalidate(key)
+            return
+        records = dict(entry[2])
+        if value is None:
+            records.pop(field, None)
+        else:
+            records[field] = value
+        self.put(key, records, version)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_served": self.stale_served,
+            "entries": len(self._entries)
+        }
+
+cache = VersionedCache(ttl=Config.CACHE_TTL_SECONDS)
+
+def _save_blob(key: str, value: Any, extra: Optional[Callable[[Any], None]] = None, cached: Any = None) -> None:
+    #Записать JSON-значение и поднять его версию одной транзакцией
+    #(extra добавляет в ту же транзакцию свои команды; cached — что положить в кэш вместо value)
+    try:
+        pipe = r.pipeline()
+        pipe.set(key, codec.encode(value))
+        pipe.hincrby(Config.DATA_VERSIONS, key, 1)
+        if extra:
+            extra(pipe)
+        version = pipe.execute()[1]
+    except Exception:
+        # Объект мог быть изменён вызывающим кодом, в кэше ему больше не место
+        cache.invalidate(key)
+        raise
+    cache.put(key, value if cached is None else cached, version)
+
+#Records: task base, employees and assignments as hashes of JSON records.
+#Until a collection has been written in this layout (its hash has no version) it is
+#read from the old blob; while WRITE_LEGACY_BLOBS is on every write updates the blob too.
+
+class RecordCollection:
+    #Коллекция записей: хэш hash_name и её же представление внутри старого блоба blob_name.
+    #Записи отдаются моделями model, разобранными один раз на версию
+
+    def __init__(self, hash_name: str, blob_name: str, from_blob: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 model: type):
+        self.hash_name = hash_name
+        self.blob_name = blob_name
+        self.from_blob = from_blob
+        self.model = model
+        self.parse = models.records_parser(model)
+
+    @property
+    def key(self) -> str:
+        return tenant_key(self.hash_name)
+
+    @property
+    def blob_key(self) -> str:
+        return tenant_key(self.blob_name)
+
+    def records_from_blob(self, blob_key: str) -> Dict[str, Any]:
+        # Блоб уже прочитан в кэш; выделенные из него записи живут рядом с ним
+        return cache.derive_current(blob_key, f"records:{self.hash_name}",
+                                    lambda blob: self.parse(self.from_blob(blob or {})))
+
+    def load(self) -> Tuple[Optional[Dict[str, Any]], str]:
+        #Все записи и ключ кэша, из которого они взяты (None — коллекции нет ни в каком виде)
+        key = self.key
+        records = cache.get(key, hashed=True, parse=self.parse)
+        if records is not None:
+            return records, key
+        blob_key = self.blob_key
+        if cache.get(blob_key) is None:
+            return None, blob_key
+        return self.records_from_blob(blob_key), blob_key
+
+    def derive(self, name: str, build: Callable[[Dict[str, Any]], Any]) -> Any:
+        #Объект, построенный из записей (один раз на версию хэша или блоба)
+        records, key = self.load()
+        return cache.derive_current(key, name, lambda _: build(records or {}))
+
+    def get(self, ids: List[str]) -> Dict[str, Any]:
+        #Прочитать только нужные записи (HMGET); до миграции — из старого блоба
+        key = self.key
+        pipe = r.pipeline()
+        pipe.hget(Config.DATA_VERSIONS, key)
+        pipe.hmget(key, ids)
+        version, values = pipe.execute()
+        if not int(version or 0):
+            records = self.load()[0] or {}
+            return {record_id: records[record_id] for record_id in ids if record_id in records}
+        return self.parse({record_id: codec.decode(value) for record_id, value in zip(ids, values) if value is not None})
+
+def _legacy_employees_blob(blob: Dict[str, Any]) -> Dict[str, Any]:
+    # В старом формате назначения лежат внутри employees под видом сотрудника
+    return {emp_id: emp_data for emp_id, emp_data in blob.items() if emp_id != "task_assignments"}
+
+TASK_RECORDS = RecordCollection(Config.TASKS, Config.TASK_BASE, lambda blob: blob, Task)
+EMPLOYEE_RECORDS = RecordCollection(Config.EMPLOYEE_RECORDS, Config.EMPLOYEES, _legacy_employees_blob, Employee)
+ASSIGNMENT_RECORDS = RecordCollection(Config.TASK_ASSIGNMENTS, Config.EMPLOYEES,
+                                      lambda blob: blob.get("task_assignments", {}), Assignment)
+
+def _queue_collection_write(pipe, collection: RecordCollection, records: Dict[str, Any],
+                            legacy: Optional[Callable[[], Any]] = None) -> Any:
+    #Заменить коллекцию целиком (внутри транзакции). HINCRBY версий идут первыми, их ответы —
+    #новые версии: [хэш] или [хэш, блоб]. legacy строит значение старого блоба (None — блоб не трогать)
+    pipe.hincrby(Config.DATA_VERSIONS, collection.key, 1)
+    legacy_value = None
+    if legacy and Config.WRITE_LEGACY_BLOBS:
+        legacy_value = legacy()
+        pipe.hincrby(Config.DATA_VERSIONS, collection.blob_key, 1)
+        pipe.set(collection.blob_key, codec.encode(legacy_value))
+    pipe.delete(collection.key)
+    if records:
+        pipe.hset(collection.key, mapping={record_id: codec.encode(record.to_record())
+                                           for record_id, record in records.items()})
+    return legacy_value
+
+def _queue_record_write(pipe, collection: RecordCollection, record_id: str, record: Any,
+                        legacy: Optional[Callable[[], Any]] = None) -> Any:
+    #Изменить одну запись (record=None — удалить); порядок ответов как у _queue_collection_write
+    pipe.hincrby(Config.DATA_VERSIONS, collection.key, 1)
+    legacy_value = None
+    if legacy and Config.WRITE_LEGACY_BLOBS:
+        legacy_value = legacy()
+        pipe.hincrby(Config.DATA_VERSIONS, collection.blob_key, 1)
+        pipe.set(collection.blob_key, codec.encode(legacy_value))
+    if record is None:
+        pipe.hdel(collection.key, record_id)
+    else:
+        pipe.hset(collection.key, record_id, codec.encode(record.to_record()))
+    return legacy_value
+
+def _cache_legacy(collection: RecordCollection, legacy_value: Any, versions: List[Any]) -> None:
+    if legacy_value is not None:
+        cache.put(collection.blob_key, legacy_value, versions[1])
+
+def _with_record(records: Dict[str, Any], record_id: str, record: Any) -> Dict[str, Any]:
+    records = dict(records)
+    if record is None:
+        records.pop(record_id, None)
+    else:
+        records[record_id] = record
+    return records
+
+def _records(values: Dict[str, Any]) -> Dict[str, Any]:
+    #Модели -> записи для хранения
+    return {record_id: value.to_record() for record_id, value in values.items()}
+
+def _legacy_employees(employees: Dict[str, Employee], assignments: Dict[str, Assignment]) -> Dict[str, Any]:
+    return {**_records(employees), "task_assignments": _records(assignments)}
+
+def _migrate_collection(collection: RecordCollection) -> Optional[int]:
+    #Перенести записи из старого блоба в хэш; None — коллекция уже в новом формате.
+    #WATCH на блоб: если его перепишет процесс со старым кодом, перенос повторяется
+    with r.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(collection.blob_key, collection.key)
+                if int(pipe.hget(Config.DATA_VERSIONS, collection.key) or 0):
+                    return None
+                raw = pipe.get(collection.blob_key)
+                # Записи, не прошедшие проверку, не переносятся (они остаются в блобе до --drop-legacy)
+                records = collection.parse(collection.from_blob(codec.decode(raw) if raw else {}))
+                pipe.multi()
+                _queue_collection_write(pipe, collection, records)
+                pipe.execute()
+                return len(records)
+            except redis.WatchError:
+                logger.info(f"{collection.blob_key} changed during migration, retrying")
+
+def migrate_to_records(drop_legacy: bool = False) -> Dict[str, Optional[int]]:
+    #Разовая миграция текущего тенанта на хэши записей: {коллекция: перенесено записей}.
+    #drop_legacy удаляет старые блобы — только когда WRITE_LEGACY_BLOBS выключен
+    #и ни один процесс со старым кодом их уже не читает
+    collections = (TASK_RECORDS, EMPLOYEE_RECORDS, ASSIGNMENT_RECORDS)
+    moved = {collection.hash_name: _migrate_collection(collection) for collection in collections}
+
+    if drop_legacy:
+        if Config.WRITE_LEGACY_BLOBS:
+            raise ValueError("Turn WRITE_LEGACY_BLOBS off before dropping the legacy blobs")
+        blob_keys = sorted({collection.blob_key for collection in collections})
+        pipe = r.pipeline()
+        pipe.delete(*blob_keys)
+        pipe.hdel(Config.DATA_VERSIONS, *blob_keys)
+        pipe.execute()
+        logger.info(f"Dropped legacy blobs {blob_keys}")
+
+    cache.invalidate()
+    logger.info(f"Migrated to record hashes: {moved}")
+    return moved
+
+# Bulk replace (bulk_data.py): a whole collection is written in pipelined batches to
+# "<key>:import:<token>" keys, then swapped in with RENAME inside one MULTI, so readers
+# see either the old collection or the new one, never a half-written roster
+
+def _import_key(key: str, token: str) -> str:
+    return f"{key}:import:{token}"
+
+def _write_import_hash(key: str, records: Dict[str, Any], batch_size: int) -> None:
+    #Записать записи во временный хэш: HSET по batch_size полей, один запрос на пачку
+    pipe = r.pipeline(transaction=False)
+    pipe.delete(key)
+    batch: Dict[str, bytes] = {}
+    for record_id, record in records.items():
+        batch[record_id] = codec.encode(record.to_record())
+        if len(batch) >= batch_size:
+            pipe.hset(key, mapping=batch)
+            # Брошенный импорт (процесс упал до RENAME) удалится сам
+            pipe.expire(key, Config.BULK_IMPORT_TTL_SECONDS)
+            pipe.execute()
+            batch = {}
+    if batch:
+        pipe.hset(key, mapping=batch)
+        pipe.expire(key, Config.BULK_IMPORT_TTL_SECONDS)
+    pipe.execute()
+
+def _swap_in(pipe, collection: RecordCollection, tmp_key: str, records: Dict[str, Any],
+             legacy: Optional[Callable[[], Any]] = None) -> Any:
+    #Как _queue_collection_write, но данные уже лежат во временном хэше (ответы версий — первыми)
+    pipe.hincrby(Config.DATA_VERSIONS, collection.key, 1)
+    legacy_value = None
+    if legacy and Config.WRITE_LEGACY_BLOBS:
+        legacy_value = legacy()
+        pipe.hincrby(Config.DATA_VERSIONS, collection.blob_key, 1)
+        pipe.set(collection.blob_key, codec.encode(legacy_value))
+    if records:
+        pipe.rename(tmp_key, collection.key)
+        pipe.persist(collection.key)  # RENAME переносит и TTL временного ключа
+    else:
+        pipe.delete(collection.key)
+    return legacy_value
+
+def _bulk_replace(collection: RecordCollection, records: Dict[str, Any], batch_size: int,
+                  legacy: Optional[Callable[[], Any]] = None, extra: Optional[Callable[[Any], None]] = None) -> None:
+    tmp_key = _import_key(collection.key, uuid.uuid4().hex)
+    try:
+        _write_import_hash(tmp_key, records, batch_size)
+        pipe = r.pipeline()
+        legacy_value = _swap_in(pipe, collection, tmp_key, records, legacy)
+        if extra:
+            extra(pipe)
+        versions = pipe.execute()
+    except Exception:
+        cache.invalidate(collection.key)
+        try:
+            r.delete(tmp_key)
+        except redis.RedisError as e:
+            logger.error(f"Could not delete import keys of {collection.key} (they expire): {e}")
+        raise
+
+    cache.put(collection.key, records, versions[0])
+    _cache_legacy(collection, legacy_value, versions)
+
+def bulk_replace_tasks(tasks: Dict[str, Task], batch_size: int = Config.BULK_BATCH_SIZE) -> None:
+    #Заменить всю базу задач (атомарно для читателей); ошибки Redis поднимаются
+    _bulk_replace(TASK_RECORDS, tasks, batch_size, legacy=lambda: _records(tasks))
+
+def bulk_replace_employees(employees: Dict[str, Employee], batch_size: int = Config.BULK_BATCH_SIZE) -> None:
+    #Заменить весь состав вместе с индексом смен (смены лежат в записях сотрудников)
+    old_keys = r.smembers(tenant_key(Config.SHIFT_INDEX_KEYS))
+    _bulk_replace(EMPLOYEE_RECORDS, employees, batch_size,
+                  legacy=lambda: _legacy_employees(employees, load_task_assignments()),
+                  extra=lambda pipe: _write_shift_index(pipe, employees, old_keys))
+
+def bulk_replace_assignments(assignments: Dict[str, Assignment], batch_size: int = Config.BULK_BATCH_SIZE) -> None:
+    _bulk_replace(ASSIGNMENT_RECORDS, assignments, batch_size,
+                  legacy=lambda: _legacy_employees(load_employees(), assignments))
+
+def _state_key(debug_mode: bool) -> str:
+    #Ключ состояния текущего тенанта
+    return tenant_key(Config.DEBUG_ROUTINE_STATE if debug_mode else Config.SLACK_ROUTINE_STATE)
+
+@metrics.timed("redis_bot", op="load_state")
+def load_state(debug_mode: bool = False) -> DayState:
     #Load routine state (normal or debug mode).
     try:
-        key = Config.DEBUG_ROUTINE_STATE if debug_mode else Config.SLACK_ROUTINE_STATE
-        data = r.get(key)
-        if data:
-            return json.loads(data)
-        return {}
-    except (redis.RedisError, json.JSONDecodeError) as e:
+        key = _state_key(debug_mode)
+        return cache.get(key, parse=DayState.from_record) or DayState()
+    except (redis.RedisError, codec.CodecError, models.ModelError) as e:
         logger.error(f"Error loading state (debug_mode={debug_mode}): {e}")
-        return {}
+        return DayState()
 
-def save_state(state: Dict[str, Any], debug_mode: bool = False) -> bool:
+@metrics.timed("redis_bot", op="save_state")
+def save_state(state: DayState, debug_mode: bool = False,
+               extra: Optional[Callable[[Any], None]] = None) -> bool:
     #Save routine state (normal or debug mode).
     try:
-        key = Config.DEBUG_ROUTINE_STATE if debug_mode else Config.SLACK_ROUTINE_STATE
-        r.set(key, json.dumps(state))
+        key = _state_key(debug_mode)
+        _save_blob(key, state.to_record(), extra, cached=state)
         logger.debug(f"State saved successfully (debug_mode={debug_mode})")
         return True
-    except (redis.RedisError, json.JSONEncodeError) as e:
+    except (redis.RedisError, TypeError, ValueError) as e:
         logger.error(f"Error saving state (debug_mode={debug_mode}): {e}")
         return False
 
-def load_task_base() -> Dict[str, Any]:
+@metrics.timed("redis_bot", op="load_task_base")
+def load_task_base() -> Dict[str, Task]:
     #Load task base from Redis.
     try:
-        data = r.get(Config.TASK_BASE)
+        data, _ = TASK_RECORDS.load()
         if data:
-            return json.loads(data)
+            return data
         logger.warning("Task base is empty or not found")
         return {}
-    except (redis.RedisError, json.JSONDecodeError) as e:
+    except (redis.RedisError, codec.CodecError) as e:
         logger.error(f"Error loading task base: {e}")
         return {}
 
+@metrics.timed("redis_bot", op="save_task_base")
 def save_task_base(task_base: Dict[str, Any]) -> bool:
-    #Save task base to Redis.
+    #Save task base to Redis (Task objects or raw records, which are validated first).
     try:
-        r.set(Config.TASK_BASE, json.dumps(task_base))
+        tasks = models.coerce(Task, task_base)
+        pipe = r.pipeline()
+        legacy_value = _queue_collection_write(pipe, TASK_RECORDS, tasks, legacy=lambda: _records(tasks))
+        versions = pipe.execute()
+        cache.put(TASK_RECORDS.key, tasks, versions[0])
+        _cache_legacy(TASK_RECORDS, legacy_value, versions)
         logger.debug("Task base saved successfully")
         return True
-    except (redis.RedisError, json.JSONEncodeError) as e:
+    except (redis.RedisError, TypeError, ValueError) as e:
+        cache.invalidate(TASK_RECORDS.key)
         logger.error(f"Error saving task base: {e}")
         return False
 
+def get_task(task_id: str) -> Optional[Task]:
+    #Одна задача по id (HGET вместо чтения всей базы задач)
+    try:
+        return TASK_RECORDS.get([task_id]).get(task_id)
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error loading task {task_id}: {e}")
+        return None
+
+def save_task(task_id: str, task: Optional[Any]) -> bool:
+    #Изменить или удалить (task=None) одну задачу, не переписывая всю базу
+    try:
+        task = models.coerce_one(Task, task_id, task)
+        task_base, key = TASK_RECORDS.load()
+        if key != TASK_RECORDS.key:
+            # База задач ещё в старом формате — записываем её целиком
+            return save_task_base(_with_record(task_base or {}, task_id, task))
+
+        pipe = r.pipeline()
+        legacy_value = _queue_record_write(pipe, TASK_RECORDS, task_id, task,
+                                           legacy=lambda: _records(_with_record(task_base, task_id, task)))
+        versions = pipe.execute()
+        cache.patch(TASK_RECORDS.key, versions[0], task_id, task)
+        _cache_legacy(TASK_RECORDS, legacy_value, versions)
+        return True
+    except (redis.RedisError, TypeError, ValueError) as e:
+        cache.invalidate(TASK_RECORDS.key)
+        logger.error(f"Error saving task {task_id}: {e}")
+        return False
+
+def _completed_key(date: str, debug_mode: bool = False) -> str:
+    #Хэш выполненных задач за день: поле — название задачи, значение — {"user", "time"}
+    state_key = _state_key(debug_mode)
+    return f"{state_key}:completed:{date}"
+
+STALE_STATE_MESSAGE = "Старое состояние — новое утро, нет активного треда."
+
+def _start_thread_state(state: DayState, thread_ts, today: str) -> DayState:
+    # Выполненные задачи живут в отдельном хэше; новый тред начинает его с нуля
+    return DayState(today, thread_ts, extra=state.extra)
+
+def _decode_completed(raw: Dict[bytes, bytes]) -> Dict[str, Any]:
+    return {task.decode(): codec.decode(info) for task, info in raw.items()}
+
+@metrics.timed("redis_bot", op="set_thread_ts")
 def set_thread_ts(thread_ts, debug_mode=False):
     #Установить thread_ts для нового дня
-    state = load_state(debug_mode)
-    state["date"] = datetime.date.today().isoformat()
-    state["thread_ts"] = thread_ts
-    state["completed"] = {}
-    save_state(state, debug_mode)
+    today = bot_logic.now_local().date().isoformat()
+    current = load_state(debug_mode)
+    if not debug_mode and current.date == today and current.thread_ts and current.thread_ts != thread_ts:
+        # Второй пост за день (два хоста без общего планировщика?) — тред и отметки начинаются заново
+        logger.warning(f"Replacing today's thread {current.thread_ts} with {thread_ts}")
+    state = _start_thread_state(current, thread_ts, today)
+    completed_key = _completed_key(today, debug_mode)
+    save_state(state, debug_mode, extra=lambda pipe: pipe.delete(completed_key))
 
 def get_thread_ts(debug_mode=False):
     #Получить текущий thread_ts
+    return load_state(debug_mode).thread_ts
+
+def migrate_completed_state(debug_mode=False) -> int:
+    #Перенести "completed" из старого формата состояния (один JSON) в хэш дня
     state = load_state(debug_mode)
-    return state.get("thread_ts")
+    legacy = state.completed
+    if legacy is None:
+        return 0
+
+    moved = 0
+    if legacy and state.date:
+        key = _completed_key(state.date, debug_mode)
+        pipe = r.pipeline()
+        for task, info in legacy.items():
+            pipe.hsetnx(key, task, codec.encode(info))
+        pipe.expire(key, Config.COMPLETED_TTL_SECONDS)
+        moved = sum(pipe.execute()[:-1])
+
+    save_state(DayState(state.date, state.thread_ts, extra=state.extra), debug_mode)
+    logger.info(f"Migrated {moved} completed tasks to hash (debug_mode={debug_mode})")
+    return moved
 
 def record_task(task, user, debug_mode=False):
-    #Записать выполненную задачу
+    #Записать выполненную задачу (атомарно, HSETNX в хэш дня)
+    late, already, msg = record_tasks([task], user, debug_mode)
+    if msg:
+        return False, msg
+    if already:
+        return False, ALREADY_MARKED_MESSAGE
+    return True, None
+
+def _split_created(tasks: List[str], created: List[Any]) -> Tuple[List[str], List[str]]:
+    #Ответы HSETNX -> (новые отметки, уже отмеченные раньше)
+    fresh = [task for task, ok in zip(tasks, created) if ok]
+    already = [task for task, ok in zip(tasks, created) if not ok]
+    return fresh, already
+
+@metrics.timed("redis_bot", op="record_tasks")
+def record_tasks(tasks: List[str], user: str, debug_mode: bool = False,
+                 now: Optional[datetime.datetime] = None) -> Tuple[Dict[str, bool], List[str], Optional[str]]:
+    #Записать несколько выполненных задач одной транзакцией (HSETNX каждой в хэш дня).
+    #Вернуть ({новая отметка: опоздала ли}, [уже отмеченные раньше], сообщение, если отмечать нельзя)
+    # День и время отметки — по тем же часам (Config.TIMEZONE), что и проверка опоздания
+    now = now or bot_logic.now_local()
+    today = now.date().isoformat()
     state = load_state(debug_mode)
-    today = datetime.date.today().isoformat()
 
-    if state.get("date") != today:
-        return False, "Старое состояние — новое утро, нет активного треда."
+    if state.date != today:
+        return {}, [], STALE_STATE_MESSAGE
 
-    if "completed" not in state:
-        state["completed"] = {}
+    if state.completed is not None:
+        migrate_completed_state(debug_mode)
 
-    if task in state["completed"]:
-        return False, "Эта задача уже была отмечена ранее."
+    entry = codec.encode({"user": user, "time": now.strftime("%H:%M")})
+    key = _completed_key(today, debug_mode)
+    pipe = r.pipeline()
+    for task in tasks:
+        pipe.hsetnx(key, task, entry)
+    pipe.expire(key, Config.COMPLETED_TTL_SECONDS)
+    fresh, already = _split_created(tasks, pipe.execute()[:-1])
 
-    now = datetime.datetime.now().strftime("%H:%M")
-    state["completed"][task] = {"user": user, "time": now}
-    save_state(state, debug_mode)
-    return True, None
+    late = tasks_late(fresh, now, debug_mode)
+    append_completions(fresh, user, late, debug_mode, now)
+    return late, already, None
 
 def get_completed_tasks(debug_mode=False):
     #Получить список выполненных задач
     state = load_state(debug_mode)
-    return state.get("completed", {})
+    if not state.date:
+        return {}
+
+    completed = _decode_completed(r.hgetall(_completed_key(state.date, debug_mode)))
+    # Состояние в старом формате, которое ещё не мигрировали
+    for task, info in (state.completed or {}).items():
+        completed.setdefault(task, info)
+    return completed
+
+class RenderSnapshot:
+    #Всё, что нужно для отрисовки сообщения или напоминания, прочитанное за один запрос к Redis.
+    #Функции форматирования берут данные отсюда и сами в Redis не ходят.
+    #С записанным планом дня (plan) task_base, employees и назначения не читаются — они пусты.
+
+    def __init__(self, task_base: Dict[str, Task], employees: Dict[str, Employee],
+                 state: DayState, completed: Dict[str, Any], source_cache: Optional[VersionedCache] = None,
+                 assignments: Optional[Dict[str, Assignment]] = None,
+                 task_base_key: Optional[str] = None, employees_key: Optional[str] = None,
+                 plan: Optional[DailyPlan] = None, plan_key: Optional[str] = None):
+        self.task_base = task_base
+        self.employees = employees
+        self.state = state
+        self.completed = completed
+        self.assignments = assignments if assignments is not None else {}
+        self.plan = plan
+        self._cache = source_cache or cache
+        # Ключи кэша, из которых взяты данные (хэш записей или старый блоб) — к ним
+        # привязаны производные объекты; снимок принадлежит тенанту, в котором прочитан.
+        # "" — данные не читались (есть план), производные от них не кэшируются
+        self._task_base_key = task_base_key if task_base_key is not None else TASK_RECORDS.key
+        self._employees_key = employees_key if employees_key is not None else EMPLOYEE_RECORDS.key
+        self._plan_key = plan_key
+        self._built_plans: Dict[str, DailyPlan] = {}
+
+    @property
+    def thread_ts(self) -> Optional[str]:
+        return self.state.thread_ts
+
+    @property
+    def shift_index(self) -> "ShiftIndex":
+        # Индекс строится один раз на версию employees и живёт в кэше
+        return self._cache.derive_current(self._employees_key, "shift_index", lambda _: build_shift_index(self.employees))
+
+    def day_plan(self, day_name: str) -> DailyPlan:
+        # Записанный план, если он на сегодня и этот день недели; иначе собранный из данных снимка
+        if self.plan is not None and self.plan.matches(bot_logic.now_local().date().isoformat(), day_name):
+            return self.plan
+        if day_name not in self._built_plans:
+            self._built_plans[day_name] = build_daily_plan(self.task_base, self.shift_index, self.assignments, day_name)
+        return self._built_plans[day_name]
+
+    def _derived_key(self, plan: DailyPlan) -> str:
+        # Производные записанного плана живут на его версию, собранного — на версию task_base
+        return self._plan_key if plan is self.plan and self._plan_key else self._task_base_key
+
+    def day_timeline(self, day_name: str) -> DeadlineTimeline:
+        # Задачи дня по дедлайнам — строятся один раз на версию плана (или task_base и день недели)
+        plan = self.day_plan(day_name)
+        if plan is self.plan:
+            return plan_timeline(self._cache, self._plan_key, plan)
+        return self._cache.derive_current(self._task_base_key, f"timeline:{day_name}",
+                                          lambda _: DeadlineTimeline(plan.tasks))
+
+    def task_line(self, task: Task, plan: DailyPlan, live: bool = False) -> str:
+        # Строки задач запоминаются на версию плана (task_base): при перерисовке живого сообщения
+        # заново форматируются только задачи, у которых сменились отметка или назначение
+        done = self.completed.get(task.key) if live else None
+        line_key = (task.id, plan.assignees.get(task.key, ""),
+                    done.get("user") if done else None, done.get("time") if done else None)
+        lines = self._cache.derive_current(self._derived_key(plan), "task_lines", lambda _: {})
+        line = lines.get(line_key)
+        if line is None:
+            line = lines[line_key] = format_task_line(task, self, live, plan)
+        return line
+
+# Последний успешно прочитанный снимок (по ключу состояния тенанта и дню недели) — отдаётся, пока Redis недоступен
+_last_snapshots: Dict[Tuple[str, str], RenderSnapshot] = {}
+
+SNAPSHOT_COLLECTIONS = (TASK_RECORDS, EMPLOYEE_RECORDS, ASSIGNMENT_RECORDS)
+
+def _load_snapshot_records() -> List[Tuple[Dict[str, Any], str]]:
+    #task_base, employees и назначения одним запросом: [(записи, ключ кэша), ...]
+    record_keys = [collection.key for collection in SNAPSHOT_COLLECTIONS]
+    values, _ = cache.get_many(record_keys, hashed=set(record_keys),
+                               parsers={collection.key: collection.parse for collection in SNAPSHOT_COLLECTIONS})
+    records = []
+    for collection in SNAPSHOT_COLLECTIONS:
+        if values[collection.key] is not None:
+            records.append((values[collection.key], collection.key))
+        else:
+            # Коллекция ещё в старом формате — отдельное чтение блоба (только до миграции)
+            loaded, key = collection.load()
+            records.append((loaded or {}, key))
+    return records
+
+@metrics.timed("redis_bot", op="load_render_snapshot")
+def load_render_snapshot(debug_mode: bool = False, day_override: Optional[str] = None,
+                         rebuild: bool = False) -> RenderSnapshot:
+    #Загрузить план дня, состояние и выполненные задачи за один запрос.
+    #Если плана на этот день нет (или rebuild) — ещё task_base, employees и назначения, план соберётся из них.
+    #Если Redis недоступен — вернуть последний удачный снимок, а без него поднять ошибку
+    #(пустой снимок превратился бы в сообщение "нет задач")
+    state_key = _state_key(debug_mode)
+    plan_key = _plan_key(debug_mode)
+    today, day_name = _plan_day(day_override)
+    completed_key = _completed_key(today, debug_mode)
 
-def get_tasks_for_day(day_name):
+    try:
+        values, (completed_raw,) = cache.get_many(
+            [plan_key, state_key], parsers={plan_key: _parse_plan, state_key: DayState.from_record},
+            extra=lambda pipe: pipe.hgetall(completed_key)
+        )
+        plan = values[plan_key]
+        if rebuild or plan is None or not plan.matches(today, day_name):
+            plan = None
+            records = _load_snapshot_records()
+        else:
+            records = [({}, "") for _ in SNAPSHOT_COLLECTIONS]
+    except (redis.RedisError, codec.CodecError, models.ModelError) as e:
+        logger.error(f"Error loading render snapshot (debug_mode={debug_mode}): {e}")
+        if (state_key, day_name) in _last_snapshots:
+            logger.warning("Serving last known good render snapshot")
+            return _last_snapshots[(state_key, day_name)]
+        raise
+
+    state = values[state_key] or DayState()
+    if state.date == today and state.completed is None:
+        completed = _decode_completed(completed_raw)
+    else:
+        # Состояние за другой день или в старом формате — редкий случай, читаем отдельно
+        completed = get_completed_tasks(debug_mode)
+
+    (task_base, task_base_key), (employees, employees_key), (assignments, _) = records
+    snapshot = RenderSnapshot(task_base, employees, state, completed, assignments=assignments,
+                              task_base_key=task_base_key, employees_key=employees_key,
+                              plan=plan, plan_key=plan_key)
+    _last_snapshots[(state_key, day_name)] = snapshot
+    return snapshot
+
+# Daily plan
+
+def _plan_key(debug_mode: bool) -> str:
+    #План дня лежит рядом с состоянием дня (thread_ts)
+    return f"{_state_key(debug_mode)}:plan"
+
+def _plan_day(day_override: Optional[str] = None) -> Tuple[str, str]:
+    #(дата ISO, день недели) плана, который нужен сейчас — так же, как их выбирает render_message
+    today = bot_logic.now_local()
+    return today.date().isoformat(), day_override.capitalize() if day_override else models.WEEKDAYS[today.weekday()]
+
+def _parse_plan(record: Any) -> Optional[DailyPlan]:
+    # Испорченный план не мешает работе — без него всё собирается из полных данных
+    try:
+        return DailyPlan.from_record(record)
+    except models.ModelError as e:
+        logger.error(f"Ignoring stored daily plan: {e}")
+        return None
+
+def build_daily_plan(task_base: Dict[str, Task], shift_index: "ShiftIndex",
+                     assignments: Dict[str, Assignment], day_name: str) -> DailyPlan:
+    #Собрать план дня: задачи дня по группам и дедлайнам, их назначения и сегодняшняя смена
+    today = bot_logic.now_local()
+    grouped = group_tasks_by_period(tasks_for_day(task_base, day_name))
+    tasks = grouped["ungrouped"] + grouped["morning"] + grouped["evening"]
+    shift_date = today.date().isoformat()
+    # Календари смен в плане не нужны — только кого упомянуть
+    shifts = {period: [Employee(employee.id, employee.name, employee.slack_id, employee.username)
+                       for employee in shift_index.get((shift_date, period), [])]
+              for period in SHIFT_PERIODS}
+    assignees = {task.key: assignments[task.key].slack_id for task in tasks if task.key in assignments}
+    return DailyPlan(today.date().isoformat(), day_name, tasks, assignees, shifts)
+
+def plan_timeline(source_cache: VersionedCache, plan_key: str, plan: DailyPlan) -> DeadlineTimeline:
+    # Задачи плана по дедлайнам — один раз на версию плана
+    return source_cache.derive_current(plan_key, "timeline", lambda _: DeadlineTimeline(plan.tasks))
+
+def save_daily_plan(plan: DailyPlan, debug_mode: bool = False) -> bool:
+    try:
+        _save_blob(_plan_key(debug_mode), plan.to_record(), cached=plan)
+        logger.info(f"Daily plan for {plan.date} ({plan.day_name}) saved: {len(plan.tasks)} tasks")
+        return True
+    except (redis.RedisError, TypeError, ValueError) as e:
+        logger.error(f"Error saving daily plan (debug_mode={debug_mode}): {e}")
+        return False
+
+def load_daily_plan(debug_mode: bool = False) -> Optional[DailyPlan]:
+    #План, записанный сегодня (None — его нет или он вчерашний)
+    try:
+        plan = cache.get(_plan_key(debug_mode), parse=_parse_plan)
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error loading daily plan (debug_mode={debug_mode}): {e}")
+        return None
+    return plan if plan is not None and plan.date == bot_logic.now_local().date().isoformat() else None
+
+@metrics.timed("redis_bot", op="materialize_daily_plan")
+def materialize_daily_plan(day_override: Optional[str] = None, debug_mode: bool = False) -> RenderSnapshot:
+    #Утренний пост: собрать план дня из полных данных и записать его; до конца дня сообщение,
+    #напоминания и проверка дедлайнов читают только его. Возвращает снимок с этим планом
+    _, day_name = _plan_day(day_override)
+    if not debug_mode:
+        # Первый пост в новом году: индекс смен в Redis ещё за прошлый
+        refresh_shift_index()
+    snapshot = load_render_snapshot(debug_mode, day_override, rebuild=True)
+    plan = snapshot.day_plan(day_name)
+    # Пустой план не записываем: задачи, добавленные позже, должны появиться без нового поста
+    if plan.tasks and save_daily_plan(plan, debug_mode):
+        snapshot.plan = plan
+    return snapshot
+
+def task_is_late(task_name: str, now: datetime.datetime, debug_mode: bool = False) -> bool:
+    #Задача отмечена после дедлайна? Дедлайн берётся из плана дня, для задач не из плана — из task_base
+    return tasks_late([task_name], now, debug_mode)[task_name]
+
+def _outside_plan(task_names: List[str], plan_deadlines: Optional[DeadlineTimeline]) -> List[str]:
+    # Задачи, дедлайн которых придётся искать в task_base
+    return [name for name in task_names if plan_deadlines is None or name.upper() not in plan_deadlines.deadlines]
+
+def _late_tasks(task_names: List[str], now: datetime.datetime, plan_deadlines: Optional[DeadlineTimeline],
+                task_deadlines: Optional[DeadlineTimeline]) -> Dict[str, bool]:
+    outside = set(_outside_plan(task_names, plan_deadlines))
+    return {name: (task_deadlines if name in outside else plan_deadlines).is_late(name, now) for name in task_names}
+
+def tasks_late(task_names: List[str], now: datetime.datetime, debug_mode: bool = False) -> Dict[str, bool]:
+    #task_is_late для нескольких задач: план дня и task_base читаются один раз (task_base — если нужен)
+    if not task_names:
+        return {}
+    plan = load_daily_plan(debug_mode)
+    plan_deadlines = plan_timeline(cache, _plan_key(debug_mode), plan) if plan is not None else None
+    task_deadlines = get_task_timeline() if _outside_plan(task_names, plan_deadlines) else None
+    return _late_tasks(task_names, now, plan_deadlines, task_deadlines)
+
+def _patch_plan_assignee(task_key: str, slack_id: Optional[str]) -> None:
+    # Назначение поменялось после утреннего поста — поправить его в планах дня (обычном и debug)
+    for debug_mode in (False, True):
+        plan = load_daily_plan(debug_mode)
+        if plan is not None and any(task.key == task_key for task in plan.tasks):
+            save_daily_plan(plan.with_assignee(task_key, slack_id), debug_mode)
+
+def get_tasks_for_day(day_name, snapshot: Optional[RenderSnapshot] = None):
     #Получить задачи для конкретного дня недели из task_base
-    task_base = load_task_base()
+    task_base = snapshot.task_base if snapshot else load_task_base()
 
     if not task_base:
         return []
 
-    tasks = []
-    for task_id, task_data in task_base.items():
-        # Проверяем, выполняется ли задача в этот день
-        task_days = task_data.get("days", "all")
-        if task_days == "all" or day_name in task_days:
-            # Добавляем ID задачи к данным
-            task_with_id = task_data.copy()
-            task_with_id["id"] = task_id
-            tasks.append(task_with_id)
-
-    return tasks
+    return tasks_for_day(task_base, day_name)
 
-    # Сортируем по времени дедлайна
-    tasks.sort(key=lambda x: x.get("deadline", "23:59"))
-    return tasks
+def tasks_for_day(task_base: Dict[str, Task], day_name: str) -> List[Task]:
+    # Дни недели разобраны при загрузке; задачи не копируются
+    try:
+        weekday = models.WEEKDAYS.index(day_name.capitalize())
+    except ValueError:
+        logger.error(f"Unknown weekday {day_name!r}, expected one of {models.WEEKDAYS}")
+        return []
+    return [task for task in task_base.values() if task.runs_on(weekday)]
 
-def format_task_line(task):
+def format_task_line(task, snapshot: RenderSnapshot, live: bool = False, plan: Optional[DailyPlan] = None):
     #Форматировать строку задачи для Slack с учетом назначений
-    name = task.get("name", "")
-    deadline = task.get("deadline", "")
-    asana_url = task.get("asana_url", "")
-    comments = task.get("comments", "")
+    #(live — для живого сообщения: выполненные задачи отмечены, с тем, кто и когда;
+    #plan — назначения берутся из плана дня, а не из назначений снимка)
+    name = task.name
+    deadline = task.deadline_text
+    asana_url = task.asana_url
+    comments = task.comments
 
     # Проверяем, есть ли назначенный пользователь на эту задачу
-    assigned_user = get_task_assignment(name)
+    if plan is not None:
+        assigned_user = plan.assignees.get(task.key, "")
+    else:
+        assignment = snapshot.assignments.get(task.key)
+        assigned_user = assignment.slack_id if assignment else ""
+    done = snapshot.completed.get(task.key) if live else None
 
     # Базовая строка с чекбоксом и назначенным пользователем
-    if assigned_user:
+    if done:
+        # Выполнена — зачёркнута, назначение уже не важно
+        if deadline:
+            task_line = f"- [x] ~*{name}*~ до {deadline}"
+        else:
+            task_line = f"- [x] ~*{name}*~"
+    elif assigned_user:
         # Если есть назначенный пользователь, добавляем его в начало
         if deadline:
             task_line = f"- [<@{assigned_user}>] *{name}* до {deadline}"
@@ -155,142 +915,158 @@ def format_task_line(task):
     if asana_url:
         task_line += f" • <{asana_url}|Asana>"
 
+    # Кто и когда отметил
+    if done:
+        user = done.get("user")
+        task_line += f" — {f'<@{user}>' if user else 'выполнено'} {done.get('time', '')}".rstrip()
+
     # Добавляем комментарии в конце строки с отступом
     if comments:
         task_line += f"     _{comments}_"
 
     return task_line
 
-def generate_message_from_redis(day_override=None, debug_mode=False):
+def generate_message_from_redis(day_override=None, debug_mode=False, live=False, materialize=False):
     #Генерировать сообщение для Slack на основе данных из Redis с группировкой и сотрудниками
-    today = datetime.datetime.now()
+    #(live=True — с отметками выполненных задач, для обновления уже опубликованного сообщения;
+    #materialize=True — утренний пост: план дня собирается заново и записывается)
+    if materialize:
+        snapshot = materialize_daily_plan(day_override, debug_mode)
+    else:
+        # Все данные для сообщения — одним запросом к Redis
+        snapshot = load_render_snapshot(debug_mode, day_override)
+    return render_message(snapshot, day_override, debug_mode, live)
+
+def render_message(snapshot: RenderSnapshot, day_override=None, debug_mode=False, live=False):
+    #Собрать текст утреннего сообщения из плана дня (без обращений к Redis)
+    today = bot_logic.now_local()
+    # Отметки показываем только за день текущего треда (в completed может быть вчерашний день)
+    live = live and snapshot.state.date == today.date().isoformat()
 
     if day_override:
         day_name = day_override.capitalize()
         date_str = today.strftime('%d %B') + f" ({day_name})"
-        # Для day_override используем текущую дату в формате dd/mm
-        current_date = today.strftime('%d/%m')
     else:
-        day_name = today.strftime('%A')
+        # Имя дня — не из strftime('%A'): при другой локали (LANG=ru_RU) оно не совпадёт с WEEKDAYS
+        day_name = models.WEEKDAYS[today.weekday()]
         date_str = today.strftime('%d %B (%A)')
-        current_date = today.strftime('%d/%m')
 
-    # Получаем задачи для дня
-    tasks = get_tasks_for_day(day_name)
+    # План дня: задачи по группам и дедлайнам, назначения и смена на сегодняшнюю дату
+    plan = snapshot.day_plan(day_name)
 
     # Формируем заголовок
     debug_prefix = "🔧 DEBUG: " if debug_mode else ""
     header = f"{debug_prefix}🎓 Routine tasks for *{date_str}*"
 
     # Если нет задач
-    if not tasks:
+    if not plan.tasks:
         return header + "\n\n_Нет задач на сегодня_"
 
-    # Группируем задачи
-    grouped_tasks = group_tasks_by_period(tasks)
-
     message_parts = [header]
 
     # Сначала показываем задачи без группы
-    if grouped_tasks["ungrouped"]:
+    ungrouped = plan.group("")
+    if ungrouped:
         message_parts.append("")  # Пустая строка для отступа
-        for task in grouped_tasks["ungrouped"]:
-            message_parts.append(format_task_line(task))
+        for task in ungrouped:
+            message_parts.append(snapshot.task_line(task, plan, live))
 
     # Потом утренние задачи
-    if grouped_tasks["morning"]:
-        # Получаем сотрудников для утренней смены
-        morning_employees = get_employees_for_date_and_period(current_date, "morning")
-        employees_mention = format_employees_mention(morning_employees)
+    morning = plan.group("morning")
+    if morning:
+        # Сотрудники утренней смены
+        employees_mention = format_employees_mention(plan.shifts.get("morning", []))
 
         if employees_mention:
             message_parts.append(f"\n*Утро*:\n{employees_mention}")
         else:
             message_parts.append("\n*Утро*:")
 
-        for task in grouped_tasks["morning"]:
-            message_parts.append(format_task_line(task))
+        for task in morning:
+            message_parts.append(snapshot.task_line(task, plan, live))
 
     # Потом вечерние задачи
-    if grouped_tasks["evening"]:
-        # Получаем сотрудников для вечерней смены
-        evening_employees = get_employees_for_date_and_period(current_date, "evening")
-        employees_mention = format_employees_mention(evening_employees)
+    evening = plan.group("evening")
+    if evening:
+        # Сотрудники вечерней смены
+        employees_mention = format_employees_mention(plan.shifts.get("evening", []))
 
         if employees_mention:
             message_parts.append(f"\n*Вечер* _(делается после 15:00)_:\n{employees_mention}")
         else:
             message_parts.append("\n*Вечер*:")
 
-        for task in grouped_tasks["evening"]:
-            message_parts.append(format_task_line(task))
+        for task in evening:
+            message_parts.append(snapshot.task_line(task, plan, live))
 
     return "\n".join(message_parts)
 
+def get_task_timeline() -> DeadlineTimeline:
+    #Все задачи по дедлайнам (разбираются один раз на версию task_base)
+    try:
+        return TASK_RECORDS.derive("timeline", lambda task_base: DeadlineTimeline(task_base.values()))
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error loading task deadlines: {e}")
+        return DeadlineTimeline([])
+
 def get_task_deadlines():
     #Получить дедлайны задач для проверки времени выполнения
-    task_base = load_task_base()
-    deadlines = {}
+    return get_task_timeline().deadlines
 
-    for task_id, task_data in task_base.items():
-        deadline_str = task_data.get("deadline", "")
-        if deadline_str:
-            try:
-                # Преобразуем строку "HH:MM" в объект времени
-                hour, minute = map(int, deadline_str.split(":"))
-                deadlines[task_data.get("name", "").upper()] = datetime.time(hour=hour, minute=minute)
-            except ValueError:
-                # Если не удалось распарсить время, пропускаем
-                continue
-        else:
-            # Задачи без дедлайна
-            deadlines[task_data.get("name", "").upper()] = None
+def parse_task_deadlines(task_base: Dict[str, Task]) -> Dict[str, Optional[datetime.time]]:
+    #Дедлайны из task_base: НАЗВАНИЕ -> time (или None)
+    return DeadlineTimeline(task_base.values()).deadlines
 
-    return deadlines
+def _task_names(task_base: Dict[str, Task]) -> List[str]:
+    return [task.name for task in task_base.values()]
 
 def get_task_names():
-    #Получить все названия задач для регулярного выражения
+    #Получить все названия задач
     task_base = load_task_base()
 
     if not task_base:
         print("Скорее всего, Redis пуст")
 
-    names = []
-    for task_id, task_data in task_base.items():
-        name = task_data.get("name", "")
-        if name:
-            names.append(name)
-
-    return names
+    return _task_names(task_base)
 
-def build_task_regex():
-    #Построить регулярное выражение для поиска задач
-    task_names = get_task_names()
+def build_task_matcher(task_base: Optional[Dict[str, Task]]) -> TaskMatcher:
+    return TaskMatcher(_task_names(task_base or {}))
 
-    # Экранируем специальные символы в названиях (например, дефисы)
-    escaped_names = [re.escape(name) for name in task_names]
-
-    # Создаем паттерн: (LPB|KYC-1|Проверка KYC-2|Statements - выгрузки).*done
-    pattern = r"(?i)(" + "|".join(escaped_names) + r").*done"
-    return pattern
+def get_task_matcher() -> TaskMatcher:
+    #Получить matcher названий задач, построенный для текущей версии task_base
+    try:
+        return TASK_RECORDS.derive("task_matcher", build_task_matcher)
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error building task matcher: {e}")
+        return TaskMatcher([])
 
 def find_task_in_text(text):
-    #Найти упоминание задачи в тексте
-    pattern = build_task_regex()
-    match = re.search(pattern, text)
+    #Найти упоминание задачи в тексте (самое длинное из совпадений, за которым идёт "done")
+    return match_task(get_task_matcher(), text)
 
-    if match:
-        # Возвращаем найденное название задачи
-        found_name = match.group(1)
+def find_tasks_in_text(text) -> List[str]:
+    #Все задачи, названные до "done" ("LPB, KYC-1 и Statements done"), слева направо
+    return match_tasks(get_task_matcher(), text)
 
+def match_task(matcher: TaskMatcher, text: str) -> Optional[str]:
+    found_name = matcher.find(text)
+
+    if found_name:
         # Нормализуем название для поиска в deadlines
         # (приводим к тому виду, который используется в get_task_deadline)
-        normalized_name = found_name.upper()
-
-        return normalized_name
+        return found_name.upper()
 
     return None
 
+def match_tasks(matcher: TaskMatcher, text: str) -> List[str]:
+    # Одна и та же задача дважды в сообщении отмечается один раз
+    return list(dict.fromkeys(name.upper() for name in matcher.find_all(text)))
+
+_NO_DEADLINE = datetime.time(23, 59)
+
+def _deadline_sort_key(task: Task) -> datetime.time:
+    return task.deadline or _NO_DEADLINE
+
 def group_tasks_by_period(tasks):
     #Группировать задачи по периодам (утро/вечер)
     groups = {
@@ -300,7 +1076,7 @@ def group_tasks_by_period(tasks):
     }
 
     for task in tasks:
-        period = task.get("period", "")
+        period = task.period
         if period == "morning":
             groups["morning"].append(task)
         elif period == "evening":
@@ -308,110 +1084,296 @@ def group_tasks_by_period(tasks):
         else:
             groups["ungrouped"].append(task)
 
-    # Сортируем задачи в каждой группе по времени дедлайна
+    # Сортируем задачи в каждой группе по времени дедлайна (без дедлайна — как 23:59)
     for group_name in groups:
-        groups[group_name].sort(key=lambda x: x.get("deadline", "23:59"))
+        groups[group_name].sort(key=_deadline_sort_key)
 
     return groups
 
 #Employees
 
-def load_employees() -> Dict[str, Any]:
-    #Загрузить данные сотрудников из Redis
+@metrics.timed("redis_bot", op="load_employees")
+def load_employees() -> Dict[str, Employee]:
+    #Загрузить данные сотрудников из Redis (без назначений — они в отдельной коллекции)
     try:
-        data = r.get(Config.EMPLOYEES)
+        data, _ = EMPLOYEE_RECORDS.load()
         if data:
-            return json.loads(data)
+            return data
         logger.warning("Employee data is empty or not found")
         return {}
-    except (redis.RedisError, json.JSONDecodeError) as e:
+    except (redis.RedisError, codec.CodecError) as e:
         logger.error(f"Error loading employees: {e}")
         return {}
 
+SHIFT_PERIODS = ("morning", "evening")
+
+def _shift_date(date_str: str) -> Optional[datetime.date]:
+    #"dd/mm" (в текущем году) или "YYYY-MM-DD"; None для невозможной даты
+    try:
+        if "/" in date_str:
+            day, _, month = date_str.partition("/")
+            return datetime.date(datetime.date.today().year, int(month), int(day))
+        return datetime.date.fromisoformat(date_str)
+    except ValueError:
+        return None
+
+class ShiftIndex:
+    #Кто на смене в (дату, период). Смены лежат битовыми картами в календарях сотрудников,
+    #так что день считается проверкой одного бита у каждого — лениво и один раз на день и период
+    __slots__ = ("employees", "_days")
+
+    def __init__(self, employees: Dict[str, Employee]):
+        self.employees = employees
+        self._days: Dict[Tuple[datetime.date, str], List[Employee]] = {}
+
+    def members(self, date: datetime.date, period: str) -> List[Employee]:
+        key = (date, period)
+        if key not in self._days:
+            self._days[key] = [employee for employee in self.employees.values() if employee.on_shift(date, period)]
+        return self._days[key]
+
+    def get(self, key: Tuple[str, str], default: Any = None) -> Any:
+        # Как dict.get у прежнего индекса: ключ (дата, период), пустая смена — default
+        date_str, period = key
+        date = _shift_date(date_str)
+        members = self.members(date, period) if date else []
+        return members or default
+
+def build_shift_index(employees: Dict[str, Employee]) -> ShiftIndex:
+    return ShiftIndex(employees)
+
+# Индекс смен в Redis: shift_index:<dd/mm>:<период> -> id сотрудников, на текущий год.
+# Строится из битовых карт и пишется в той же транзакции, что и сотрудники, — другие
+# процессы читают смену дня одним SMEMBERS, не загружая весь состав
+
+def _shift_index_key(date_str: str, period: str) -> str:
+    return f"{tenant_key(Config.SHIFT_INDEX)}:{date_str}:{period}"
+
+def _shift_dates(employee: Optional[Employee], period: str, year: int) -> Set[str]:
+    return set(employee.calendar.legacy_dates(period, year)) if employee else set()
+
+def _write_shift_index(pipe, employees: Dict[str, Employee], old_keys, year: Optional[int] = None) -> None:
+    #Заменить все множества индекса смен (внутри транзакции записи состава)
+    year = year or datetime.date.today().year
+    members: Dict[str, List[str]] = {}
+    for employee in employees.values():
+        for period in SHIFT_PERIODS:
+            for date_str in employee.calendar.legacy_dates(period, year):
+                members.setdefault(_shift_index_key(date_str, period), []).append(employee.id)
+
+    pipe.delete(*old_keys, tenant_key(Config.SHIFT_INDEX_KEYS))
+    for key, emp_ids in members.items():
+        pipe.sadd(key, *emp_ids)
+    if members:
+        pipe.sadd(tenant_key(Config.SHIFT_INDEX_KEYS), *members)
+    pipe.set(tenant_key(Config.SHIFT_INDEX_YEAR), year)
+
+def _update_shift_index(pipe, emp_id: str, old: Optional[Employee], new: Optional[Employee]) -> None:
+    #Поправить индекс смен под изменение одного сотрудника (только изменившиеся даты)
+    year = datetime.date.today().year
+    for period in SHIFT_PERIODS:
+        old_dates, new_dates = _shift_dates(old, period, year), _shift_dates(new, period, year)
+        for date_str in old_dates - new_dates:
+            pipe.srem(_shift_index_key(date_str, period), emp_id)
+        added = [_shift_index_key(date_str, period) for date_str in new_dates - old_dates]
+        for key in added:
+            pipe.sadd(key, emp_id)
+        if added:
+            pipe.sadd(tenant_key(Config.SHIFT_INDEX_KEYS), *added)
+
+def refresh_shift_index() -> bool:
+    #Перестроить индекс смен, если он построен за прошлый год (вызывается утренним постом);
+    #True — перестроен
+    year = datetime.date.today().year
+    try:
+        if int(r.get(tenant_key(Config.SHIFT_INDEX_YEAR)) or 0) == year:
+            return False
+        employees, _ = EMPLOYEE_RECORDS.load()
+        old_keys = r.smembers(tenant_key(Config.SHIFT_INDEX_KEYS))
+        pipe = r.pipeline()
+        _write_shift_index(pipe, employees or {}, old_keys, year)
+        pipe.execute()
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error rebuilding shift index: {e}")
+        return False
+    logger.info(f"Shift index rebuilt for {year}")
+    return True
+
+@metrics.timed("redis_bot", op="save_employees")
 def save_employees(employees: Dict[str, Any]) -> bool:
-    #Сохранить данные сотрудников в Redis
+    #Сохранить всех сотрудников вместе с индексом смен (Employee или сырые записи — они проверяются).
+    #Старый формат (назначения в "task_assignments" внутри employees) тоже принимается
     try:
-        r.set(Config.EMPLOYEES, json.dumps(employees))
+        employees = dict(employees)
+        assignments = employees.pop("task_assignments", None)
+        employees = models.coerce(Employee, employees)
+        if assignments is not None:
+            assignments = models.coerce(Assignment, assignments)
+        old_keys = r.smembers(tenant_key(Config.SHIFT_INDEX_KEYS))
+
+        pipe = r.pipeline()
+        legacy_value = _queue_collection_write(
+            pipe, EMPLOYEE_RECORDS, employees,
+            legacy=lambda: _legacy_employees(employees, assignments if assignments is not None else load_task_assignments())
+        )
+        if assignments is not None:
+            _queue_collection_write(pipe, ASSIGNMENT_RECORDS, assignments)
+        _write_shift_index(pipe, employees, old_keys)
+        versions = pipe.execute()
+
+        cache.put(EMPLOYEE_RECORDS.key, employees, versions[0])
+        _cache_legacy(EMPLOYEE_RECORDS, legacy_value, versions)
+        if assignments is not None:
+            cache.invalidate(ASSIGNMENT_RECORDS.key)
         logger.debug("Employees data saved successfully")
         return True
-    except (redis.RedisError, json.JSONEncodeError) as e:
+    except (redis.RedisError, TypeError, ValueError) as e:
+        cache.invalidate(EMPLOYEE_RECORDS.key)
         logger.error(f"Error saving employees: {e}")
         return False
 
-def get_employees_for_date_and_period(date_str: str, period: str) -> List[Dict[str, str]]:
-    #Получить сотрудников, работающих в указанную дату и период
-    employees = load_employees()
-    working_employees = []
-
-    for emp_id, emp_data in employees.items():
-        name = emp_data.get("name", "")
-        slack_id = emp_data.get("slack_id", "")
-
-        # Получаем даты работы для указанного периода
-        if period == "morning":
-            work_dates = emp_data.get("morning_dates", [])
-        elif period == "evening":
-            work_dates = emp_data.get("evening_dates", [])
-        else:
-            continue
+def save_employee(emp_id: str, employee: Optional[Any]) -> bool:
+    #Изменить или удалить (employee=None) одного сотрудника; индекс смен правится только по его датам
+    try:
+        employee = models.coerce_one(Employee, emp_id, employee)
+        employees, key = EMPLOYEE_RECORDS.load()
+        if key != EMPLOYEE_RECORDS.key:
+            # Коллекция ещё в старом формате — записываем её целиком
+            return save_employees(_with_record(employees or {}, emp_id, employee))
+
+        pipe = r.pipeline()
+        legacy_value = _queue_record_write(
+            pipe, EMPLOYEE_RECORDS, emp_id, employee,
+            legacy=lambda: _legacy_employees(_with_record(employees, emp_id, employee), load_task_assignments())
+        )
+        _update_shift_index(pipe, emp_id, employees.get(emp_id), employee)
+        versions = pipe.execute()
+        cache.patch(EMPLOYEE_RECORDS.key, versions[0], emp_id, employee)
+        _cache_legacy(EMPLOYEE_RECORDS, legacy_value, versions)
+        return True
+    except (redis.RedisError, TypeError, ValueError) as e:
+        cache.invalidate(EMPLOYEE_RECORDS.key)
+        logger.error(f"Error saving employee {emp_id}: {e}")
+        return False
 
-        # Проверяем, работает ли сотрудник в эту дату
-        if date_str in work_dates:
-            working_employees.append({
-                "name": name,
-                "slack_id": slack_id,
-                "employee_id": emp_id
-            })
+def get_employees_by_id(emp_ids: List[str]) -> Dict[str, Employee]:
+    #Только нужные сотрудники (HMGET), без чтения всего состава
+    try:
+        return EMPLOYEE_RECORDS.get(emp_ids) if emp_ids else {}
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error loading employees {emp_ids}: {e}")
+        return {}
 
-    return working_employees
+def get_shift_index() -> ShiftIndex:
+    #Индекс смен для текущей версии employees (один на версию, дни в нём считаются по запросу)
+    try:
+        return EMPLOYEE_RECORDS.derive("shift_index", build_shift_index)
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error building shift index: {e}")
+        return ShiftIndex({})
+
+def get_shift_member_ids(date_str: str, period: str) -> List[str]:
+    #id сотрудников смены ("dd/mm" этого года или "YYYY-MM-DD") одним SMEMBERS из индекса в Redis
+    #(для процессов без кэша employees); другой год или индекс за прошлый год — по битовым картам
+    date = _shift_date(date_str)
+    if date is None:
+        return []
+    if date.year == datetime.date.today().year:
+        try:
+            pipe = r.pipeline(transaction=False)
+            pipe.get(tenant_key(Config.SHIFT_INDEX_YEAR))
+            pipe.smembers(_shift_index_key(date.strftime('%d/%m'), period))
+            year, members = pipe.execute()
+            if int(year or 0) == date.year:
+                return sorted(member.decode() for member in members)
+        except redis.RedisError as e:
+            logger.error(f"Error loading shift {date_str} {period}: {e}")
+            return []
+    return sorted(employee.id for employee in get_shift_index().members(date, period))
+
+def count_shifts(emp_id: str, period: str, start: datetime.date, end: datetime.date) -> int:
+    #Сколько смен у сотрудника с start по end включительно (например, за месяц) — popcount по битовой карте
+    employee = get_employees_by_id([emp_id]).get(emp_id)
+    return employee.calendar.count(period, start, end) if employee else 0
+
+def get_employees_for_date_and_period(date_str: str, period: str,
+                                      snapshot: Optional[RenderSnapshot] = None) -> List[Employee]:
+    #Получить сотрудников, работающих в указанную дату и период
+    index = snapshot.shift_index if snapshot else get_shift_index()
+    return list(index.get((date_str, period), []))
 
-def format_employees_mention(employees: List[Dict[str, str]]) -> str:
-    #Форматировать упоминания сотрудников для Slack
+def format_employees_mention(employees: List[Employee]) -> str:
+    #Форматировать упоминания сотрудников для Slack (без slack_id — по имени)
     if not employees:
         return ""
 
-    mentions = []
-    for emp in employees:
-        slack_id = emp.get("slack_id", "")
-        if slack_id:
-            mentions.append(f"<@{slack_id}>")
-        else:
-            # Если нет slack_id, используем имя
-            mentions.append(emp.get("name", "Unknown"))
-
-    return "[" + " + ".join(mentions) + "]"
+    return "[" + " + ".join(employee.mention() for employee in employees) + "]"
 
-def load_task_assignments() -> Dict[str, str]:
-    #Загрузить назначения пользователей на задачи из employees
+def load_task_assignments() -> Dict[str, Assignment]:
+    #Загрузить назначения пользователей на задачи (НАЗВАНИЕ -> slack_id)
     try:
-        employees_data = load_employees()
-        # Назначения хранятся в специальном разделе employees
-        return employees_data.get("task_assignments", {})
-    except Exception as e:
+        assignments, _ = ASSIGNMENT_RECORDS.load()
+        return assignments or {}
+    except (redis.RedisError, codec.CodecError) as e:
         logger.error(f"Error loading task assignments: {e}")
         return {}
 
-def save_task_assignments(assignments: Dict[str, str]) -> bool:
-    #Сохранить назначения пользователей на задачи в employees
+def save_task_assignments(assignments: Dict[str, Any]) -> bool:
+    #Сохранить все назначения пользователей на задачи (Assignment или slack id)
     try:
-        employees_data = load_employees()
-        # Сохраняем назначения в специальном разделе
-        employees_data["task_assignments"] = assignments
-        return save_employees(employees_data)
-    except Exception as e:
+        assignments = models.coerce(Assignment, assignments)
+        pipe = r.pipeline()
+        legacy_value = _queue_collection_write(pipe, ASSIGNMENT_RECORDS, assignments,
+                                               legacy=lambda: _legacy_employees(load_employees(), assignments))
+        versions = pipe.execute()
+        cache.put(ASSIGNMENT_RECORDS.key, assignments, versions[0])
+        _cache_legacy(ASSIGNMENT_RECORDS, legacy_value, versions)
+        return True
+    except (redis.RedisError, TypeError, ValueError) as e:
+        cache.invalidate(ASSIGNMENT_RECORDS.key)
         logger.error(f"Error saving task assignments: {e}")
         return False
 
 def set_task_assignment(task_name: str, user_id: str = None) -> bool:
-    #Назначить или снять пользователя с задачи
-    assignments = load_task_assignments()
+    #Назначить или снять пользователя с задачи (одно поле хэша назначений)
+    try:
+        current, key = ASSIGNMENT_RECORDS.load()
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error saving task assignments: {e}")
+        return False
+
+    assignments = dict(current or {})
+    apply_task_assignment(assignments, task_name, user_id)
+    field = task_name.upper()
+    assignment = assignments.get(field)
+    if key != ASSIGNMENT_RECORDS.key:
+        # Назначения ещё в старом формате — записываем их целиком
+        saved = save_task_assignments(assignments)
+        if saved:
+            _patch_plan_assignee(field, assignment.slack_id if assignment else None)
+        return saved
+
+    try:
+        pipe = r.pipeline()
+        legacy_value = _queue_record_write(pipe, ASSIGNMENT_RECORDS, field, assignment,
+                                           legacy=lambda: _legacy_employees(load_employees(), assignments))
+        versions = pipe.execute()
+        cache.patch(ASSIGNMENT_RECORDS.key, versions[0], field, assignment)
+        _cache_legacy(ASSIGNMENT_RECORDS, legacy_value, versions)
+    except redis.RedisError as e:
+        cache.invalidate(ASSIGNMENT_RECORDS.key)
+        logger.error(f"Error saving task assignments: {e}")
+        return False
+    _patch_plan_assignee(field, assignment.slack_id if assignment else None)
+    return True
 
+def apply_task_assignment(assignments: Dict[str, Assignment], task_name: str, user_id: str = None) -> None:
     # Нормализуем название задачи (приводим к верхнему регистру)
     task_key = task_name.upper()
 
     if user_id:
         # Назначаем пользователя
-        assignments[task_key] = user_id
+        assignments[task_key] = Assignment(task_key, user_id)
         logger.info(f"User {user_id} assigned to task {task_name}")
     else:
         # Снимаем назначение
@@ -419,43 +1381,40 @@ def set_task_assignment(task_name: str, user_id: str = None) -> bool:
             del assignments[task_key]
             logger.info(f"Assignment removed from task {task_name}")
 
-    return save_task_assignments(assignments)
-
 def get_task_assignment(task_name: str) -> str:
-    #Получить назначенного пользователя для задачи
-    assignments = load_task_assignments()
+    #Получить назначенного пользователя для задачи (одно поле, HGET)
     task_key = task_name.upper()
-    return assignments.get(task_key, "")
+    try:
+        assignment = ASSIGNMENT_RECORDS.get([task_key]).get(task_key)
+        return assignment.slack_id if assignment else ""
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error loading assignment of {task_name}: {e}")
+        return ""
 
 def find_task_by_pattern(pattern: str) -> str:
     #Найти задачу по паттерну (например, fin-duty)
-    task_base = load_task_base()
+    return match_task_pattern(load_task_base(), pattern)
 
+def match_task_pattern(task_base: Dict[str, Task], pattern: str) -> str:
     pattern_lower = pattern.lower()
-    for task_id, task_data in task_base.items():
-        task_name = task_data.get("name", "").lower()
-        if pattern_lower in task_name:
-            return task_data.get("name", "")
+    for task in task_base.values():
+        if pattern_lower in task.name.lower():
+            return task.name
 
     return ""
 
 def find_employee_by_username(username: str) -> str:
     #Найти slack_id сотрудника по username
-    employees = load_employees()
+    return match_employee_username(load_employees(), username)
 
+def match_employee_username(employees: Dict[str, Employee], username: str) -> str:
     # Убираем @ если есть
     clean_username = username.lstrip('@').strip()
 
-    for emp_id, emp_data in employees.items():
-        if emp_id == "task_assignments":
-            continue
-
-        emp_username = emp_data.get("username", "")
-
-        if emp_username == clean_username:
-            slack_id = emp_data.get("slack_id", "")
-            logger.info(f"Found employee {emp_data.get('name')} with slack_id {slack_id} for username {username}")
-            return slack_id
+    for employee in employees.values():
+        if employee.username == clean_username:
+            logger.info(f"Found employee {employee.name} with slack_id {employee.slack_id} for username {username}")
+            return employee.slack_id
 
     logger.warning(f"Employee not found for username: {username}")
     return ""
@@ -0,0 +1,432 @@
+import asyncio
+import datetime
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import redis
+
+import bot_logic
+import codec
+import metrics
+from completion_log import append_completions_async
+from config import Config
+from deadline_timeline import DeadlineTimeline
+import models
+from models import Assignment, DailyPlan, DayState, Employee, Task
+from redis_bot import (
+    VersionedCache, RenderSnapshot, RecordCollection, STALE_STATE_MESSAGE, ALREADY_MARKED_MESSAGE,
+    TASK_RECORDS, EMPLOYEE_RECORDS, ASSIGNMENT_RECORDS, SNAPSHOT_COLLECTIONS,
+    _state_key, _completed_key, _plan_key, _plan_day, _parse_plan, plan_timeline, _decode_completed, _start_thread_state,
+    _split_created, _outside_plan, _late_tasks, _write_shift_index,
+    _queue_collection_write, _queue_record_write, _legacy_employees,
+    build_task_matcher, match_task, match_tasks,
+    render_message, apply_task_assignment, match_task_pattern, match_employee_username
+)
+from redis_conn import ar
+from task_matcher import TaskMatcher
+from tenants import tenant_key
+
+# Async versions of the redis_bot functions used by main_bot_async.
+# Only the Redis I/O lives here; parsing, matching and rendering are the shared
+# helpers from redis_bot, so both bot modes behave the same.
+
+logger = logging.getLogger(__name__)
+
+class AsyncVersionedCache(VersionedCache):
+    #VersionedCache over redis.asyncio: same entries and versioning, awaited I/O.
+
+    async def get(self, key: str, hashed: bool = False, parse: Optional[Callable[[Any], Any]] = None) -> Any:
+        try:
+            entry = self._fresh(key, int(await ar.hget(Config.DATA_VERSIONS, key) or 0))
+            if entry:
+                return entry[2]
+
+            pipe = ar.pipeline()
+            if hashed:
+                pipe.hgetall(key)
+            else:
+                pipe.get(key)
+            pipe.hget(Config.DATA_VERSIONS, key)
+            data, version = await pipe.execute()
+        except redis.RedisError as e:
+            return self._stale(key, e)
+
+        return self._store(key, data, version, hashed, parse)
+
+    async def get_many(self, keys: List[str], extra: Optional[Callable[[Any], None]] = None,
+                       hashed=frozenset(), parsers: Optional[Dict[str, Callable[[Any], Any]]] = None
+                       ) -> Tuple[Dict[str, Any], List[Any]]:
+        pipe = ar.pipeline()
+        pipe.hmget(Config.DATA_VERSIONS, keys)
+        self._queue_reads(pipe, keys, hashed)
+        if extra:
+            extra(pipe)
+        versions, *results = await pipe.execute()
+        raw, extra_results = self._split_reads(keys, hashed, results)
+        return self._absorb(keys, versions, raw, hashed, parsers), extra_results
+
+    async def derive(self, key: str, name: str, build: Callable[[Any], Any], hashed: bool = False,
+                     parse: Optional[Callable[[Any], Any]] = None) -> Any:
+        await self.get(key, hashed, parse)
+        return self.derive_current(key, name, build)
+
+cache = AsyncVersionedCache(ttl=Config.CACHE_TTL_SECONDS)
+
+async def _save_blob(key: str, value: Any, extra: Optional[Callable[[Any], None]] = None, cached: Any = None) -> None:
+    try:
+        pipe = ar.pipeline()
+        pipe.set(key, codec.encode(value))
+        pipe.hincrby(Config.DATA_VERSIONS, key, 1)
+        if extra:
+            extra(pipe)
+        version = (await pipe.execute())[1]
+    except Exception:
+        cache.invalidate(key)
+        raise
+    cache.put(key, value if cached is None else cached, version)
+
+async def _load_records(collection: RecordCollection) -> Tuple[Optional[Dict[str, Any]], str]:
+    #Как RecordCollection.load: хэш записей, а пока коллекция не мигрирована — старый блоб
+    key = collection.key
+    records = await cache.get(key, hashed=True, parse=collection.parse)
+    if records is not None:
+        return records, key
+    blob_key = collection.blob_key
+    if await cache.get(blob_key) is None:
+        return None, blob_key
+    return cache.derive_current(blob_key, f"records:{collection.hash_name}",
+                                lambda blob: collection.parse(collection.from_blob(blob or {}))), blob_key
+
+async def _load_collection(collection: RecordCollection, what: str) -> Dict[str, Any]:
+    try:
+        return (await _load_records(collection))[0] or {}
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error loading {what}: {e}")
+        return {}
+
+async def _derive_records(collection: RecordCollection, name: str, build: Callable[[Dict[str, Any]], Any]) -> Any:
+    records, key = await _load_records(collection)
+    return cache.derive_current(key, name, lambda _: build(records or {}))
+
+@metrics.timed("redis_bot", op="load_state")
+async def load_state(debug_mode: bool = False) -> DayState:
+    try:
+        return await cache.get(_state_key(debug_mode), parse=DayState.from_record) or DayState()
+    except (redis.RedisError, codec.CodecError, models.ModelError) as e:
+        logger.error(f"Error loading state (debug_mode={debug_mode}): {e}")
+        return DayState()
+
+@metrics.timed("redis_bot", op="save_state")
+async def save_state(state: DayState, debug_mode: bool = False,
+                     extra: Optional[Callable[[Any], None]] = None) -> bool:
+    try:
+        await _save_blob(_state_key(debug_mode), state.to_record(), extra, cached=state)
+        return True
+    except (redis.RedisError, TypeError, ValueError) as e:
+        logger.error(f"Error saving state (debug_mode={debug_mode}): {e}")
+        return False
+
+@metrics.timed("redis_bot", op="load_task_base")
+async def load_task_base() -> Dict[str, Task]:
+    return await _load_collection(TASK_RECORDS, "task base")
+
+@metrics.timed("redis_bot", op="load_employees")
+async def load_employees() -> Dict[str, Employee]:
+    return await _load_collection(EMPLOYEE_RECORDS, "employees")
+
+async def load_task_assignments() -> Dict[str, Assignment]:
+    return await _load_collection(ASSIGNMENT_RECORDS, "task assignments")
+
+@metrics.timed("redis_bot", op="save_employees")
+async def save_employees(employees: Dict[str, Any]) -> bool:
+    try:
+        employees = dict(employees)
+        assignments = employees.pop("task_assignments", None)
+        employees = models.coerce(Employee, employees)
+        if assignments is not None:
+            assignments = models.coerce(Assignment, assignments)
+        if assignments is None and Config.WRITE_LEGACY_BLOBS:
+            assignments_for_blob = await load_task_assignments()
+        else:
+            assignments_for_blob = assignments
+        old_keys = await ar.smembers(tenant_key(Config.SHIFT_INDEX_KEYS))
+
+        pipe = ar.pipeline()
+        legacy_value = _queue_collection_write(pipe, EMPLOYEE_RECORDS, employees,
+                                               legacy=lambda: _legacy_employees(employees, assignments_for_blob))
+        if assignments is not None:
+            _queue_collection_write(pipe, ASSIGNMENT_RECORDS, assignments)
+        _write_shift_index(pipe, employees, old_keys)
+        versions = await pipe.execute()
+    except (redis.RedisError, TypeError, ValueError) as e:
+        cache.invalidate(EMPLOYEE_RECORDS.key)
+        logger.error(f"Error saving employees: {e}")
+        return False
+
+    cache.put(EMPLOYEE_RECORDS.key, employees, versions[0])
+    if legacy_value is not None:
+        cache.put(EMPLOYEE_RECORDS.blob_key, legacy_value, versions[1])
+    if assignments is not None:
+        cache.invalidate(ASSIGNMENT_RECORDS.key)
+    return True
+
+@metrics.timed("redis_bot", op="set_thread_ts")
+async def set_thread_ts(thread_ts, debug_mode=False):
+    today = bot_logic.now_local().date().isoformat()
+    state = _start_thread_state(await load_state(debug_mode), thread_ts, today)
+    completed_key = _completed_key(today, debug_mode)
+    await save_state(state, debug_mode, extra=lambda pipe: pipe.delete(completed_key))
+
+async def get_thread_ts(debug_mode=False):
+    return (await load_state(debug_mode)).thread_ts
+
+async def migrate_completed_state(debug_mode=False) -> int:
+    #Как redis_bot.migrate_completed_state: "completed" из старого формата состояния в хэш дня
+    state = await load_state(debug_mode)
+    legacy = state.completed
+    if legacy is None:
+        return 0
+
+    moved = 0
+    if legacy and state.date:
+        key = _completed_key(state.date, debug_mode)
+        pipe = ar.pipeline()
+        for task, info in legacy.items():
+            pipe.hsetnx(key, task, codec.encode(info))
+        pipe.expire(key, Config.COMPLETED_TTL_SECONDS)
+        moved = sum((await pipe.execute())[:-1])
+
+    await save_state(DayState(state.date, state.thread_ts, extra=state.extra), debug_mode)
+    logger.info(f"Migrated {moved} completed tasks to hash (debug_mode={debug_mode})")
+    return moved
+
+async def get_completed_tasks(debug_mode=False):
+    state = await load_state(debug_mode)
+    if not state.date:
+        return {}
+
+    completed = _decode_completed(await ar.hgetall(_completed_key(state.date, debug_mode)))
+    # Состояние в старом формате, которое ещё не мигрировали
+    for task, info in (state.completed or {}).items():
+        completed.setdefault(task, info)
+    return completed
+
+async def record_task(task, user, debug_mode=False):
+    late, already, msg = await record_tasks([task], user, debug_mode)
+    if msg:
+        return False, msg
+    if already:
+        return False, ALREADY_MARKED_MESSAGE
+    return True, None
+
+@metrics.timed("redis_bot", op="record_tasks")
+async def record_tasks(tasks: List[str], user: str, debug_mode: bool = False,
+                       now: Optional[datetime.datetime] = None) -> Tuple[Dict[str, bool], List[str], Optional[str]]:
+    #Как redis_bot.record_tasks; дедлайны читаются параллельно с записью отметок
+    # День и время отметки — по тем же часам (Config.TIMEZONE), что и проверка опоздания
+    now = now or bot_logic.now_local()
+    today = now.date().isoformat()
+    state = await load_state(debug_mode)
+
+    if state.date != today:
+        return {}, [], STALE_STATE_MESSAGE
+
+    if state.completed is not None:
+        await migrate_completed_state(debug_mode)
+
+    entry = codec.encode({"user": user, "time": now.strftime("%H:%M")})
+    key = _completed_key(today, debug_mode)
+    pipe = ar.pipeline()
+    for task in tasks:
+        pipe.hsetnx(key, task, entry)
+    pipe.expire(key, Config.COMPLETED_TTL_SECONDS)
+    created, late = await asyncio.gather(pipe.execute(), tasks_late(tasks, now, debug_mode))
+    fresh, already = _split_created(tasks, created[:-1])
+    late = {task: late[task] for task in fresh}
+
+    await append_completions_async(fresh, user, late, debug_mode, now)
+    return late, already, None
+
+async def _load_snapshot_records() -> List[Tuple[Dict[str, Any], str]]:
+    record_keys = [collection.key for collection in SNAPSHOT_COLLECTIONS]
+    values, _ = await cache.get_many(record_keys, hashed=set(record_keys),
+                                     parsers={collection.key: collection.parse for collection in SNAPSHOT_COLLECTIONS})
+    records = []
+    for collection in SNAPSHOT_COLLECTIONS:
+        if values[collection.key] is not None:
+            records.append((values[collection.key], collection.key))
+        else:
+            loaded, key = await _load_records(collection)
+            records.append((loaded or {}, key))
+    return records
+
+# Последний удачный снимок этого режима — отдаётся, пока Redis недоступен (как в redis_bot)
+_last_snapshots: Dict[Tuple[str, str], RenderSnapshot] = {}
+
+@metrics.timed("redis_bot", op="load_render_snapshot")
+async def load_render_snapshot(debug_mode: bool = False, day_override: Optional[str] = None,
+                               rebuild: bool = False) -> RenderSnapshot:
+    #Как redis_bot.load_render_snapshot: без Redis — последний удачный снимок, без него ошибка
+    state_key = _state_key(debug_mode)
+    plan_key = _plan_key(debug_mode)
+    today, day_name = _plan_day(day_override)
+    completed_key = _completed_key(today, debug_mode)
+
+    try:
+        values, (completed_raw,) = await cache.get_many(
+            [plan_key, state_key], parsers={plan_key: _parse_plan, state_key: DayState.from_record},
+            extra=lambda pipe: pipe.hgetall(completed_key)
+        )
+        plan = values[plan_key]
+        if rebuild or plan is None or not plan.matches(today, day_name):
+            plan = None
+            records = await _load_snapshot_records()
+        else:
+            records = [({}, "") for _ in SNAPSHOT_COLLECTIONS]
+    except (redis.RedisError, codec.CodecError, models.ModelError) as e:
+        logger.error(f"Error loading render snapshot (debug_mode={debug_mode}): {e}")
+        if (state_key, day_name) in _last_snapshots:
+            logger.warning("Serving last known good render snapshot")
+            return _last_snapshots[(state_key, day_name)]
+        raise
+
+    state = values[state_key] or DayState()
+    if state.date == today and state.completed is None:
+        completed = _decode_completed(completed_raw)
+    else:
+        # Состояние за другой день или в старом формате — редкий случай, читаем отдельно
+        completed = await get_completed_tasks(debug_mode)
+
+    (task_base, task_base_key), (employees, employees_key), (assignments, _) = records
+    snapshot = RenderSnapshot(task_base, employees, state, completed, source_cache=cache, assignments=assignments,
+                              task_base_key=task_base_key, employees_key=employees_key,
+                              plan=plan, plan_key=plan_key)
+    _last_snapshots[(state_key, day_name)] = snapshot
+    return snapshot
+
+async def save_daily_plan(plan: DailyPlan, debug_mode: bool = False) -> bool:
+    try:
+        await _save_blob(_plan_key(debug_mode), plan.to_record(), cached=plan)
+        return True
+    except (redis.RedisError, TypeError, ValueError) as e:
+        logger.error(f"Error saving daily plan (debug_mode={debug_mode}): {e}")
+        return False
+
+async def load_daily_plan(debug_mode: bool = False) -> Optional[DailyPlan]:
+    try:
+        plan = await cache.get(_plan_key(debug_mode), parse=_parse_plan)
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error loading daily plan (debug_mode={debug_mode}): {e}")
+        return None
+    return plan if plan is not None and plan.date == bot_logic.now_local().date().isoformat() else None
+
+@metrics.timed("redis_bot", op="materialize_daily_plan")
+async def materialize_daily_plan(day_override: Optional[str] = None, debug_mode: bool = False) -> RenderSnapshot:
+    _, day_name = _plan_day(day_override)
+    snapshot = await load_render_snapshot(debug_mode, day_override, rebuild=True)
+    plan = snapshot.day_plan(day_name)
+    if plan.tasks and await save_daily_plan(plan, debug_mode):
+        snapshot.plan = plan
+    return snapshot
+
+async def task_is_late(task_name: str, now: datetime.datetime, debug_mode: bool = False) -> bool:
+    return (await tasks_late([task_name], now, debug_mode))[task_name]
+
+async def tasks_late(task_names: List[str], now: datetime.datetime, debug_mode: bool = False) -> Dict[str, bool]:
+    if not task_names:
+        return {}
+    plan = await load_daily_plan(debug_mode)
+    plan_deadlines = plan_timeline(cache, _plan_key(debug_mode), plan) if plan is not None else None
+    task_deadlines = await get_task_timeline() if _outside_plan(task_names, plan_deadlines) else None
+    return _late_tasks(task_names, now, plan_deadlines, task_deadlines)
+
+async def _patch_plan_assignee(task_key: str, slack_id: Optional[str]) -> None:
+    for debug_mode in (False, True):
+        plan = await load_daily_plan(debug_mode)
+        if plan is not None and any(task.key == task_key for task in plan.tasks):
+            await save_daily_plan(plan.with_assignee(task_key, slack_id), debug_mode)
+
+async def generate_message_from_redis(day_override=None, debug_mode=False, live=False, materialize=False):
+    if materialize:
+        snapshot = await materialize_daily_plan(day_override, debug_mode)
+    else:
+        snapshot = await load_render_snapshot(debug_mode, day_override)
+    return render_message(snapshot, day_override, debug_mode, live)
+
+async def get_task_timeline() -> DeadlineTimeline:
+    try:
+        return await _derive_records(TASK_RECORDS, "timeline", lambda task_base: DeadlineTimeline(task_base.values()))
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error loading task deadlines: {e}")
+        return DeadlineTimeline([])
+
+async def get_task_deadlines():
+    return (await get_task_timeline()).deadlines
+
+async def get_task_matcher() -> TaskMatcher:
+    try:
+        return await _derive_records(TASK_RECORDS, "task_matcher", build_task_matcher)
+    except (redis.RedisError, codec.CodecError) as e:
+        logger.error(f"Error building task matcher: {e}")
+        return TaskMatcher([])
+
+async def find_task_in_text(text):
+    return match_task(await get_task_matcher(), text)
+
+async def find_tasks_in_text(text) -> List[str]:
+    return match_tasks(await get_task_matcher(), text)
+
+async def save_task_assignments(assignments: Dict[str, Any]) -> bool:
+    #Как redis_bot.save_task_assignments: все назначения одной записью коллекции
+    try:
+        assignments = models.coerce(Assignment, assignments)
+        employees = await load_employees() if Config.WRITE_LEGACY_BLOBS else {}
+        pipe = ar.pipeline()
+        legacy_value = _queue_collection_write(pipe, ASSIGNMENT_RECORDS, assignments,
+                                               legacy=lambda: _legacy_employees(employees, assignments))
+        versions = await pipe.execute()
+    except (redis.RedisError, TypeError, ValueError) as e:
+        cache.invalidate(ASSIGNMENT_RECORDS.key)
+        logger.error(f"Error saving task assignments: {e}")
+        return False
+
+    cache.put(ASSIGNMENT_RECORDS.key, assignments, versions[0])
+    if legacy_value is not None:
+        cache.put(ASSIGNMENT_RECORDS.blob_key, legacy_value, versions[1])
+    return True
+
+async def set_task_assignment(task_name: str, user_id: str = None) -> bool:
+    #Одно поле хэша назначений; до миграции коллекция переписывается целиком
+    try:
+        current, key = await _load_records(ASSIGNMENT_RECORDS)
+        assignments = dict(current or {})
+        apply_task_assignment(assignments, task_name, user_id)
+        field = task_name.upper()
+        assignment = assignments.get(field)
+        if key != ASSIGNMENT_RECORDS.key:
+            saved = await save_task_assignments(assignments)
+            if saved:
+                await _patch_plan_assignee(field, assignment.slack_id if assignment else None)
+            return saved
+
+        employees = await load_employees() if Config.WRITE_LEGACY_BLOBS else {}
+        pipe = ar.pipeline()
+        legacy_value = _queue_record_write(pipe, ASSIGNMENT_RECORDS, field, assignment,
+                                           legacy=lambda: _legacy_employees(employees, assignments))
+        versions = await pipe.execute()
+    except (redis.RedisError, codec.CodecError) as e:
+        cache.invalidate(ASSIGNMENT_RECORDS.key)
+        logger.error(f"Error saving task assignments: {e}")
+        return False
+
+    cache.patch(ASSIGNMENT_RECORDS.key, versions[0], field, assignment)
+    if legacy_value is not None:
+        cache.put(ASSIGNMENT_RECORDS.blob_key, legacy_value, versions[1])
+    await _patch_plan_assignee(field, assignment.slack_id if assignment else None)
+    return True
+
+async def find_task_by_pattern(pattern: str) -> str:
+    return match_task_pattern(await load_task_base(), pattern)
+
+async def find_employee_by_username(username: str) -> str:
+    return match_employee_username(await load_employees(), username)
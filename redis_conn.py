@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import redis
+import redis.asyncio
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.backoff import EqualJitterBackoff
+from redis.retry import Retry
+
+from config import Config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+class CircuitOpenError(redis.ConnectionError):
+    #Redis is considered down; the call was not attempted.
+    pass
+
+class CircuitBreaker:
+    #Stops hammering Redis after repeated transient failures.
+    #closed -> (failure_threshold failures in a row) -> open -> (reset_timeout) -> half-open:
+    #one trial call is let through (other callers are rejected until it finishes);
+    #success closes the circuit, failure opens it again.
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout and not self._trial_in_flight:
+            return "half-open"
+        return "open"
+
+    def _admit(self) -> bool:
+        #Raises CircuitOpenError if the call may not go through; True if it is the half-open trial.
+        #Only one caller gets the trial, the others are rejected as if the circuit were open
+        with self._lock:
+            state = self.state
+            if state == "open":
+                raise CircuitOpenError("Redis circuit is open, skipping call")
+            if state == "half-open":
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        trial = self._admit()
+        try:
+            result = func(*args, **kwargs)
+        except TRANSIENT_ERRORS:
+            self._record_failure()
+            raise
+        except BaseException:
+            # Redis ответил (или вызов отменён) — следующий вызов снова будет пробным
+            if trial:
+                self._trial_in_flight = False
+            raise
+
+        if self.failures or self.opened_at is not None:
+            self.reset()
+        return result
+
+    async def call_async(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        #То же, что call, для корутин redis.asyncio
+        trial = self._admit()
+        try:
+            result = await func(*args, **kwargs)
+        except TRANSIENT_ERRORS:
+            self._record_failure()
+            raise
+        except BaseException:
+            # Redis ответил (или вызов отменён) — следующий вызов снова будет пробным
+            if trial:
+                self._trial_in_flight = False
+            raise
+
+        if self.failures or self.opened_at is not None:
+            self.reset()
+        return result
+
+    def _record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.error(f"Redis circuit opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def reset(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Redis circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+def _call(breaker: "CircuitBreaker", command: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    if not metrics.ENABLED:
+        return breaker.call(func, *args, **kwargs)
+    try:
+        result = breaker.call(func, *args, **kwargs)
+    except redis.RedisError:
+        metrics.count_redis_call(command, failed=True)
+        raise
+    metrics.count_redis_call(command)
+    return result
+
+async def _call_async(breaker: "CircuitBreaker", command: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    if not metrics.ENABLED:
+        return await breaker.call_async(func, *args, **kwargs)
+    try:
+        result = await breaker.call_async(func, *args, **kwargs)
+    except redis.RedisError:
+        metrics.count_redis_call(command, failed=True)
+        raise
+    metrics.count_redis_call(command)
+    return result
+
+class _BreakerPipeline:
+    #Pipeline wrapper: execute() goes through the breaker, everything else is passed through.
+
+    def __init__(self, pipeline, breaker: CircuitBreaker):
+        self._pipeline = pipeline
+        self._breaker = breaker
+
+    def execute(self, *args, **kwargs):
+        return _call(self._breaker, "pipeline", self._pipeline.execute, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._pipeline.reset()
+
+class RedisProxy:
+    #Module-level stand-in for the Redis client.
+    #The real client (and its pool) is created on first use, not at import, and every
+    #command goes through the circuit breaker. Retries with jittered backoff happen
+    #inside redis-py (see create_client), before the breaker sees an error.
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = create_client()
+        return self._client
+
+    def set_client(self, client) -> None:
+        #Подменить клиент (локальный Redis, fakeredis, клиент с инъекцией сбоев)
+        self._client = client
+        self.breaker.reset()
+
+    def pipeline(self, *args, **kwargs):
+        return _BreakerPipeline(self.get_client().pipeline(*args, **kwargs), self.breaker)
+
+    def __getattr__(self, name):
+        attr = getattr(self.get_client(), name)
+        if not callable(attr):
+            return attr
+        return lambda *args, **kwargs: _call(self.breaker, name, attr, *args, **kwargs)
+
+class _AsyncBreakerPipeline(_BreakerPipeline):
+
+    async def execute(self, *args, **kwargs):
+        return await _call_async(self._breaker, "pipeline", self._pipeline.execute, *args, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._pipeline.reset()
+
+class AsyncRedisProxy(RedisProxy):
+    #RedisProxy for redis.asyncio: commands are awaited through the same breaker.
+
+    def get_client(self):
+        if self._client is None:
+            self._client = create_async_client()
+        return self._client
+
+    def pipeline(self, *args, **kwargs):
+        return _AsyncBreakerPipeline(self.get_client().pipeline(*args, **kwargs), self.breaker)
+
+    def __getattr__(self, name):
+        attr = getattr(self.get_client(), name)
+        if not callable(attr):
+            return attr
+        return lambda *args, **kwargs: _call_async(self.breaker, name, attr, *args, **kwargs)
+
+def _pool_kwargs(retry_cls) -> dict:
+    return dict(
+        max_connections=Config.REDIS_POOL_SIZE,
+        socket_timeout=Config.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=Config.REDIS_CONNECT_TIMEOUT,
+        health_check_interval=Config.REDIS_HEALTH_CHECK_INTERVAL,
+        retry_on_error=list(TRANSIENT_ERRORS),
+        retry=retry_cls(
+            EqualJitterBackoff(cap=Config.REDIS_RETRY_BACKOFF_CAP, base=Config.REDIS_RETRY_BACKOFF_BASE),
+            Config.REDIS_RETRY_ATTEMPTS
+        ),
+    )
+
+def create_client() -> redis.Redis:
+    #Создать клиент с явным пулом соединений и повторами на временных ошибках
+    pool = redis.ConnectionPool.from_url(Config.REDIS_URL, **_pool_kwargs(Retry))
+    logger.info(f"Created Redis connection pool (max_connections={Config.REDIS_POOL_SIZE})")
+    return redis.Redis(connection_pool=pool)
+
+def create_async_client() -> redis.asyncio.Redis:
+    #Асинхронный клиент с теми же настройками пула (для main_bot_async)
+    pool = redis.asyncio.ConnectionPool.from_url(Config.REDIS_URL, **_pool_kwargs(AsyncRetry))
+    logger.info(f"Created async Redis connection pool (max_connections={Config.REDIS_POOL_SIZE})")
+    return redis.asyncio.Redis(connection_pool=pool)
+
+breaker = CircuitBreaker(
+    failure_threshold=Config.REDIS_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=Config.REDIS_CIRCUIT_RESET_SECONDS
+)
+r = RedisProxy(breaker)
+# Асинхронный клиент создаётся только при первом обращении (в async-режиме бота)
+ar = AsyncRedisProxy(breaker)
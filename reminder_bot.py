@@ -1,75 +1,38 @@
 import os
 import datetime
+import functools
+import sys
 import pytz
-from slack_sdk import WebClient
-from redis_bot import get_tasks_for_day, get_completed_tasks, get_thread_ts, group_tasks_by_period
+from config import Config
+import leader
+import models
+from outbox import create_slack_client, send
+from redis_bot import group_tasks_by_period, load_render_snapshot
+from tenants import current_tenant, parse_times, tenants_for_shard, use_tenant
 
-client = WebClient(token=os.environ.get("SLACK_BOT_TOKEN"))
-CHANNEL_ID = os.environ.get("SLACK_CHANNEL_ID")
+client = create_slack_client(os.environ.get("SLACK_BOT_TOKEN"))
 
-# Захардкоженная команда для тегинга
-TEAM_MENTION = "<!subteam^S07BD1P55GT|@sup>"
-
-def get_incomplete_tasks():
-    #Получить невыполненные задачи с учетом времени напоминания
+def get_incomplete_tasks(snapshot=None):
+    #Получить невыполненные и просроченные задачи на текущий момент
     riga = pytz.timezone("Europe/Riga")
     today = datetime.datetime.now(riga)
-    day_name = today.strftime('%A')
-    current_hour = today.hour
-
-    # Получаем все задачи на сегодня
-    all_tasks = get_tasks_for_day(day_name)
-
-    # Получаем выполненные задачи из slack_routine_state
-    completed_tasks = get_completed_tasks(debug_mode=False)
-    completed_names = [name.upper() for name in completed_tasks.keys()]
-
-    # Фильтруем невыполненные задачи
-    incomplete_tasks = []
-    overdue_tasks = []
-
-    for task in all_tasks:
-        task_name_upper = task.get("name", "").upper()
-
-        # Пропускаем выполненные задачи
-        if task_name_upper in completed_names:
-            continue
-
-        deadline_str = task.get("deadline", "")
-
-        # Если есть дедлайн, проверяем логику по времени
-        if deadline_str:
-            try:
-                hour, minute = map(int, deadline_str.split(":"))
-                deadline_hour = hour
+    day_name = models.WEEKDAYS[today.weekday()]
 
-                # В 13:00 не показываем задачи с дедлайном 16:00+
-                if current_hour == 13 and deadline_hour >= 16:
-                    continue
+    if snapshot is None:
+        snapshot = load_render_snapshot(debug_mode=False)
 
-                # Проверяем, просрочена ли задача
-                current_time = today.time()
-                deadline_time = datetime.time(hour=hour, minute=minute)
+    # Задачи дня, отсортированные по дедлайну (строятся один раз на версию task_base)
+    timeline = snapshot.day_timeline(day_name)
+    completed_names = {name.upper() for name in snapshot.completed}
 
-                if current_time > deadline_time:
-                    overdue_tasks.append(task)
-                else:
-                    incomplete_tasks.append(task)
-
-            except ValueError:
-                # Если не удалось распарсить время, добавляем в обычные
-                incomplete_tasks.append(task)
-        else:
-            # Задачи без дедлайна всегда показываем
-            incomplete_tasks.append(task)
-
-    return incomplete_tasks, overdue_tasks
+    # Просроченные — до текущего времени, предстоящие — в окне REMINDER_LOOKAHEAD_MINUTES для этого запуска
+    return timeline.split(today.time(), completed_names)
 
 def format_reminder_task_line(task, is_overdue=False):
     #Форматировать строку задачи для напоминания
-    name = task.get("name", "")
-    deadline = task.get("deadline", "")
-    period = task.get("period", "")
+    name = task.name
+    deadline = task.deadline_text
+    period = task.period
 
     # Эмодзи для группы
     period_emoji = ""
@@ -87,14 +50,14 @@ def format_reminder_task_line(task, is_overdue=False):
 
     return line
 
-def format_reminder_message():
+def format_reminder_message(snapshot=None):
     #Форматировать сообщение-напоминание
     riga = pytz.timezone("Europe/Riga")
     today = datetime.datetime.now(riga)
     current_time = today.strftime('%H:%M')
     date_str = today.strftime('%d %B (%A)')
 
-    incomplete_tasks, overdue_tasks = get_incomplete_tasks()
+    incomplete_tasks, overdue_tasks = get_incomplete_tasks(snapshot)
 
     # Если нет задач для напоминания
     if not incomplete_tasks and not overdue_tasks:
@@ -134,35 +97,47 @@ def format_reminder_message():
         for task in grouped_incomplete["evening"]:
             message_parts.append(format_reminder_task_line(task))
 
-    # Добавляем тег команды в конец
-    message_parts.append(f"\n{TEAM_MENTION}")
+    # Добавляем тег команды тенанта в конец
+    message_parts.append(f"\n{current_tenant().team_mention}")
 
     return "\n".join(message_parts)
 
-def send_reminder():
-    #Отправить напоминание в Slack
-    message = format_reminder_message()
+def send_reminder(tenant=None):
+    #Отправить напоминание в канал тенанта
+    tenant = tenant or current_tenant()
+    with use_tenant(tenant):
+        return _send_reminder(tenant)
+
+def _send_reminder(tenant):
+    # Задачи, выполненные задачи и thread_ts — одним запросом к Redis
+    try:
+        snapshot = load_render_snapshot(debug_mode=False)
+    except Exception as e:
+        print(f"❌ Не удалось загрузить данные из Redis: {e}")
+        return False
+
+    message = format_reminder_message(snapshot)
 
     if not message:
         print("ℹ️ Нет задач для напоминания")
         return False
 
     # Получаем thread_ts текущего дня
-    thread_ts = get_thread_ts(debug_mode=False)
+    thread_ts = snapshot.thread_ts
 
     try:
         if thread_ts:
             # Отправляем в тред с ежедневными задачами
-            response = client.chat_postMessage(
-                channel=CHANNEL_ID,
+            send(client, "chat_postMessage",
+                channel=tenant.channel_id,
                 text=message,
                 thread_ts=thread_ts
             )
             print(f"✅ Напоминание отправлено в тред")
         else:
             # Если нет активного треда, отправляем отдельным сообщением
-            response = client.chat_postMessage(
-                channel=CHANNEL_ID,
+            send(client, "chat_postMessage",
+                channel=tenant.channel_id,
                 text=message
             )
             print(f"✅ Напоминание отправлено отдельным сообщением")
@@ -174,11 +149,19 @@ def send_reminder():
         return False
 
 if __name__ == "__main__":
-    # Проверяем рабочий день
+    # Разовый запуск (cron); постоянно работающий вариант — scheduler_bot.py.
+    # Cron может стоять на нескольких хостах: запуск по расписанию выполняет один из них.
+    # Вне расписания — только с --force (ручной запуск на одном хосте)
+    force = "--force" in sys.argv[1:]
     today = datetime.datetime.now()
-    if today.weekday() < 5:  # только рабочие дни
+    if today.weekday() in Config.WORK_DAYS:  # только рабочие дни
         current_time = today.strftime('%H:%M')
         print(f"⏰ Запуск напоминалки в {current_time}")
-        send_reminder()
+        for tenant in tenants_for_shard():
+            fire = leader.cron_fire(parse_times(tenant.reminder_times), force=force)
+            if fire is None:
+                print(f"⏭️ Сейчас не время напоминания ({tenant.id}), запуск вручную — с --force")
+            elif not leader.run_once(tenant.job_name("reminder"), fire, functools.partial(send_reminder, tenant)):
+                print(f"⏭️ Напоминание за {fire.strftime('%H:%M')} уже отправляет другой хост ({tenant.id})")
     else:
         print("Сегодня выходной, напоминания не отправляются")
@@ -0,0 +1,228 @@
+import datetime
+import functools
+import signal
+import sys
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import pytz
+import redis
+
+from config import Config
+import leader
+import metrics
+from outbox import start_worker_thread
+from redis_conn import r
+from tenants import Tenant, parse_times, tenants_for_shard
+import cron_bot
+import reminder_bot
+
+# Long-running replacement for the cron entries of cron_bot.py and reminder_bot.py.
+# One process keeps the Slack WebClient and the Redis pool warm and fires the jobs
+# from the job table below at their times in Config.TIMEZONE.
+# Each tenant gets its own jobs; with SCHEDULER_SHARD_COUNT > 1 every process
+# only runs the tenants of its shard (SCHEDULER_SHARD_INDEX).
+# The same shard can run on several hosts: with LEADER_ELECTION only the holder of
+# the shard's lease runs jobs, and every run is claimed once per scheduled time
+# (leader.py), so a standby takes over within LEADER_LEASE_MS without double posts.
+
+logger = Config.setup_logging()
+
+class Job:
+    #Одна запись таблицы расписания: что запускать, во сколько и по каким дням недели
+
+    def __init__(self, name: str, func: Callable[[], object], times: List[datetime.time],
+                 days: FrozenSet[int] = frozenset(Config.WORK_DAYS)):
+        self.name = name
+        self.func = func
+        self.times = sorted(times)
+        self.days = days
+
+    def next_fire(self, after: datetime.datetime) -> Optional[datetime.datetime]:
+        #Ближайший запуск строго после after (after — aware datetime)
+        after = after.astimezone(pytz.timezone(Config.TIMEZONE))
+        for offset in range(8):
+            date = after.date() + datetime.timedelta(days=offset)
+            if date.weekday() not in self.days:
+                continue
+            for fire_time in self.times:
+                fire = _localize(date, fire_time)
+                if fire > after:
+                    return fire
+        return None
+
+    def previous_fire(self, before: datetime.datetime) -> Optional[datetime.datetime]:
+        #Последний запуск по расписанию не позже before
+        before = before.astimezone(pytz.timezone(Config.TIMEZONE))
+        for offset in range(8):
+            date = before.date() - datetime.timedelta(days=offset)
+            if date.weekday() not in self.days:
+                continue
+            for fire_time in reversed(self.times):
+                fire = _localize(date, fire_time)
+                if fire <= before:
+                    return fire
+        return None
+
+def _localize(date: datetime.date, fire_time: datetime.time) -> datetime.datetime:
+    return pytz.timezone(Config.TIMEZONE).localize(datetime.datetime.combine(date, fire_time))
+
+def tenant_jobs(tenant: Tenant) -> List[Job]:
+    return [
+        Job(tenant.job_name("morning_post"), functools.partial(cron_bot.post_morning_message, tenant),
+            parse_times(tenant.morning_post_times)),
+        Job(tenant.job_name("reminder"), functools.partial(reminder_bot.send_reminder, tenant),
+            parse_times(tenant.reminder_times)),
+    ]
+
+def default_jobs() -> List[Job]:
+    #Задачи всех тенантов шарда этого процесса
+    tenants = tenants_for_shard()
+    logger.info(f"Shard {Config.SCHEDULER_SHARD_INDEX}/{Config.SCHEDULER_SHARD_COUNT}: "
+                f"{', '.join(tenant.id for tenant in tenants) or 'no tenants'}")
+    return [job for tenant in tenants for job in tenant_jobs(tenant)]
+
+class Scheduler:
+
+    def __init__(self, jobs: List[Job], elector: Optional[leader.LeaderElector] = None):
+        self.jobs = jobs
+        self.elector = elector
+        self.tz = pytz.timezone(Config.TIMEZONE)
+        self._stop = threading.Event()
+        # Запуски, занятые другим узлом, который ещё не закончил: если он упал, догоняем их
+        self._contested: Dict[str, Tuple[Job, datetime.datetime]] = {}
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now(self.tz)
+
+    def stop(self, *args) -> None:
+        logger.info("Scheduler stopping")
+        self._stop.set()
+
+    def next_fires(self) -> List[tuple]:
+        #[(время запуска, задача)] по возрастанию времени
+        now = self.now()
+        fires = [(job.next_fire(now), job) for job in self.jobs]
+        return sorted(((fire, job) for fire, job in fires if fire), key=lambda item: item[0])
+
+    def report(self) -> None:
+        for fire, job in self.next_fires():
+            logger.info(f"Next {job.name}: {fire.strftime('%Y-%m-%d %H:%M %Z')}")
+
+    def _last_run(self, job: Job) -> float:
+        try:
+            return float(r.hget(Config.SCHEDULER_LAST_RUN, job.name) or 0)
+        except redis.RedisError as e:
+            logger.error(f"Error loading last run of {job.name}: {e}")
+            return 0.0
+
+    def run_job(self, job: Job, fire: datetime.datetime) -> None:
+        #Запуск job за время расписания fire — только на лидере и только если его не занял другой узел
+        if self.elector is not None and not self.elector.is_leader:
+            logger.info(f"Not the leader, skipping {job.name} at {fire.strftime('%H:%M')}")
+            return
+        if not leader.claim_run(job.name, fire):
+            logger.info(f"{job.name} at {fire.strftime('%H:%M')} is claimed by another node")
+            if leader.run_in_progress(job.name, fire):
+                self._contested[job.name] = (job, fire)
+            return
+        self._contested.pop(job.name, None)
+
+        logger.info(f"Running {job.name}")
+        started = time.monotonic()
+        try:
+            metrics.timed("scheduled_job", job=job.name)(job.func)()
+        except Exception as e:
+            logger.error(f"Job {job.name} failed: {e}")
+        logger.info(f"{job.name} finished in {time.monotonic() - started:.2f}s")
+        leader.finish_run(job.name, fire)
+
+        try:
+            r.hset(Config.SCHEDULER_LAST_RUN, job.name, time.time())
+        except redis.RedisError as e:
+            logger.error(f"Error saving last run of {job.name}: {e}")
+
+    def catch_up(self) -> None:
+        #Выполнить запуски, пропущенные не более чем на SCHEDULER_CATCHUP_SECONDS
+        now = self.now()
+        for job in self.jobs:
+            missed = job.previous_fire(now)
+            if not missed or self._last_run(job) >= missed.timestamp():
+                continue
+            late_by = (now - missed).total_seconds()
+            if late_by <= Config.SCHEDULER_CATCHUP_SECONDS:
+                logger.warning(f"Catching up {job.name} missed at {missed.strftime('%H:%M')} ({late_by:.0f}s late)")
+                self.run_job(job, missed)
+
+    def retry_contested(self) -> None:
+        #Запуски, которые занял другой узел: если он упал посреди запуска, ключ истекает
+        #через JOB_RUN_TIMEOUT_SECONDS, и запуск выполняет текущий лидер
+        now = self.now()
+        for name, (job, fire) in list(self._contested.items()):
+            if (now - fire).total_seconds() > Config.SCHEDULER_CATCHUP_SECONDS:
+                self._contested.pop(name, None)
+            elif not leader.run_in_progress(job.name, fire):
+                self._contested.pop(name, None)
+                self.run_job(job, fire)
+
+    def run_forever(self) -> None:
+        if self.elector is not None:
+            self.elector.start()
+            self.elector.elected.clear()
+        try:
+            self._run()
+        finally:
+            if self.elector is not None:
+                self.elector.stop()
+
+    def _run(self) -> None:
+        self.catch_up()
+        reported = None
+        while not self._stop.is_set():
+            fires = self.next_fires()
+            if not fires:
+                logger.error("No jobs scheduled, exiting")
+                return
+            fire, _ = fires[0]
+            if fire != reported:
+                self.report()
+                reported = fire
+
+            wait = (fire - self.now()).total_seconds()
+            if self.elector is not None:
+                # Резервный узел просыпается и между запусками: став лидером, он сразу
+                # догоняет то, что пропустил упавший лидер
+                wait = min(wait, self.elector.interval)
+            if self._stop.wait(max(0.0, wait)):
+                return
+
+            if self.elector is not None and self.elector.is_leader:
+                if self.elector.elected.is_set():
+                    self.elector.elected.clear()
+                    self.catch_up()
+                self.retry_contested()
+
+            # Все задачи, чьё время уже наступило (несколько могут совпасть по времени)
+            now = self.now()
+            for due_fire, job in fires:
+                if due_fire <= now:
+                    self.run_job(job, due_fire)
+
+def main(argv: List[str]) -> None:
+    jobs = default_jobs()
+    if "--list" in argv:
+        for fire, job in Scheduler(jobs).next_fires():
+            print(f"{job.name:<24} {fire.strftime('%Y-%m-%d %H:%M %Z')}")
+        return
+
+    scheduler = Scheduler(jobs, leader.scheduler_elector())
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+    metrics.start_http_server()
+    # Напоминания уходят через очередь — доставляем её из этого же процесса
+    start_worker_thread(reminder_bot.client.token)
+    scheduler.run_forever()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,236 @@
+import base64
+import datetime
+import functools
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+# Shift calendars as bitmaps: one bit per calendar day, per period and per year.
+#
+# Days are numbered in a leap-year calendar (1 Jan = 0 ... 31 Dec = 365), so a
+# month/day has the same bit in every year and 29 Feb simply stays unset in other
+# years. A year is YEAR_BYTES packed bytes, most significant bit first - the bit
+# order of Redis SETBIT/GETBIT/BITCOUNT, so a packed year can be loaded into Redis
+# as is. In memory a year is a Python int: membership is one shift and mask,
+# "shifts this month" is a popcount of a bit range.
+#
+# Old "dd/mm" dates carry no year and meant "this date in any year"; they are kept
+# as such in the YEARLY bitmap. Rotation rules (2 on / 2 off from a start date)
+# are stored as rules and expanded to a year's bitmap only when that year is
+# queried as a range; single-day checks are plain arithmetic.
+
+YEARLY = 0  # bitmap of "dd/mm" dates without a year, valid in every year
+DAY_BITS = 366
+YEAR_BYTES = (DAY_BITS + 7) // 8
+_TOP = YEAR_BYTES * 8 - 1
+_LEAP = 2000
+_JAN_1 = datetime.date(_LEAP, 1, 1)
+
+def day_bit(month: int, day: int) -> int:
+    #Номер дня в високосном календаре (ValueError для несуществующей даты)
+    return (datetime.date(_LEAP, month, day) - _JAN_1).days
+
+def _mask(bit: int) -> int:
+    return 1 << (_TOP - bit)
+
+@functools.lru_cache(maxsize=DAY_BITS)
+def day_mask(month: int, day: int) -> int:
+    #Маска дня в битовой карте года (одна на день — проверка смены сотни раз за день)
+    return _mask(day_bit(month, day))
+
+def _range_count(bits: int, first: int, last: int) -> int:
+    #Сколько бит установлено в днях first..last включительно
+    width = last - first + 1
+    return ((bits >> (_TOP - last)) & ((1 << width) - 1)).bit_count()
+
+def _set_bits(bits: int) -> Iterable[int]:
+    #Номера установленных дней по возрастанию (только единичные биты, без обхода всего года)
+    while bits:
+        top = bits.bit_length() - 1
+        yield _TOP - top
+        bits ^= 1 << top
+
+def parse_day(value: Any) -> Tuple[int, int]:
+    #"dd/mm" -> (YEARLY, бит), "YYYY-MM-DD" -> (год, бит); иначе ValueError
+    if isinstance(value, str) and "/" in value:
+        day, _, month = value.partition("/")
+        if day.isdigit() and month.isdigit():
+            return YEARLY, day_bit(int(month), int(day))
+    elif isinstance(value, str):
+        date = datetime.date.fromisoformat(value)
+        return date.year, day_bit(date.month, date.day)
+    raise ValueError(f"bad date {value!r}, expected 'dd/mm' or 'YYYY-MM-DD'")
+
+_DAY_MONTH = [(_JAN_1 + datetime.timedelta(days=bit)).strftime("%d/%m") for bit in range(DAY_BITS)]
+
+def format_day(year: int, bit: int) -> str:
+    if year == YEARLY:
+        return _DAY_MONTH[bit]
+    day, _, month = _DAY_MONTH[bit].partition("/")
+    return f"{year:04d}-{month}-{day}"
+
+def _iso(value: Any, field: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"rotation {field} must be YYYY-MM-DD, got {value!r}")
+
+class Rotation:
+    #Повторяющийся график: on дней смены, off дней отдыха, начиная со start (до until включительно)
+    __slots__ = ("period", "start", "on", "off", "until")
+
+    def __init__(self, period: str, start: datetime.date, on: int, off: int,
+                 until: Optional[datetime.date] = None):
+        self.period = period
+        self.start = start
+        self.on = on
+        self.off = off
+        self.until = until
+
+    @classmethod
+    def from_record(cls, data: Any) -> "Rotation":
+        if not isinstance(data, Mapping):
+            raise ValueError(f"rotation must be an object, got {data!r}")
+        on, off = data.get("on"), data.get("off", 0)
+        if not isinstance(on, int) or not isinstance(off, int) or on < 1 or off < 0:
+            raise ValueError(f"rotation needs on >= 1 and off >= 0 days, got on={on!r} off={off!r}")
+        until = _iso(data["until"], "until") if data.get("until") else None
+        return cls(data.get("period"), _iso(data.get("start"), "start"), on, off, until)
+
+    def to_record(self) -> Dict[str, Any]:
+        record: Dict[str, Any] = {"period": self.period, "start": self.start.isoformat(),
+                                  "on": self.on, "off": self.off}
+        if self.until:
+            record["until"] = self.until.isoformat()
+        return record
+
+    def is_on(self, date: datetime.date) -> bool:
+        if date < self.start or (self.until and date > self.until):
+            return False
+        return (date - self.start).days % (self.on + self.off) < self.on
+
+    def year_bits(self, year: int) -> int:
+        #Битовая карта графика на год (разворачивается по дням — только по запросу диапазона)
+        bits = 0
+        first = max(datetime.date(year, 1, 1), self.start)
+        last = min(datetime.date(year, 12, 31), self.until or datetime.date(year, 12, 31))
+        cycle = self.on + self.off
+        date = first
+        while date <= last:
+            if (date - self.start).days % cycle < self.on:
+                bits |= day_mask(date.month, date.day)
+            date += datetime.timedelta(days=1)
+        return bits
+
+class ShiftCalendar:
+    #Смены одного сотрудника: (период, год) -> битовая карта дней, плюс графики-ротации.
+    #Объект не меняется после создания (он живёт в кэше); развёрнутые годы ротаций запоминаются
+    __slots__ = ("_bits", "rotations", "_expanded", "_legacy")
+
+    def __init__(self, bits: Optional[Dict[Tuple[str, int], int]] = None, rotations: Tuple[Rotation, ...] = ()):
+        self._bits = {key: value for key, value in (bits or {}).items() if value}
+        self.rotations = tuple(rotations)
+        # Заводятся при первом запросе: у большинства сотрудников не понадобятся
+        self._expanded: Optional[Dict[Tuple[str, int], int]] = None
+        self._legacy: Optional[Dict[Tuple[str, int], Tuple[str, ...]]] = None
+
+    @classmethod
+    def from_dates(cls, dates: Mapping[str, Iterable[str]], rotations: Iterable[Rotation] = ()) -> "ShiftCalendar":
+        #{период: ["dd/mm" или "YYYY-MM-DD", ...]}
+        bits: Dict[Tuple[str, int], int] = {}
+        for period, values in dates.items():
+            for value in values:
+                year, bit = parse_day(value)
+                bits[(period, year)] = bits.get((period, year), 0) | _mask(bit)
+        return cls(bits, tuple(rotations))
+
+    @classmethod
+    def from_packed(cls, packed: Mapping[str, Mapping[str, str]], rotations: Iterable[Rotation] = ()) -> "ShiftCalendar":
+        #{период: {"yearly" | "YYYY": base64 упакованного года}}
+        bits: Dict[Tuple[str, int], int] = {}
+        for period, years in packed.items():
+            if not isinstance(years, Mapping):
+                raise ValueError(f"shift bitmaps of {period!r} must be an object, got {years!r}")
+            for year, value in years.items():
+                raw = base64.b64decode(value, validate=True) if isinstance(value, str) else b""
+                if len(raw) != YEAR_BYTES or not (year == "yearly" or year.isdigit()):
+                    raise ValueError(f"bad shift bitmap {period}/{year}")
+                bits[(period, YEARLY if year == "yearly" else int(year))] = int.from_bytes(raw, "big")
+        return cls(bits, tuple(rotations))
+
+    def packed(self) -> Dict[str, Dict[str, str]]:
+        result: Dict[str, Dict[str, str]] = {}
+        for (period, year), bits in sorted(self._bits.items()):
+            name = "yearly" if year == YEARLY else str(year)
+            result.setdefault(period, {})[name] = base64.b64encode(bits.to_bytes(YEAR_BYTES, "big")).decode()
+        return result
+
+    def is_on(self, date: datetime.date, period: str) -> bool:
+        #На смене ли в этот день — O(1): два бита и арифметика ротаций
+        bit = day_mask(date.month, date.day)
+        if (self._bits.get((period, date.year), 0) | self._bits.get((period, YEARLY), 0)) & bit:
+            return True
+        return bool(self.rotations) and any(rotation.period == period and rotation.is_on(date)
+                                            for rotation in self.rotations)
+
+    def year_bits(self, period: str, year: int) -> int:
+        #Все смены периода за год одной картой (ротации разворачиваются один раз на год)
+        bits = self._bits.get((period, year), 0) | self._bits.get((period, YEARLY), 0)
+        if self.rotations:
+            key = (period, year)
+            if self._expanded is None:
+                self._expanded = {}
+            if key not in self._expanded:
+                expanded = 0
+                for rotation in self.rotations:
+                    if rotation.period == period:
+                        expanded |= rotation.year_bits(year)
+                self._expanded[key] = expanded
+            bits |= self._expanded[key]
+        return bits
+
+    def count(self, period: str, start: datetime.date, end: datetime.date) -> int:
+        #Сколько смен с start по end включительно (например, за месяц)
+        total = 0
+        for year in range(start.year, end.year + 1):
+            first = start if year == start.year else datetime.date(year, 1, 1)
+            last = end if year == end.year else datetime.date(year, 12, 31)
+            total += _range_count(self.year_bits(period, year), day_bit(first.month, first.day),
+                                  day_bit(last.month, last.day))
+        return total
+
+    def days(self, period: str, start: datetime.date, end: datetime.date) -> List[datetime.date]:
+        #Дни смен с start по end включительно
+        result = []
+        date = start
+        while date <= end:
+            bits = self.year_bits(period, date.year)
+            if bits & day_mask(date.month, date.day):
+                result.append(date)
+            date += datetime.timedelta(days=1)
+        return result
+
+    def dates(self, period: str) -> Tuple[str, ...]:
+        #Явно заданные даты периода ("dd/mm" без года, потом "YYYY-MM-DD" по годам), без ротаций
+        result = []
+        for year in sorted(year for key_period, year in self._bits if key_period == period):
+            bits = self._bits[(period, year)]
+            result.extend(format_day(year, bit) for bit in _set_bits(bits))
+        return tuple(result)
+
+    def legacy_dates(self, period: str, year: int) -> Tuple[str, ...]:
+        #Даты "dd/mm" на год для старого формата записи (старый код не знает годов и ротаций);
+        #пишутся при каждом сохранении блоба employees, поэтому запоминаются
+        key = (period, year)
+        if self._legacy is None:
+            self._legacy = {}
+        if key not in self._legacy:
+            self._legacy[key] = tuple(_DAY_MONTH[bit] for bit in _set_bits(self.year_bits(period, year)))
+        return self._legacy[key]
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ShiftCalendar):
+            return NotImplemented
+        return self._bits == other._bits and \
+            [rotation.to_record() for rotation in self.rotations] == [rotation.to_record() for rotation in other.rotations]
+
+    def __repr__(self) -> str:
+        return f"ShiftCalendar(years={sorted(set(year for _, year in self._bits))}, rotations={len(self.rotations)})"
@@ -0,0 +1,102 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DONE_MARKER = "done"
+
+class TaskMatcher:
+    #Aho-Corasick automaton over case-folded task names.
+    #Built once per task_base version; a lookup is linear in the message length
+    #and prefers the leftmost, then the longest name ("Проверка KYC-2" over "KYC").
+
+    def __init__(self, names: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Название задачи, которое заканчивается в этом состоянии, и его длина
+        self._name: List[Optional[Tuple[str, int]]] = [None]
+        # Ближайшее по fail-цепочке состояние, в котором заканчивается название
+        self._output_link: List[int] = [0]
+
+        for name in names:
+            self._insert(name)
+        self._build_links()
+
+    def _insert(self, name: str) -> None:
+        folded = name.casefold()
+        if not folded:
+            return
+
+        state = 0
+        for char in folded:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._name.append(None)
+                self._output_link.append(0)
+            state = next_state
+
+        # При совпадении после casefold оставляем первое название
+        if self._name[state] is None:
+            self._name[state] = (name, len(folded))
+
+    def _build_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                if fail == next_state:
+                    fail = 0
+
+                self._fail[next_state] = fail
+                self._output_link[next_state] = fail if self._name[fail] else self._output_link[fail]
+
+    def __len__(self) -> int:
+        return sum(1 for name in self._name if name)
+
+    def find_all(self, text: str) -> List[str]:
+        #Все названия задач, упомянутые до последнего "done", слева направо без пересечений
+        folded = text.casefold()
+        limit = folded.rfind(DONE_MARKER)
+        if limit < 0 or len(self._goto) == 1:
+            return []
+
+        goto, fail, names, output_link = self._goto, self._fail, self._name, self._output_link
+
+        # Для каждой позиции начала запоминаем самое длинное совпадение
+        longest: Dict[int, Tuple[int, str]] = {}
+        state = 0
+        for end, char in enumerate(folded[:limit], start=1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            match_state = state if names[state] else output_link[state]
+            while match_state:
+                name, length = names[match_state]
+                start = end - length
+                if start not in longest or longest[start][0] < length:
+                    longest[start] = (length, name)
+                match_state = output_link[match_state]
+
+        found = []
+        covered_until = 0
+        for start in sorted(longest):
+            if start >= covered_until:
+                length, name = longest[start]
+                found.append(name)
+                covered_until = start + length
+
+        return found
+
+    def find(self, text: str) -> Optional[str]:
+        #Первое (самое левое и самое длинное) упоминание задачи или None
+        found = self.find_all(text)
+        return found[0] if found else None
@@ -0,0 +1,130 @@
+import contextvars
+import datetime
+import json
+import logging
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from config import Config
+
+# Tenants: one per Slack channel / support team.
+# Each tenant has its own namespaced Redis keys, schedule and mention group.
+# Without TENANTS_FILE there is a single "default" tenant built from the env
+# variables, with an empty key prefix, i.e. the original global keys.
+#
+# TENANTS_FILE is a JSON list:
+#   [{"id": "sup", "channel_id": "C0123", "team_mention": "<!subteam^S1|@sup>",
+#     "morning_post_times": "09:00", "reminder_times": "13:00,17:00"}, ...]
+# "key_prefix" defaults to "<id>:"; set it to "" to keep an existing team on the global keys.
+
+logger = logging.getLogger(__name__)
+
+def parse_times(value: str) -> List[datetime.time]:
+    #"09:00,13:00" -> [time(9, 0), time(13, 0)]
+    times = []
+    for part in value.split(","):
+        if part.strip():
+            hour, minute = map(int, part.strip().split(":"))
+            times.append(datetime.time(hour=hour, minute=minute))
+    return sorted(times)
+
+class Tenant:
+
+    def __init__(self, tenant_id: str, channel_id: str, team_mention: str = Config.TEAM_MENTION,
+                 morning_post_times: str = Config.MORNING_POST_TIMES,
+                 reminder_times: str = Config.REMINDER_TIMES, key_prefix: Optional[str] = None):
+        self.id = tenant_id
+        self.channel_id = channel_id
+        self.team_mention = team_mention
+        self.morning_post_times = morning_post_times
+        self.reminder_times = reminder_times
+        self.key_prefix = f"{tenant_id}:" if key_prefix is None else key_prefix
+
+    def key(self, name: str) -> str:
+        return f"{self.key_prefix}{name}"
+
+    def job_name(self, name: str) -> str:
+        # У тенанта на глобальных ключах имена задач планировщика тоже прежние
+        return f"{self.id}:{name}" if self.key_prefix else name
+
+    def __repr__(self) -> str:
+        return f"Tenant({self.id!r}, channel={self.channel_id!r})"
+
+_tenants: Optional[List[Tenant]] = None
+_by_channel: Dict[str, Tenant] = {}
+_current: contextvars.ContextVar[Optional[Tenant]] = contextvars.ContextVar("tenant", default=None)
+
+def _tenant_from_dict(data: dict) -> Tenant:
+    if not data.get("id") or not data.get("channel_id"):
+        raise ValueError(f"Tenant needs 'id' and 'channel_id': {data}")
+    return Tenant(
+        data["id"],
+        data["channel_id"],
+        team_mention=data.get("team_mention", Config.TEAM_MENTION),
+        morning_post_times=data.get("morning_post_times", Config.MORNING_POST_TIMES),
+        reminder_times=data.get("reminder_times", Config.REMINDER_TIMES),
+        key_prefix=data.get("key_prefix"),
+    )
+
+def load_tenants() -> List[Tenant]:
+    #Список тенантов (читается один раз на процесс)
+    global _tenants
+    if _tenants is None:
+        if Config.TENANTS_FILE:
+            with open(Config.TENANTS_FILE) as f:
+                tenants = [_tenant_from_dict(item) for item in json.load(f)]
+            prefixes = [tenant.key_prefix for tenant in tenants]
+            if len(set(prefixes)) != len(prefixes):
+                raise ValueError("Tenants must have distinct key prefixes")
+        else:
+            tenants = [Tenant("default", Config.SLACK_CHANNEL_ID, key_prefix="")]
+
+        _by_channel.clear()
+        _by_channel.update((tenant.channel_id, tenant) for tenant in tenants)
+        _tenants = tenants
+        logger.info(f"Loaded {len(tenants)} tenant(s)")
+    return _tenants
+
+def set_tenants(tenants: List[Tenant]) -> None:
+    #Задать тенантов явно (для тестов и харнессов)
+    global _tenants
+    _tenants = list(tenants)
+    _by_channel.clear()
+    _by_channel.update((tenant.channel_id, tenant) for tenant in _tenants)
+
+def tenant_for_channel(channel_id: Optional[str]) -> Optional[Tenant]:
+    #Тенант канала; без TENANTS_FILE единственный тенант обслуживает любой канал
+    tenants = load_tenants()
+    if not Config.TENANTS_FILE and len(tenants) == 1:
+        return tenants[0]
+    return _by_channel.get(channel_id or "")
+
+def current_tenant() -> Tenant:
+    tenant = _current.get()
+    if tenant is None:
+        tenants = load_tenants()
+        if len(tenants) != 1:
+            raise RuntimeError("No tenant selected; wrap the call in use_tenant()")
+        return tenants[0]
+    return tenant
+
+@contextmanager
+def use_tenant(tenant: Tenant) -> Iterator[Tenant]:
+    #Выполнить блок в контексте тенанта: все ключи Redis берутся из его пространства имён
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+def tenant_key(name: str) -> str:
+    return current_tenant().key(name)
+
+def shard_of(tenant: Tenant, shard_count: int) -> int:
+    #Стабильный номер шарда (crc32, не зависит от PYTHONHASHSEED)
+    return zlib.crc32(tenant.id.encode()) % max(1, shard_count)
+
+def tenants_for_shard(shard_index: int = Config.SCHEDULER_SHARD_INDEX,
+                      shard_count: int = Config.SCHEDULER_SHARD_COUNT) -> List[Tenant]:
+    return [tenant for tenant in load_tenants() if shard_of(tenant, shard_count) == shard_index]